@@ -10,17 +10,20 @@ _DEFAULTS = {
     "password":   os.getenv("SQLPASSWORD", "Stik0123"),
     "driver":     os.getenv("ODBC_DRIVER", "ODBC Driver 17 for SQL Server"),
     "trust_cert": os.getenv("TRUST_CERT", "yes"),
+    # réplica local (SQLite) do extrato/consolidados para leitura; vazio = desligada
+    "replica":    os.getenv("COMISSAO_REPLICA", ""),
 }
 
 class DBConfig:
     def __init__(self, server=None, database=None, username=None, password=None,
-                 driver=None, trust_cert=None):
+                 driver=None, trust_cert=None, replica=None):
         self.server = server or _DEFAULTS["server"]
         self.database = database or _DEFAULTS["database"]
         self.username = username or _DEFAULTS["username"]
         self.password = password or _DEFAULTS["password"]
         self.driver = driver or _DEFAULTS["driver"]
         self.trust_cert = trust_cert or _DEFAULTS["trust_cert"]
+        self.replica = replica if replica is not None else _DEFAULTS["replica"]
 
     def connection_string(self) -> str:
         parts = [
@@ -1,23 +1,55 @@
 """
 Sistema de Comissões STIK
 Ponto de entrada da aplicação
+
+    python main.py                          # normal
+    python main.py --perfil-inicializacao   # tempos de import/inicialização
 """
 import sys
+
+from utils.startup_profile import FLAG_PERFIL, FLAG_SAIR_APOS_LOGIN, marcar, relatorio_marcos
+
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QApplication, QDialog
-from ui import LoginDialog, MainWindow
+from ui import LoginDialog
 from ui.themes import ThemeManager  # ← NOVO
 
+marcar("imports do login")
+
+
 def main():
     """Função principal - Inicializa a aplicação"""
+    if FLAG_PERFIL in sys.argv:
+        from utils.startup_profile import rodar_perfil
+        sys.exit(rodar_perfil(__file__))
+
     app = QApplication(sys.argv)
-    
+    marcar("QApplication")
+
     # APLICAR TEMA MODERNO (novo sistema)
     ThemeManager.set_theme(app, "dark")  # Pode ser "light" ou "dark"
-    
+
     # Login
     dlg = LoginDialog()
-    
+
+    if FLAG_SAIR_APOS_LOGIN in sys.argv:
+        # modo perfil: mede até o login aparecer e o custo de importar a janela principal
+        def _sair():
+            marcar("login visível")
+            from ui import MainWindow  # noqa: F401
+            marcar("import MainWindow")
+            print(relatorio_marcos(), flush=True)
+            dlg.reject()
+            app.quit()
+
+        dlg.show()
+        QTimer.singleShot(0, _sair)
+        sys.exit(app.exec())
+
     if dlg.exec() == QDialog.Accepted:
+        # pandas, pyodbc e as abas só depois do login
+        from ui import MainWindow
+
         win = MainWindow(dlg.username, dlg.role)
         win.show()
         sys.exit(app.exec())
@@ -25,4 +57,4 @@ def main():
         sys.exit(0)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
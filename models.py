@@ -1,10 +1,17 @@
 # models.py
 from __future__ import annotations
-from typing import List, Any, Set
+from collections.abc import Sequence
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
 from PySide6.QtCore import QAbstractTableModel, Qt, QModelIndex, QEvent, QItemSelection, QItemSelectionModel
 from PySide6.QtWidgets import QStyledItemDelegate, QLineEdit, QTableView
 from PySide6.QtGui import QFont, QColor, QKeyEvent
 from decimal import Decimal, InvalidOperation
+from html import escape
+
+from utils.formatters import display_formatter, display_text, fix_prazo
 
 _NUMERIC_HINTS = {
     "Recebido","ICMSST","Frete","Rec Liquido",
@@ -17,17 +24,388 @@ def _is_num(header: str) -> bool:
 def _s(v: Any) -> str:
     return "" if v is None else str(v)
 
+_ALIGN_RIGHT = int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+_ALIGN_LEFT = int(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
+
+
+def _parse_num(value: Any) -> float:
+    """Valor digitado/colado (BR ou US) -> float; NaN se não for número."""
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float, Decimal, np.number)):
+        return float(value)
+    txt = _s(value).strip().replace("%", "")
+    if not txt:
+        return np.nan
+    try:
+        if "," in txt:
+            return float(txt.replace(".", "").replace(",", "."))
+        return float(txt)
+    except ValueError:
+        return np.nan
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    """Comparação de célula para edição pendente: vazio/None/NaN contam como iguais."""
+    vazio_a = a is None or a == "" or (isinstance(a, float) and a != a)
+    vazio_b = b is None or b == "" or (isinstance(b, float) and b != b)
+    if vazio_a or vazio_b:
+        return vazio_a and vazio_b
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
+_DIRTY_BG = QColor(74, 58, 22)
+
+
+class _RowsView(Sequence):
+    """
+    Visão compatível com o antigo `model.rows` (lista de listas de strings):
+    cada linha é montada sob demanda com os textos de exibição.
+    """
+
+    def __init__(self, model: "EditableTableModel"):
+        self._m = model
+
+    def __len__(self) -> int:
+        return self._m.rowCount()
+
+    def __getitem__(self, r):
+        if isinstance(r, slice):
+            return [self[i] for i in range(*r.indices(len(self)))]
+        n = len(self)
+        if r < 0:
+            r += n
+        if not 0 <= r < n:
+            raise IndexError(r)
+        return [self._m._display(r, c) for c in range(len(self._m.headers))]
+
+
+class TableSlice:
+    """
+    Recorte (linhas x colunas da view) do EditableTableModel para exportação.
+
+    Guarda referências às colunas brutas e às linhas da fonte no momento do
+    recorte e só lê delas, então pode ser renderizado fora da thread da UI
+    mesmo que a grade seja reordenada/filtrada nesse meio tempo.
+    """
+
+    def __init__(self, headers: List[str], columns: List[Tuple[np.ndarray, Callable[[Any], str], Optional[List[Optional[str]]]]], src: np.ndarray):
+        self.headers = headers
+        self._columns = columns
+        self._src = src
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self._src), len(self._columns)
+
+    def column_texts(self, j: int) -> List[str]:
+        col, fmt, cache = self._columns[j]
+        if cache is None:
+            return [fmt(col[i]) for i in self._src]
+        out = []
+        for i in self._src:
+            txt = cache[i]
+            out.append(fmt(col[i]) if txt is None else txt)
+        return out
+
+    def render(self, include_header: bool = True, progress: Optional[Callable[[int], None]] = None) -> Tuple[str, str]:
+        """
+        (tsv, html) numa passada. Tab/quebra de linha dentro das células
+        viram espaço no TSV. progress recebe 0..100.
+        """
+        limpa = str.maketrans({"\t": " ", "\n": " ", "\r": " "})
+        n_cols = len(self._columns)
+        textos = []
+        for j in range(n_cols):
+            col = self.column_texts(j)
+            junto = "".join(col)
+            if "\t" in junto or "\n" in junto or "\r" in junto:
+                col = [t.translate(limpa) for t in col]
+            textos.append(col)
+            if progress:
+                progress(int(60 * (j + 1) / max(1, n_cols)))
+
+        tsv: List[str] = []
+        html: List[str] = ['<html><head><meta charset="utf-8"></head><body><table>']
+        if include_header:
+            tsv.append("\t".join(h.translate(limpa) for h in self.headers))
+            html.append("<tr>" + "".join(f"<th>{escape(h)}</th>" for h in self.headers) + "</tr>")
+
+        n = len(self._src)
+        passo = max(1, n // 20)
+        for k, linha in enumerate(zip(*textos)):
+            tsv.append("\t".join(linha))
+            html.append("<tr><td>" + "</td><td>".join(map(escape, linha)) + "</td></tr>")
+            if progress and k % passo == 0:
+                progress(60 + int(40 * k / n))
+
+        html.append("</table></body></html>")
+        if progress:
+            progress(100)
+        return "\n".join(tsv), "".join(html)
+
+
 class EditableTableModel(QAbstractTableModel):
-    def __init__(self, headers: List[str], rows: List[List[Any]]):
+    """
+    Model de tabela com armazenamento por coluna.
+
+    Cada coluna guarda o valor bruto (numpy: float64 nas colunas numéricas
+    formatadas, dtype original nas demais) e o texto de exibição é gerado
+    sob demanda por célula e cacheado. Alinhamento e formatação são
+    resolvidos uma vez por coluna.
+
+    A ordem exibida é uma permutação (`_order`: linha da view -> linha da
+    fonte); ordenar só troca a permutação. As chaves de ordenação de cada
+    coluna (ranks) são calculadas uma vez e reaproveitadas até a coluna
+    mudar. Filtrar (set_row_filter) também só troca `_order`: as linhas
+    fora do filtro continuam no model, só não aparecem.
+
+    Construção:
+      - EditableTableModel.from_frame(df, headers): dados brutos do DataFrame,
+        formatação de utils.formatters.display_formatter;
+      - EditableTableModel(headers, rows): linhas já formatadas (strings),
+        exibidas como vieram.
+
+    `rows` continua disponível (somente leitura) com os textos exibidos,
+    na ordem da view. O valor bruto sai em Qt.UserRole / raw_value() /
+    column_values().
+    """
+
+    def __init__(self, headers: List[str], rows: Optional[List[List[Any]]] = None):
         super().__init__()
         self.headers = list(headers)
-        self.rows = [list(r) for r in rows]
+        rows = rows or []
+        n_cols = len(self.headers)
+        cols: List[np.ndarray] = []
+        for c in range(n_cols):
+            arr = np.empty(len(rows), dtype=object)
+            arr[:] = [r[c] if c < len(r) else None for r in rows]
+            cols.append(arr)
+        self._init_columns(cols, [_s] * n_cols, [False] * n_cols)
+
         self._all_readonly = False
         self._editable_cols: Set[int] = set()
         
-        # Estado de ordenação
-        self._sort_column = -1
-        self._sort_order = Qt.SortOrder.AscendingOrder
+        # Estado de ordenação: [(coluna, ordem), ...] — a primeira é a principal
+        self._sort_keys: List[Tuple[int, Qt.SortOrder]] = []
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, headers: Optional[List[str]] = None) -> "EditableTableModel":
+        """Model a partir do DataFrame bruto (sem apply_display_formats)."""
+        headers = list(headers if headers is not None else df.columns)
+        model = cls(headers)
+
+        cols: List[np.ndarray] = []
+        fmts: List[Callable[[Any], str]] = []
+        numeric: List[bool] = []
+        for h in headers:
+            serie = df[h]
+            fmt = display_formatter(h)
+            if fmt is not None:
+                cols.append(pd.to_numeric(serie, errors="coerce").to_numpy(dtype=np.float64))
+                fmts.append(fmt)
+                numeric.append(True)
+            elif pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+                cols.append(serie.to_numpy())
+                fmts.append(display_text)
+                numeric.append(True)
+            else:
+                cols.append(serie.to_numpy(dtype=object))
+                fmts.append(display_text)
+                numeric.append(False)
+
+        model._init_columns(cols, fmts, numeric)
+        model._row_ids = df.index.to_numpy(copy=True)
+        return model
+
+    def _init_columns(self, cols: List[np.ndarray], fmts: List[Callable[[Any], str]], numeric: List[bool]):
+        # pandas (copy-on-write) pode devolver arrays somente leitura; o model edita no lugar
+        self._cols = [col if col.flags.writeable else col.copy() for col in cols]
+        self._fmts = fmts
+        self._numeric = numeric
+        n = len(cols[0]) if cols else 0
+        self._order = np.arange(n, dtype=np.intp)
+        # id estável por linha da fonte (índice do DataFrame em from_frame):
+        # não muda com ordenação, filtro nem remoção de outras linhas
+        self._row_ids = np.arange(n, dtype=np.intp)
+        self._visible: Optional[np.ndarray] = None  # máscara por linha da fonte (None = todas)
+        # caches por coluna, indexados pela linha da fonte
+        self._disp: List[Optional[List[Optional[str]]]] = [None] * len(cols)
+        self._ranks: List[Optional[np.ndarray]] = [None] * len(cols)
+        # somas acumuladas por coluna, na ordem da view (ver range_sum)
+        self._prefix: Dict[int, np.ndarray] = {}
+        # edições pendentes: linha da fonte -> {coluna: valor original}
+        self._dirty: Dict[int, Dict[int, Any]] = {}
+        self._align = [_ALIGN_RIGHT if _is_num(h) else _ALIGN_LEFT for h in self.headers]
+
+    def _text(self, src: int, c: int) -> str:
+        cache = self._disp[c]
+        if cache is None:
+            cache = self._disp[c] = [None] * len(self._cols[c])
+        txt = cache[src]
+        if txt is None:
+            txt = cache[src] = self._fmts[c](self._cols[c][src])
+        return txt
+
+    def _display(self, r: int, c: int) -> str:
+        return self._text(int(self._order[r]), c)
+
+    # ---- acesso aos dados ----
+    @property
+    def rows(self) -> _RowsView:
+        return _RowsView(self)
+
+    @property
+    def _sort_column(self) -> int:
+        return self._sort_keys[0][0] if self._sort_keys else -1
+
+    @property
+    def _sort_order(self) -> Qt.SortOrder:
+        return self._sort_keys[0][1] if self._sort_keys else Qt.SortOrder.AscendingOrder
+
+    def column_index(self, header: str) -> Optional[int]:
+        try:
+            return self.headers.index(header)
+        except ValueError:
+            return None
+
+    def source_row(self, row: int) -> int:
+        """Linha na fonte (ordem original dos dados) da linha exibida."""
+        return int(self._order[row])
+
+    def source_rows(self) -> np.ndarray:
+        """Linhas da fonte exibidas, na ordem da view."""
+        return self._order.copy()
+
+    def row_id(self, row: int) -> Any:
+        """Id estável da linha exibida (rótulo do índice do DataFrame de origem)."""
+        v = self._row_ids[self._order[row]]
+        return v.item() if isinstance(v, np.generic) else v
+
+    def row_ids(self, rows: Sequence[int]) -> List[Any]:
+        """row_id() de várias linhas da view, na ordem recebida."""
+        return self._row_ids[self._order[np.asarray(rows, dtype=np.intp)]].tolist()
+
+    def source_count(self) -> int:
+        """Total de linhas no model, incluindo as escondidas pelo filtro."""
+        return len(self._cols[0]) if self._cols else 0
+
+    def raw_value(self, row: int, column: int) -> Any:
+        v = self._cols[column][self._order[row]]
+        return v.item() if isinstance(v, np.generic) else v
+
+    def column_values(self, header: str) -> Optional[np.ndarray]:
+        """Array bruto da coluna (na ordem exibida) ou None."""
+        c = self.column_index(header)
+        return None if c is None else self._cols[c][self._order]
+
+    def table_slice(self, rows: Optional[Sequence[int]] = None, columns: Optional[Sequence[int]] = None) -> TableSlice:
+        """Recorte para exportação (linhas da view; None = todas)."""
+        src = self._order.copy() if rows is None else self._order[np.asarray(rows, dtype=np.intp)]
+        cols = range(len(self.headers)) if columns is None else columns
+        return TableSlice(
+            [self.headers[c] for c in cols],
+            [(self._cols[c], self._fmts[c], self._disp[c]) for c in cols],
+            src,
+        )
+
+    def range_sum(self, column: int, first: int, last: int) -> float:
+        """
+        Soma dos valores numéricos das linhas first..last (da view) na coluna,
+        por soma acumulada: custo constante depois da primeira chamada.
+        Vazios/não numéricos contam zero.
+        """
+        n = len(self._order)
+        first, last = max(0, first), min(last, n - 1)
+        if first > last:
+            return 0.0
+        prefix = self._prefix.get(column)
+        if prefix is None:
+            col = self._cols[column]
+            if col.dtype.kind in "fiub":
+                vals = col.astype(np.float64)[self._order]
+            else:
+                vals = np.array([_parse_num(v) for v in col[self._order]], dtype=np.float64)
+            prefix = np.concatenate(([0.0], np.cumsum(np.nan_to_num(vals))))
+            self._prefix[column] = prefix
+        return float(prefix[last + 1] - prefix[first])
+
+    def source_value(self, src: int, header: str) -> Any:
+        """Valor bruto atual de uma linha da fonte."""
+        c = self.column_index(header)
+        if c is None:
+            return None
+        v = self._cols[c][src]
+        return v.item() if isinstance(v, np.generic) else v
+
+    def source_text(self, src: int, header: str) -> str:
+        """Texto exibido de uma linha da fonte."""
+        c = self.column_index(header)
+        return "" if c is None else self._text(src, c)
+
+    # ---- edições pendentes ----
+    def _track_edit(self, src: int, c: int, antes: Any):
+        """Guarda o original na 1ª edição da célula; se o original voltar, a célula fica limpa."""
+        cells = self._dirty.setdefault(src, {})
+        original = cells.setdefault(c, antes)
+        if _same_value(original, self._cols[c][src]):
+            del cells[c]
+            if not cells:
+                del self._dirty[src]
+
+    def has_changes(self) -> bool:
+        return bool(self._dirty)
+
+    def dirty_rows(self) -> np.ndarray:
+        """Linhas da fonte com edição pendente (ordem da fonte)."""
+        return np.array(sorted(self._dirty), dtype=np.intp)
+
+    def dirty_headers(self, src: int) -> List[str]:
+        return [self.headers[c] for c in sorted(self._dirty.get(src, {}))]
+
+    def original_value(self, src: int, header: str) -> Any:
+        """Valor da célula antes das edições pendentes (o atual, se não foi editada)."""
+        c = self.column_index(header)
+        if c is None:
+            return None
+        cells = self._dirty.get(src)
+        if cells is not None and c in cells:
+            v = cells[c]
+        else:
+            v = self._cols[c][src]
+        return v.item() if isinstance(v, np.generic) else v
+
+    def dirty_state(self) -> Dict[int, Dict[str, Any]]:
+        """Edições pendentes por linha da fonte: {linha: {coluna: original}}."""
+        return {src: {self.headers[c]: v for c, v in cells.items()} for src, cells in self._dirty.items()}
+
+    def restore_dirty(self, state: Dict[int, Dict[str, Any]]):
+        """Reaplica originais de dirty_state (ex.: model remontado com os valores já editados)."""
+        for src, cells in state.items():
+            for header, original in cells.items():
+                c = self.column_index(header)
+                if c is not None and 0 <= src < self.source_count():
+                    self._track_edit(int(src), c, original)
+
+    def clear_dirty(self, src_rows: Optional[Sequence[int]] = None):
+        """Marca como gravadas (None = todas)."""
+        if src_rows is None:
+            self._dirty.clear()
+        else:
+            for src in src_rows:
+                self._dirty.pop(int(src), None)
+        if self._order.size:
+            self.dataChanged.emit(
+                self.index(0, 0),
+                self.index(len(self._order) - 1, len(self.headers) - 1),
+                [Qt.ItemDataRole.BackgroundRole],
+            )
+
+    def is_numeric_column(self, column: int) -> bool:
+        return self._numeric[column]
 
     # ---- API usada no main.py ----
     def set_all_readonly(self, value: bool):
@@ -46,37 +424,152 @@ class EditableTableModel(QAbstractTableModel):
         br = self.index(max(0,self.rowCount()-1), max(0,self.columnCount()-1))
         self.dataChanged.emit(tl, br, [Qt.ItemDataRole.EditRole])
 
+    def update_rows(self, src_rows: Sequence[int], valores: Dict[str, Sequence[Any]], edicao: bool = False):
+        """
+        Grava valores brutos em linhas da fonte e avisa a view. O dataChanged
+        sai sem EditRole. Por padrão os valores vêm do banco e as células
+        deixam de ter edição pendente; com edicao=True (alteração em memória,
+        ex. regras aplicadas em tela) elas passam a ter.
+        """
+        src = np.asarray(src_rows, dtype=np.intp)
+        if len(src) == 0:
+            return
+
+        for header, vals in valores.items():
+            c = self.column_index(header)
+            if c is None:
+                continue
+            if self._fmts[c] is not display_text:
+                vals = pd.to_numeric(pd.Series(list(vals)), errors="coerce").to_numpy(dtype=np.float64)
+            elif self._numeric[c]:
+                vals = pd.Series(list(vals)).to_numpy()
+            else:
+                vals = np.asarray(list(vals), dtype=object)
+            col = self._cols[c]
+            if col.dtype != object and vals.dtype != col.dtype:
+                try:
+                    vals = vals.astype(col.dtype, casting="same_kind")
+                except (TypeError, ValueError):
+                    col = self._cols[c] = col.astype(object)
+            antes = col[src].copy() if edicao else None
+            col[src] = vals
+
+            if edicao:
+                for i, v in zip(src.tolist(), antes):
+                    self._track_edit(i, c, v)
+            else:
+                for i in src.tolist():
+                    cells = self._dirty.get(i)
+                    if cells is not None and c in cells:
+                        del cells[c]
+                        if not cells:
+                            del self._dirty[i]
+
+            cache = self._disp[c]
+            if cache is not None:
+                for i in src:
+                    cache[i] = None
+            self._ranks[c] = None
+            self._prefix.pop(c, None)
+
+        visiveis = np.flatnonzero(np.isin(self._order, src))
+        if len(visiveis):
+            self.dataChanged.emit(
+                self.index(int(visiveis[0]), 0),
+                self.index(int(visiveis[-1]), len(self.headers) - 1),
+                [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.UserRole],
+            )
+
     def remove_rows(self, indices: List[int]):
-        for r in sorted(indices, reverse=True):
-            if 0 <= r < len(self.rows):
-                self.beginRemoveRows(QModelIndex(), r, r)
-                del self.rows[r]
-                self.endRemoveRows()
+        """Remove linhas da view (índices da view)."""
+        n = len(self._order)
+        self.remove_source_rows(self._order[[r for r in set(indices) if 0 <= r < n]])
+
+    def remove_source_rows(self, src_rows: Sequence[int]):
+        """Remove linhas da fonte, estejam visíveis ou escondidas pelo filtro."""
+        removidas = np.unique(np.asarray(src_rows, dtype=np.intp))
+        if len(removidas) == 0:
+            return
+
+        alvo = sorted(np.flatnonzero(np.isin(self._order, removidas)).tolist(), reverse=True)
+
+        # remove da view em blocos contíguos (de baixo para cima)
+        i = 0
+        while i < len(alvo):
+            last = first = alvo[i]
+            while i + 1 < len(alvo) and alvo[i + 1] == first - 1:
+                i += 1
+                first = alvo[i]
+            i += 1
+
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self._order = np.delete(self._order, slice(first, last + 1))
+            self._prefix.clear()
+            self.endRemoveRows()
+
+        # compacta a fonte (a view não muda)
+        manter = np.ones(len(self._cols[0]) if self._cols else 0, dtype=bool)
+        manter[removidas] = False
+        novo_idx = np.cumsum(manter) - 1
+        self._cols = [col[manter] for col in self._cols]
+        self._row_ids = self._row_ids[manter]
+        self._disp = [
+            None if cache is None else [t for t, k in zip(cache, manter) if k]
+            for cache in self._disp
+        ]
+        self._ranks = [None if rk is None else rk[manter] for rk in self._ranks]
+        self._dirty = {int(novo_idx[i]): cells for i, cells in self._dirty.items() if manter[i]}
+        if self._visible is not None:
+            self._visible = self._visible[manter]
+        self._order = novo_idx[self._order]
+        self._prefix.clear()
+
+    def set_row_filter(self, mask: Optional[np.ndarray]):
+        """
+        Mostra só as linhas da fonte com mask=True (None mostra todas).
+        Mantém a ordenação atual; não recria colunas nem caches.
+        """
+        n = self.source_count()
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            if len(mask) != n:
+                raise ValueError(f"máscara com {len(mask)} linhas; model tem {n}")
+
+        self.beginResetModel()
+        self._visible = mask
+        base = np.arange(n, dtype=np.intp) if mask is None else np.flatnonzero(mask)
+        self._order = self._sorted(base)
+        self._prefix.clear()
+        self.endResetModel()
 
     # ---- QAbstractTableModel ----
-    def rowCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self.rows)
+    def rowCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self._order)
     def columnCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self.headers)
 
     def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
         if not index.isValid(): return None
         r,c = index.row(), index.column()
-        if r<0 or r>=len(self.rows) or c<0 or c>=len(self.headers): return None
-        val = self.rows[r][c]; head = self.headers[c]
+        if r<0 or r>=len(self._order) or c<0 or c>=len(self.headers): return None
         
         if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
-            return _s(val)
+            return self._display(r, c)
         
         if role == Qt.ItemDataRole.TextAlignmentRole:
-            if _is_num(head):
-                return int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-            return int(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
+            return self._align[c]
+
+        if role == Qt.ItemDataRole.UserRole:
+            return self.raw_value(r, c)
         
-        # Destaca a coluna ordenada
+        # Destaca células com edição pendente e as colunas ordenadas
         if role == Qt.ItemDataRole.BackgroundRole:
-            if c == self._sort_column:
+            if self._dirty:
+                cells = self._dirty.get(int(self._order[r]))
+                if cells is not None and c in cells:
+                    return _DIRTY_BG
+            if self._sort_keys and any(c == k for k, _ in self._sort_keys):
                 return QColor(30, 35, 50)
         
-        # Coluna ordenada em negrito
+        # Coluna ordenada principal em negrito
         if role == Qt.ItemDataRole.FontRole:
             if c == self._sort_column:
                 font = QFont()
@@ -89,10 +582,13 @@ class EditableTableModel(QAbstractTableModel):
         if orientation == Qt.Orientation.Horizontal:
             if role == Qt.ItemDataRole.DisplayRole:
                 header = self.headers[section] if 0 <= section < len(self.headers) else ""
-                # Adiciona seta indicadora de ordenação
-                if section == self._sort_column:
-                    arrow = " ▲" if self._sort_order == Qt.SortOrder.AscendingOrder else " ▼"
-                    return header + arrow
+                # Adiciona seta indicadora de ordenação (com a posição, se houver mais de uma)
+                for pos, (col, order) in enumerate(self._sort_keys, 1):
+                    if col == section:
+                        arrow = " ▲" if order == Qt.SortOrder.AscendingOrder else " ▼"
+                        if len(self._sort_keys) > 1:
+                            arrow += str(pos)
+                        return header + arrow
                 return header
             
             if role == Qt.ItemDataRole.FontRole:
@@ -118,72 +614,188 @@ class EditableTableModel(QAbstractTableModel):
     def setData(self, index: QModelIndex, value, role=Qt.ItemDataRole.EditRole):
         if role != Qt.ItemDataRole.EditRole or not index.isValid(): return False
         r,c = index.row(), index.column()
-        if r<0 or r>=len(self.rows) or c<0 or c>=len(self.headers): return False
+        if r<0 or r>=len(self._order) or c<0 or c>=len(self.headers): return False
         if self._all_readonly: return False
         if self._editable_cols and c not in self._editable_cols: return False
-        self.rows[r][c] = (value)
+
+        src = int(self._order[r])
+        col = self._cols[c]
+        antes = col[src]
+        if self._numeric[c]:
+            raw = _parse_num(value)
+            if col.dtype.kind == "f":
+                col[src] = raw
+            elif col.dtype.kind in "iu" and raw == raw and float(raw).is_integer():
+                col[src] = int(raw)
+            else:
+                col = self._cols[c] = col.astype(object)
+                col[src] = raw
+        else:
+            col[src] = value
+
+        # texto: o que foi digitado (delegates já entregam formatado)
+        cache = self._disp[c]
+        if cache is None:
+            cache = self._disp[c] = [None] * len(col)
+        cache[src] = value if isinstance(value, str) else self._fmts[c](col[src])
+
+        # chave de ordenação da coluna ficou velha (a ordem exibida não muda sozinha)
+        self._ranks[c] = None
+        self._prefix.pop(c, None)
+        self._track_edit(src, c, antes)
+
         self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole])
         return True
 
+    # ---- ordenação ----
+    def _column_ranks(self, c: int) -> np.ndarray:
+        """
+        Rank denso (ascendente) de cada linha da fonte na coluna c.
+        Mesma prioridade de antes: número < data < competência < texto < vazio.
+        """
+        rk = self._ranks[c]
+        if rk is not None:
+            return rk
+
+        col = self._cols[c]
+        if self._numeric[c] and col.dtype.kind in "fiu":
+            vals = col.astype(np.float64, copy=True)
+            if self.headers[c] == "Prazo Médio":
+                # mesma regra do valor exibido
+                vals = np.fromiter(
+                    (np.nan if (x := fix_prazo(v)) is None else x for v in vals), dtype=np.float64, count=len(vals)
+                )
+            vazio = np.isnan(vals)
+            if self._fmts[c] is not display_text:
+                # colunas formatadas exibem zero no lugar de vazio
+                vals[vazio] = 0.0
+                vazio[:] = False
+            cat = vazio.astype(np.int8)
+            vals[vazio] = 0.0
+            ordem = np.lexsort((vals, cat))
+            s_vals, s_cat = vals[ordem], cat[ordem]
+            muda = (s_vals[1:] != s_vals[:-1]) | (s_cat[1:] != s_cat[:-1])
+        else:
+            textos = [self._text(i, c) for i in range(len(col))]
+            unicos = {t: None for t in textos}
+            chaves = sorted(unicos, key=_sort_key)
+            pos = {t: i for i, t in enumerate(chaves)}
+            # textos diferentes podem ter a mesma chave ("1,0" e "1,00")
+            rank_unico = np.zeros(len(chaves), dtype=np.intp)
+            for i in range(1, len(chaves)):
+                rank_unico[i] = rank_unico[i - 1] + (_sort_key(chaves[i]) != _sort_key(chaves[i - 1]))
+            rk = rank_unico[np.fromiter((pos[t] for t in textos), dtype=np.intp, count=len(textos))]
+            self._ranks[c] = rk
+            return rk
+
+        rank_ord = np.concatenate(([0], np.cumsum(muda))) if len(ordem) else np.zeros(0, dtype=np.intp)
+        rk = np.empty(len(ordem), dtype=np.intp)
+        rk[ordem] = rank_ord
+        self._ranks[c] = rk
+        return rk
+
+    def _sorted(self, base: np.ndarray) -> np.ndarray:
+        """
+        Linhas da fonte em `base` (em ordem crescente) ordenadas pelas chaves
+        atuais. lexsort usa a última chave como principal e é estável
+        (empates ficam na ordem da fonte).
+        """
+        if not self._sort_keys or len(base) == 0:
+            return base
+        chaves = []
+        for col, order in reversed(self._sort_keys):
+            rk = self._column_ranks(col)[base]
+            chaves.append(-rk if order == Qt.SortOrder.DescendingOrder else rk)
+        return base[np.lexsort(chaves)]
+
+    def _apply_sort(self):
+        self.layoutAboutToBeChanged.emit()
+        # parte sempre da ordem da fonte: o resultado não depende de
+        # ordenações anteriores
+        self._order = self._sorted(np.sort(self._order))
+        self._prefix.clear()
+        self.layoutChanged.emit()
+        self.headerDataChanged.emit(Qt.Orientation.Horizontal, 0, len(self.headers) - 1)
+
     def sort(self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder):
-        """Implementa ordenação inteligente da tabela"""
+        """Implementa ordenação inteligente da tabela (uma coluna)."""
+        if column < 0 or column >= len(self.headers):
+            return
+        self._sort_keys = [(column, order)]
+        self._apply_sort()
+
+    def toggle_sort(self, column: int, additive: bool = False):
+        """
+        Clique no cabeçalho: alterna asc/desc da coluna.
+        Com additive (Shift+clique) a coluna entra como critério adicional.
+        """
         if column < 0 or column >= len(self.headers):
             return
 
-        self.layoutAboutToBeChanged.emit()
+        asc, desc = Qt.SortOrder.AscendingOrder, Qt.SortOrder.DescendingOrder
+        atual = dict(self._sort_keys)
+
+        if additive:
+            if column in atual:
+                self._sort_keys = [
+                    (c, (desc if o == asc else asc) if c == column else o) for c, o in self._sort_keys
+                ]
+            else:
+                self._sort_keys = self._sort_keys + [(column, asc)]
+        elif self._sort_column == column and len(self._sort_keys) == 1:
+            self._sort_keys = [(column, desc if self._sort_order == asc else asc)]
+        else:
+            self._sort_keys = [(column, asc)]
 
-        self._sort_column = column
-        self._sort_order = order
+        self._apply_sort()
 
-        def convert_value(val):
-            """Retorna uma chave ordenável com prioridade explícita:
-            0 -> número (Decimal)
-            1 -> data (yyyyMMdd string)
-            2 -> competência (yyyymm)
-            3 -> string (lowercase)
-            4 -> empty
-            """
-            if val is None or val == "":
-                return (4, "")
 
-            val_str = str(val).strip()
+def _sort_key(val: str):
+    """Retorna uma chave ordenável com prioridade explícita:
+    0 -> número (Decimal)
+    1 -> data (yyyyMMdd string)
+    2 -> competência (yyyymm)
+    3 -> string (lowercase)
+    4 -> empty
+    """
+    if val is None or val == "":
+        return (4, "")
+
+    val_str = str(val).strip()
+
+    # Tenta número (normaliza BR -> US)
+    try:
+        num_str = val_str.replace(".", "").replace(",", ".")
+        num_str = num_str.replace("%", "").strip()
+        num_dec = Decimal(num_str)
+        if num_dec.is_finite():
+            return (0, num_dec)
+    except (InvalidOperation, ValueError):
+        pass
+
+    # Data no formato dd/mm/yyyy
+    if "/" in val_str and len(val_str) == 10:
+        try:
+            d, m, y = val_str.split("/")
+            return (1, f"{y}{m}{d}")
+        except Exception:
+            pass
 
-            # Tenta número (normaliza BR -> US)
-            try:
-                num_str = val_str.replace(".", "").replace(",", ".")
-                num_str = num_str.replace("%", "").strip()
-                num_dec = Decimal(num_str)
-                return (0, num_dec)
-            except (InvalidOperation, ValueError):
-                pass
-
-            # Data no formato dd/mm/yyyy
-            if "/" in val_str and len(val_str) == 10:
-                try:
-                    d, m, y = val_str.split("/")
-                    return (1, f"{y}{m}{d}")
-                except Exception:
-                    pass
-
-            # Competência tipo 'Jan-2024' ou similar
-            if "-" in val_str and len(val_str) <= 12:
-                month_map = {
-                    "jan": "01", "fev": "02", "mar": "03", "abr": "04",
-                    "mai": "05", "jun": "06", "jul": "07", "ago": "08",
-                    "set": "09", "out": "10", "nov": "11", "dez": "12"
-                }
-                parts = val_str.lower().split("-")
-                if len(parts) == 2 and parts[0] in month_map:
-                    return (2, f"{parts[1]}{month_map[parts[0]]}")
-
-            # Fallback: string
-            return (3, val_str.lower())
-
-        reverse = (order == Qt.SortOrder.DescendingOrder)
-        self.rows.sort(key=lambda row: convert_value(row[column]), reverse=reverse)
+    # Competência tipo 'Jan-2024' ou similar
+    if "-" in val_str and len(val_str) <= 12:
+        parts = val_str.lower().split("-")
+        if len(parts) == 2 and parts[0] in _MONTH_MAP:
+            return (2, f"{parts[1]}{_MONTH_MAP[parts[0]]}")
 
-        self.layoutChanged.emit()
-        self.headerDataChanged.emit(Qt.Orientation.Horizontal, 0, len(self.headers) - 1)
+    # Fallback: string
+    return (3, val_str.lower())
+
+
+_MONTH_MAP = {
+    "jan": "01", "fev": "02", "mar": "03", "abr": "04",
+    "mai": "05", "jun": "06", "jul": "07", "ago": "08",
+    "set": "09", "out": "10", "nov": "11", "dez": "12"
+}
 
 
 class ExcelLikeTableView(QTableView):
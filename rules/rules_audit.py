@@ -2,7 +2,7 @@
 import json
 import os
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Optional
 import uuid
 
 
@@ -33,6 +33,28 @@ def append_jsonl(path: str, event: Dict[str, Any]) -> None:
         f.write(json.dumps(clean, ensure_ascii=False) + "\n")
 
 
+def append_jsonl_many(path: str, events: Iterable[Dict[str, Any]]) -> int:
+    """
+    Anexa vários eventos de uma vez (1 abertura de arquivo, 1 escrita).
+    Retorna quantos eventos foram gravados.
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    stamp = datetime.now(timezone.utc).isoformat()
+    lines = []
+    for event in events:
+        clean = {k: _safe_json(v) for k, v in event.items()}
+        clean.setdefault("ts_utc", stamp)
+        lines.append(json.dumps(clean, ensure_ascii=False) + "\n")
+
+    if lines:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+    return len(lines)
+
+
 def generate_session_id(username: str) -> str:
     """
     Gera um id de sessão (útil para agrupar eventos de uma mesma ação,
@@ -0,0 +1,396 @@
+# rules/rules_audit_query.py
+"""
+Consulta ao log de auditoria (comissoes_audit.jsonl) via índice SQLite.
+
+O JSONL continua sendo a fonte: o índice (arquivo .idx.sqlite na pasta de
+dados local do usuário, fora do projeto: logs/ é versionado) guarda só o offset/tamanho de cada linha e as chaves de busca
+(dbid, username, session_id, action, dia/mês). A cada consulta o índice
+lê apenas o que foi anexado desde a última vez; se o log for truncado ou
+trocado, é reconstruído do zero.
+
+Uso (CLI):
+    python -m rules.rules_audit_query history 12345
+    python -m rules.rules_audit_query session karen-20260101T120000Z-abcd1234
+    python -m rules.rules_audit_query users --month 2026-01
+    python -m rules.rules_audit_query rebuild
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rules.rules_audit import _to_int_or_none
+
+DEFAULT_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs", "comissoes_audit.jsonl")
+
+# bytes do início do arquivo usados para detectar troca/rotação do log
+_HEAD_BYTES = 4096
+_BATCH = 5000
+
+# context pode ter virado str(dict) quando tinha Decimal (ver _safe_json)
+_SESSION_RE = re.compile(r"""['"]session_id['"]\s*:\s*['"]([^'"]*)['"]""")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS events (
+    offset INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL,
+    ts TEXT,
+    day TEXT,
+    month TEXT,
+    action TEXT,
+    username TEXT,
+    dbid INTEGER,
+    session_id TEXT
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS ix_events_dbid ON events (dbid);
+CREATE INDEX IF NOT EXISTS ix_events_session ON events (session_id);
+CREATE INDEX IF NOT EXISTS ix_events_user_month ON events (username, month);
+CREATE INDEX IF NOT EXISTS ix_events_action_day ON events (action, day);
+CREATE INDEX IF NOT EXISTS ix_events_day ON events (day);
+"""
+
+
+def index_path_for(log_path: str) -> str:
+    """
+    Arquivo do índice de um log: pasta de dados local do usuário (como a fila
+    de gravação, ui.write_queue_runner.caminho_fila), um por caminho de log.
+    """
+    base = (
+        os.environ.get("LOCALAPPDATA")
+        or os.environ.get("XDG_DATA_HOME")
+        or os.path.join(os.path.expanduser("~"), ".local", "share")
+    )
+    pasta = os.path.join(base, "Comissao")
+    os.makedirs(pasta, exist_ok=True)
+    chave = hashlib.sha1(os.path.abspath(log_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(pasta, f"{os.path.basename(log_path)}.{chave}.idx.sqlite")
+
+
+def _session_of(event: Dict[str, Any]) -> Optional[str]:
+    sid = event.get("session_id")
+    if sid:
+        return str(sid)
+    ctx = event.get("context")
+    if isinstance(ctx, dict):
+        sid = ctx.get("session_id")
+        return str(sid) if sid else None
+    if isinstance(ctx, str):
+        m = _SESSION_RE.search(ctx)
+        if m and m.group(1):
+            return m.group(1)
+    return None
+
+
+def _keys_of(offset: int, length: int, raw: bytes) -> Optional[Tuple[Any, ...]]:
+    try:
+        event = json.loads(raw)
+    except Exception:
+        return None
+    if not isinstance(event, dict):
+        return None
+    ts = str(event.get("ts_utc") or "")
+    return (
+        offset,
+        length,
+        ts or None,
+        ts[:10] or None,
+        ts[:7] or None,
+        event.get("action"),
+        (str(event.get("username") or "").strip().lower() or None),
+        _to_int_or_none(event.get("dbid")),
+        _session_of(event),
+    )
+
+
+class AuditIndex:
+    """
+    Índice incremental sobre o JSONL de auditoria.
+
+    Toda consulta chama refresh() antes, então o resultado sempre inclui as
+    linhas gravadas até o momento (linha final incompleta é ignorada até
+    ser terminada).
+    """
+
+    def __init__(self, log_path: str = DEFAULT_LOG, index_path: Optional[str] = None):
+        self.log_path = log_path
+        self.index_path = index_path or index_path_for(log_path)
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # ============================================================
+    # Índice
+    # ============================================================
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            folder = os.path.dirname(self.index_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            conn = sqlite3.connect(self.index_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            conn.executescript(_INDEXES)
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: Any) -> None:
+        self._db().execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value)),
+        )
+
+    def _head(self) -> str:
+        with open(self.log_path, "rb") as f:
+            return f.read(_HEAD_BYTES).hex()
+
+    def rebuild(self) -> int:
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM events")
+            db.execute("DELETE FROM meta")
+        return self.refresh()
+
+    def refresh(self) -> int:
+        """Indexa as linhas anexadas desde a última chamada. Retorna quantas."""
+        if not os.path.exists(self.log_path):
+            return 0
+
+        size = os.path.getsize(self.log_path)
+        offset = int(self._meta("offset") or 0)
+        head = self._meta("head")
+
+        if offset > size or (offset and head is not None and not self._head().startswith(head)):
+            # log truncado/trocado: começa de novo
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM events")
+                db.execute("DELETE FROM meta")
+            offset = 0
+
+        if offset == size:
+            return 0
+
+        db = self._db()
+        novos = 0
+        batch: List[Tuple[Any, ...]] = []
+
+        # carga inicial: índices secundários são criados depois (bem mais rápido)
+        carga_inicial = offset == 0
+        if carga_inicial:
+            for (nome,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_events_%'").fetchall():
+                db.execute(f"DROP INDEX {nome}")
+
+        with open(self.log_path, "rb") as f, db:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # linha ainda sendo escrita
+                keys = _keys_of(offset, len(raw), raw)
+                if keys is not None:
+                    batch.append(keys)
+                offset += len(raw)
+
+                if len(batch) >= _BATCH:
+                    db.executemany("INSERT OR REPLACE INTO events VALUES (?,?,?,?,?,?,?,?,?)", batch)
+                    novos += len(batch)
+                    batch.clear()
+
+            if batch:
+                db.executemany("INSERT OR REPLACE INTO events VALUES (?,?,?,?,?,?,?,?,?)", batch)
+                novos += len(batch)
+
+            self._set_meta("offset", offset)
+            self._set_meta("head", self._head()[: min(offset, _HEAD_BYTES) * 2])
+
+        if carga_inicial:
+            db.executescript(_INDEXES)
+
+        return novos
+
+    # ============================================================
+    # Consultas
+    # ============================================================
+
+    def _load(self, refs: Sequence[Tuple[int, int]]) -> Iterator[Dict[str, Any]]:
+        with open(self.log_path, "rb") as f:
+            for offset, length in refs:
+                f.seek(offset)
+                try:
+                    yield json.loads(f.read(length))
+                except Exception:
+                    continue
+
+    def query(
+        self,
+        *,
+        dbid: Optional[int] = None,
+        username: Optional[str] = None,
+        session_id: Optional[str] = None,
+        action: Optional[str] = None,
+        day_from: Optional[str] = None,
+        day_to: Optional[str] = None,
+        limit: Optional[int] = None,
+        newest_first: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Eventos completos que batem com todos os filtros informados.
+        Datas no formato 'AAAA-MM-DD' (UTC, como ts_utc).
+        """
+        self.refresh()
+
+        where, params = [], []
+        if dbid is not None:
+            where.append("dbid = ?")
+            params.append(int(dbid))
+        if username:
+            where.append("username = ?")
+            params.append(username.strip().lower())
+        if session_id:
+            where.append("session_id = ?")
+            params.append(session_id)
+        if action:
+            where.append("action = ?")
+            params.append(action)
+        if day_from:
+            where.append("day >= ?")
+            params.append(day_from)
+        if day_to:
+            where.append("day <= ?")
+            params.append(day_to)
+
+        sql = "SELECT offset, length FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY offset DESC" if newest_first else " ORDER BY offset"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        refs = self._db().execute(sql, params).fetchall()
+        return list(self._load(refs))
+
+    def history(self, dbid: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Histórico de uma linha do extrato (mais antigo primeiro)."""
+        return self.query(dbid=dbid, limit=limit)
+
+    def session(self, session_id: str) -> List[Dict[str, Any]]:
+        """Tudo que uma sessão (ex.: um "Aplicar Regras") alterou."""
+        return self.query(session_id=session_id)
+
+    def edits_by_user_month(
+        self,
+        *,
+        month: Optional[str] = None,
+        action: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Contagem de eventos por usuário e mês ('AAAA-MM'), só pelo índice."""
+        self.refresh()
+
+        where, params = [], []
+        if month:
+            where.append("month = ?")
+            params.append(month)
+        if action:
+            where.append("action = ?")
+            params.append(action)
+
+        sql = "SELECT username, month, action, COUNT(*) FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY username, month, action ORDER BY month DESC, username, action"
+
+        return [
+            {"username": u, "month": m, "action": a, "total": n}
+            for u, m, a, n in self._db().execute(sql, params).fetchall()
+        ]
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def _print_events(events: Sequence[Dict[str, Any]]) -> None:
+    for e in events:
+        print(
+            f"{str(e.get('ts_utc', ''))[:19]:<19}  {str(e.get('action', '')):<12} "
+            f"{str(e.get('username', '')):<14} dbid={e.get('dbid')}  "
+            f"% {e.get('pct_before')} -> {e.get('pct_after')}  "
+            f"R$ {e.get('valor_before')} -> {e.get('valor_after')}  {e.get('note') or ''}"
+        )
+    print(f"({len(events)} evento(s))")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Consulta o log de auditoria de comissões.")
+    ap.add_argument("--log", default=DEFAULT_LOG, help="caminho do comissoes_audit.jsonl")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("history", help="histórico de uma linha (DBId)")
+    p.add_argument("dbid", type=int)
+    p.add_argument("--limit", type=int)
+
+    p = sub.add_parser("session", help="eventos de uma sessão")
+    p.add_argument("session_id")
+
+    p = sub.add_parser("users", help="eventos por usuário e mês")
+    p.add_argument("--month", help="AAAA-MM")
+    p.add_argument("--action")
+
+    p = sub.add_parser("find", help="busca livre")
+    p.add_argument("--dbid", type=int)
+    p.add_argument("--user")
+    p.add_argument("--session")
+    p.add_argument("--action")
+    p.add_argument("--from", dest="day_from", help="AAAA-MM-DD")
+    p.add_argument("--to", dest="day_to", help="AAAA-MM-DD")
+    p.add_argument("--limit", type=int)
+
+    sub.add_parser("rebuild", help="reconstrói o índice do zero")
+
+    args = ap.parse_args(argv)
+    idx = AuditIndex(args.log)
+    try:
+        if args.cmd == "history":
+            _print_events(idx.history(args.dbid, limit=args.limit))
+        elif args.cmd == "session":
+            _print_events(idx.session(args.session_id))
+        elif args.cmd == "users":
+            rows = idx.edits_by_user_month(month=args.month, action=args.action)
+            for r in rows:
+                print(f"{r['month'] or '-':<8} {str(r['username'] or '-'):<20} {str(r['action'] or '-'):<14} {r['total']:>8}")
+        elif args.cmd == "find":
+            _print_events(idx.query(
+                dbid=args.dbid, username=args.user, session_id=args.session, action=args.action,
+                day_from=args.day_from, day_to=args.day_to, limit=args.limit,
+            ))
+        elif args.cmd == "rebuild":
+            print(f"{idx.rebuild()} evento(s) indexado(s)")
+    finally:
+        idx.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
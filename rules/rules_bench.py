@@ -0,0 +1,297 @@
+# rules/rules_bench.py
+"""
+Micro-benchmark do motor de regras (sem Qt e sem banco).
+
+Gera extratos sintéticos parecidos com o frame de TabExtrato.refresh_extrato
+e conjuntos de regras de tamanhos variados, e mede:
+  - engine:   apply_rules_to_row em loop sobre registros (dicts);
+  - memo:     MemoizedRuleEvaluator no mesmo loop (avaliação por assinatura);
+  - pipeline: rules_pipeline.apply_rules_to_frame (o fluxo de "Aplicar Regras").
+
+Uso:
+    python -m rules.rules_bench
+    python -m rules.rules_bench --rows 1000,10000 --rules 1,10,50 --repeat 3
+    python -m rules.rules_bench --json atual.json
+    python -m rules.rules_bench --baseline atual.json --tolerance 0.15
+
+Com --baseline o processo sai com código 1 se algum cenário ficar mais lento
+que a referência além da tolerância (serve para aceitar/rejeitar mudanças
+no engine).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from constants import PT_BR_MONTHS, VENDEDOR_EMAIL
+from rules.rules_engine import Condition, MemoizedRuleEvaluator, Rule, apply_rules_to_row
+from rules.rules_pipeline import apply_rules_to_frame
+
+
+UFS = ["CE", "PE", "PB", "RN", "PI", "MA", "BA", "AL", "SE", "SP", "RJ", "MG", "PA", "AM", "GO"]
+UF_PESOS = [30, 14, 10, 8, 6, 6, 6, 4, 3, 4, 2, 2, 2, 2, 1]
+
+ARTIGOS = [
+    "Cintra 22 mm", "Cintra 30 mm", "X Nillo 25 mm", "X Nillo 40 mm", "Jeri 40 mm",
+    "Jeri 25 mm", "Elástico Chato 10 mm", "Elástico Roliço 3 mm", "Viés 18 mm",
+    "Alça 12 mm", "Renda 50 mm", "Debrum 20 mm", "Fita Cetim 7 mm", "Galão 15 mm",
+]
+
+PRAZOS = [0, 14, 20, 28, 30, 35, 42, 45, 56, 60, 75, 90, 120]
+PRAZO_PESOS = [4, 3, 3, 10, 14, 6, 8, 10, 6, 12, 5, 6, 2]
+
+PCTS_PADRAO = [1.0, 1.5, 2.0, 3.0, 4.0, 5.0]
+MEIOS = ["Boleto", "PIX", "Cheque", "Depósito", "Cartão"]
+
+
+def _competencia(d: date) -> str:
+    return f"{PT_BR_MONTHS[d.month]}-{d.year}"
+
+
+def gerar_extrato_sintetico(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Gera um DataFrame no formato de TabExtrato.df_extrato (após refresh).
+    Distribuições aproximadas: poucos vendedores concentram o volume,
+    UFs do Nordeste predominam, preços de 0,20 a 1,50 e prazos em degraus.
+    """
+    rnd = random.Random(seed)
+    vendedores = list(VENDEDOR_EMAIL.keys())
+    vend_pesos = [1.0 / (i + 1) for i in range(len(vendedores))]
+    clientes = [f"Cliente Sintético {i:04d} Ltda" for i in range(max(50, n_rows // 20))]
+    base = date(2026, 1, 1)
+
+    rows: List[Dict[str, Any]] = []
+    for i in range(n_rows):
+        receb = base + timedelta(days=rnd.randint(0, 89))
+        emissao = receb - timedelta(days=rnd.randint(10, 120))
+        recebido = round(rnd.lognormvariate(7.0, 1.0), 2)
+        icmsst = round(recebido * rnd.choice([0.0, 0.0, 0.0, 0.04, 0.07]), 2)
+        frete = round(recebido * rnd.choice([0.0, 0.0, 0.01, 0.02]), 2)
+        rec_liq = round(recebido - icmsst - frete, 2)
+        pct_padrao = rnd.choice(PCTS_PADRAO)
+        preco_venda = round(rnd.uniform(0.20, 1.50), 4)
+
+        rows.append({
+            "DBId": 100000 + i,
+            "Competência": _competencia(receb),
+            "Validado": rnd.random() < 0.3,
+            "ID": 500000 + i // 3,
+            "Vendedor": rnd.choices(vendedores, weights=vend_pesos)[0],
+            "Titulo": f"{500000 + i // 3}-{i % 3 + 1}",
+            "Cliente": rnd.choice(clientes),
+            "UF": rnd.choices(UFS, weights=UF_PESOS)[0],
+            "Artigo": rnd.choice(ARTIGOS),
+            "Recebido": recebido,
+            "ICMSST": icmsst,
+            "Frete": frete,
+            "Rec Liquido": rec_liq,
+            # no extrato real vem do pyodbc como Decimal
+            "Prazo Médio": Decimal(str(rnd.choices(PRAZOS, weights=PRAZO_PESOS)[0])).quantize(Decimal("0.01")),
+            "Preço Médio": Decimal(str(round(preco_venda * rnd.uniform(0.9, 1.1), 4))),
+            "Preço Venda": Decimal(str(preco_venda)),
+            "M Pagamento": rnd.choice(MEIOS),
+            "Emissão": emissao.strftime("%d/%m/%Y"),
+            "Vencimento": (emissao + timedelta(days=30)).strftime("%d/%m/%Y"),
+            "Recebimento": receb.strftime("%d/%m/%Y"),
+            "% Percentual Padrão": pct_padrao,
+            "% Comissão": pct_padrao,
+            "Valor Comissão": round(rec_liq * pct_padrao / 100, 2),
+            "Observação": "",
+        })
+
+    return pd.DataFrame(rows)
+
+
+def gerar_regras_sinteticas(n_rules: int, seed: int = 7) -> List[Rule]:
+    """
+    Gera regras com 1 a 3 condições sobre Vendedor/UF/Artigo/Prazo/Preço,
+    no mesmo formato que o RuleEditorDialog produz.
+    """
+    rnd = random.Random(seed)
+    vendedores = list(VENDEDOR_EMAIL.keys())
+
+    geradores: List[Callable[[], Condition]] = [
+        lambda: Condition("Vendedor", "==", rnd.choice(vendedores)),
+        lambda: Condition("UF", "==", rnd.choice(UFS)),
+        lambda: Condition("UF", "in", rnd.sample(UFS, 3)),
+        lambda: Condition("Artigo", "==", rnd.choice(ARTIGOS)),
+        lambda: Condition("Prazo Médio", rnd.choice([">", ">=", "<", "<="]), rnd.choice([28, 30, 45, 60, 90])),
+        lambda: Condition("Preço Venda", rnd.choice([">", "<"]), round(rnd.uniform(0.3, 1.2), 2)),
+    ]
+
+    rules: List[Rule] = []
+    for i in range(n_rules):
+        conds = [rnd.choice(geradores)() for _ in range(rnd.randint(1, 3))]
+        rules.append(Rule(
+            name=f"Regra {i + 1:03d}",
+            priority=rnd.randint(0, 100),
+            conditions=conds,
+            set_percentual=rnd.choice([0.5, 1.0, 1.5, 2.0, 2.5, 3.0]),
+            note="",
+            stop_on_match=rnd.random() < 0.85,
+        ))
+    return rules
+
+
+def _medir(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Melhor tempo de `repeat` execuções + pico de memória (tracemalloc) de uma execução."""
+    tempos = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"segundos": min(tempos), "pico_mb": pico / (1024 * 1024)}
+
+
+def rodar_cenario(n_rows: int, n_rules: int, repeat: int = 3, seed: int = 42) -> Dict[str, Any]:
+    df = gerar_extrato_sintetico(n_rows, seed=seed)
+    rules = gerar_regras_sinteticas(n_rules, seed=seed + n_rules)
+    records = df.to_dict("records")
+
+    def engine():
+        for row in records:
+            apply_rules_to_row(row, rules)
+
+    def memo():
+        avaliar = MemoizedRuleEvaluator(rules)
+        for row in records:
+            avaliar(row)
+
+    def pipeline():
+        apply_rules_to_frame(df, rules, username="bench", session_id="bench")
+
+    # a memoização não pode mudar o resultado
+    avaliar = MemoizedRuleEvaluator(rules)
+    for row in records:
+        if avaliar(row) != apply_rules_to_row(row, rules):
+            raise AssertionError(f"memo divergiu do engine na linha {row.get('DBId')}")
+
+    out: Dict[str, Any] = {"rows": n_rows, "rules": n_rules}
+    for nome, fn in (("engine", engine), ("memo", memo), ("pipeline", pipeline)):
+        m = _medir(fn, repeat)
+        out[nome] = {
+            "segundos": round(m["segundos"], 6),
+            "rows_per_s": round(n_rows / m["segundos"], 1) if m["segundos"] > 0 else float("inf"),
+            "pico_mb": round(m["pico_mb"], 3),
+        }
+    return out
+
+
+def _parse_lista(txt: str) -> List[int]:
+    return [int(x) for x in txt.replace(";", ",").split(",") if x.strip()]
+
+
+def _imprimir(resultados: Sequence[Dict[str, Any]]) -> None:
+    print(
+        f"{'linhas':>8} {'regras':>7} | {'engine rows/s':>14} {'MB':>8} | "
+        f"{'memo rows/s':>12} {'MB':>8} | {'pipeline rows/s':>16} {'MB':>8}"
+    )
+    print("-" * 96)
+    for r in resultados:
+        e, m, p = r["engine"], r["memo"], r["pipeline"]
+        print(
+            f"{r['rows']:>8} {r['rules']:>7} | {e['rows_per_s']:>14,.0f} {e['pico_mb']:>8.2f} | "
+            f"{m['rows_per_s']:>12,.0f} {m['pico_mb']:>8.2f} | "
+            f"{p['rows_per_s']:>16,.0f} {p['pico_mb']:>8.2f}"
+        )
+
+
+def _imprimir_escala(resultados: Sequence[Dict[str, Any]]) -> None:
+    """Curva de escala: custo por linha (µs) normalizado pelo menor cenário."""
+    if len(resultados) < 2:
+        return
+    ref = min(resultados, key=lambda r: (r["rows"], r["rules"]))
+    ref_us = ref["pipeline"]["segundos"] / ref["rows"] * 1e6
+    print()
+    print("Escala do pipeline (µs por linha; fator vs menor cenário):")
+    for r in resultados:
+        us = r["pipeline"]["segundos"] / r["rows"] * 1e6
+        fator = us / ref_us if ref_us else 0.0
+        print(f"  {r['rows']:>8} linhas x {r['rules']:>4} regras: {us:>9.2f} µs  (x{fator:.2f})")
+
+
+def comparar_com_baseline(
+    resultados: Sequence[Dict[str, Any]],
+    baseline: Sequence[Dict[str, Any]],
+    tolerance: float,
+) -> List[str]:
+    """Retorna a lista de regressões (cenários mais lentos que baseline * (1 + tolerance))."""
+    ref = {(b["rows"], b["rules"]): b for b in baseline}
+    regressoes = []
+    for r in resultados:
+        b = ref.get((r["rows"], r["rules"]))
+        if b is None:
+            continue
+        for nome in ("engine", "memo", "pipeline"):
+            if nome not in r or nome not in b:
+                continue
+            atual = r[nome]["segundos"]
+            antes = b[nome]["segundos"]
+            if antes > 0 and atual > antes * (1 + tolerance):
+                regressoes.append(
+                    f"{nome} {r['rows']}x{r['rules']}: {antes:.4f}s -> {atual:.4f}s (+{(atual / antes - 1) * 100:.0f}%)"
+                )
+    return regressoes
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark do motor de regras de comissão")
+    ap.add_argument("--rows", default="1000,5000,20000", help="tamanhos de extrato (lista separada por vírgula)")
+    ap.add_argument("--rules", default="1,10,50", help="quantidade de regras (lista separada por vírgula)")
+    ap.add_argument("--repeat", type=int, default=3, help="repetições por cenário (vale o melhor tempo)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", dest="json_out", help="salva os resultados em JSON")
+    ap.add_argument("--baseline", help="JSON de uma execução anterior para comparação")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="piora aceitável vs baseline (0.15 = 15%%)")
+    args = ap.parse_args(argv)
+
+    resultados = []
+    for n_rows in _parse_lista(args.rows):
+        for n_rules in _parse_lista(args.rules):
+            resultados.append(rodar_cenario(n_rows, n_rules, repeat=max(1, args.repeat), seed=args.seed))
+
+    _imprimir(resultados)
+    _imprimir_escala(resultados)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados salvos em {args.json_out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressoes = comparar_com_baseline(resultados, baseline, args.tolerance)
+        if regressoes:
+            print("\nREGRESSÕES:")
+            for r in regressoes:
+                print(f"  - {r}")
+            return 1
+        print("\nSem regressões em relação ao baseline.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,12 @@
 # rules_engine.py
 from __future__ import annotations
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
+from decimal import Decimal
 from typing import Any, Dict, List, Optional, Tuple
 
+from rules.rules_versions import rule_id
+
 @dataclass
 class Condition:
     field: str
@@ -56,17 +60,19 @@ class Rule:
     set_percentual: Optional[float] = None   # define o % comissão
     add_percentual: Optional[float] = None   # soma ao % comissão (ex: +1.0)
     note: str = ""
+    id: str = ""                               # hash do conteúdo (rules_versions.rule_id)
 
-def apply_rules_to_row(row: Dict[str, Any], rules: List[Rule]) -> Tuple[float, str]:
-    """
-    Retorna: (pct_aplicado, motivo)
-    Convenção: percentuais são INTEIROS (5.0 = 5%)
-    """
+def sort_rules(rules: List[Rule]) -> List[Rule]:
+    """Regras habilitadas na ordem de avaliação (prioridade desc, ordem estável)."""
+    return sorted([r for r in rules if r.enabled], key=lambda r: r.priority, reverse=True)
+
+
+def _apply_sorted(row: Dict[str, Any], rules_sorted: List[Rule]) -> Tuple[float, str, Optional[str]]:
     pct_padrao = float(row.get("% Percentual Padrão") or 0.0)
     pct_atual = float(row.get("% Comissão") or pct_padrao or 0.0)
 
     motivos: List[str] = []
-    rules_sorted = sorted([r for r in rules if r.enabled], key=lambda r: r.priority, reverse=True)
+    regra_id: Optional[str] = None
 
     for rule in rules_sorted:
         conds = rule.conditions or []
@@ -81,8 +87,167 @@ def apply_rules_to_row(row: Dict[str, Any], rules: List[Rule]) -> Tuple[float, s
             if rule.note:
                 msg += f" {rule.note}"
             motivos.append(msg)
+            regra_id = rule.id or None
 
             if rule.stop_on_match:
                 break
 
-    return pct_atual, " | ".join(motivos) if motivos else ""
+    return pct_atual, " | ".join(motivos) if motivos else "", regra_id
+
+
+def apply_rules_to_row(row: Dict[str, Any], rules: List[Rule]) -> Tuple[float, str]:
+    """
+    Retorna: (pct_aplicado, motivo)
+    Convenção: percentuais são INTEIROS (5.0 = 5%)
+    """
+    return _apply_sorted(row, sort_rules(rules))[:2]
+
+
+def referenced_fields(rules: List[Rule]) -> List[str]:
+    """Campos usados nas condições das regras habilitadas (ordem de aparição)."""
+    out: List[str] = []
+    for rule in sort_rules(rules):
+        for c in rule.conditions or []:
+            if c.field not in out:
+                out.append(c.field)
+    return out
+
+
+def _is_number(v: Any) -> bool:
+    return isinstance(v, (int, float, Decimal)) and not isinstance(v, bool)
+
+
+_NAN_KEY = ("nan",)
+_NONE_KEY = ("none",)
+
+
+class MemoizedRuleEvaluator:
+    """
+    Avalia regras com memoização por assinatura da linha.
+
+    A assinatura só usa os campos referenciados pelas condições, mais o
+    % base (que entra no cálculo e no motivo). Campos numéricos entram como
+    a "faixa" do valor entre os limiares usados nas regras (ex.: Prazo Médio
+    30 e 35 caem na mesma faixa se a única condição é "> 45"), então linhas
+    diferentes com o mesmo resultado compartilham a mesma avaliação.
+
+    Se as primeiras AMOSTRA assinaturas quase não se repetem, o cache é
+    desligado e as linhas restantes são avaliadas direto.
+    """
+
+    AMOSTRA = 512
+
+    def __init__(self, rules: List[Rule]):
+        self.rules_sorted = sort_rules(rules)
+        self.fields = referenced_fields(self.rules_sorted)
+        self._thresholds: Dict[str, List[Any]] = {}
+        self._cache: Dict[Tuple[Any, ...], Tuple[float, str, Optional[str]]] = {}
+        self._keys: Dict[str, Dict[Any, Any]] = {f: {} for f in self.fields}
+        self.hits = 0
+        self.misses = 0
+        self.ativo = True
+
+        for rule in self.rules_sorted:
+            for c in rule.conditions or []:
+                vals = c.value if isinstance(c.value, (list, tuple, set)) else [c.value]
+                nums = [v for v in vals if _is_number(v) and v == v]
+                if nums:
+                    self._thresholds.setdefault(c.field, []).extend(nums)
+
+        for field, nums in self._thresholds.items():
+            self._thresholds[field] = sorted(set(nums), key=float)
+
+    def _field_key(self, field: str, v: Any) -> Any:
+        if v is None:
+            return _NONE_KEY
+        if isinstance(v, str):
+            return v.strip().upper()
+        if _is_number(v):
+            if v != v:
+                return _NAN_KEY
+            th = self._thresholds.get(field)
+            if th is not None:
+                # posição relativa aos limiares (igualdade separa as faixas)
+                return ("n", bisect_left(th, v), bisect_right(th, v))
+            return ("n", v)
+        try:
+            hash(v)
+            return v
+        except TypeError:
+            return repr(v)
+
+    def _cached_field_key(self, field: str, v: Any) -> Any:
+        cache = self._keys[field]
+        try:
+            return cache[v]
+        except KeyError:
+            k = cache[v] = self._field_key(field, v)
+            return k
+        except TypeError:
+            # valor não-hashable
+            return self._field_key(field, v)
+
+    def signature(self, row: Dict[str, Any]) -> Tuple[Any, ...]:
+        pct_padrao = float(row.get("% Percentual Padrão") or 0.0)
+        pct_base = float(row.get("% Comissão") or pct_padrao or 0.0)
+        if pct_base != pct_base:
+            pct_base = _NAN_KEY
+        return (pct_base,) + tuple(self._cached_field_key(f, row.get(f)) for f in self.fields)
+
+    def __call__(self, row: Dict[str, Any]) -> Tuple[float, str]:
+        return self.avaliar(row)[:2]
+
+    def avaliar(self, row: Dict[str, Any]) -> Tuple[float, str, Optional[str]]:
+        """Como __call__, mas devolve também o id da última regra aplicada."""
+        if not self.ativo:
+            return _apply_sorted(row, self.rules_sorted)
+
+        try:
+            key = self.signature(row)
+        except Exception:
+            return _apply_sorted(row, self.rules_sorted)
+
+        hit = self._cache.get(key)
+        if hit is not None:
+            self.hits += 1
+            return hit
+
+        self.misses += 1
+        hit = _apply_sorted(row, self.rules_sorted)
+        self._cache[key] = hit
+
+        # quase toda linha é única: a assinatura só custa, desliga o cache
+        if self.misses == self.AMOSTRA and self.hits < self.AMOSTRA // 4:
+            self.ativo = False
+            self._cache.clear()
+        return hit
+
+
+def rules_from_dicts(rules_raw: List[Dict[str, Any]]) -> List[Rule]:
+    """
+    Converte regras no formato do rules.json em objetos Rule/Condition.
+    Regras inválidas são ignoradas (com aviso no console).
+    """
+    rules_objs: List[Rule] = []
+
+    for r in rules_raw:
+        try:
+            conditions = []
+            for c in (r.get("conditions") or []):
+                conditions.append(Condition(c.get("field"), c.get("op"), c.get("value")))
+
+            rules_objs.append(
+                Rule(
+                    name=r.get("name", "Sem nome"),
+                    priority=int(r.get("priority") or 0),
+                    conditions=conditions,
+                    set_percentual=r.get("set_percentual"),
+                    note=r.get("note", ""),
+                    stop_on_match=bool(r.get("stop_on_match", True)),
+                    id=rule_id(r),
+                )
+            )
+        except Exception as e:
+            print(f"⚠️ Regra inválida no JSON: {r} | erro={e}")
+
+    return rules_objs
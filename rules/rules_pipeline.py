@@ -0,0 +1,150 @@
+# rules/rules_pipeline.py
+"""
+Pipeline de aplicação de regras sobre o DataFrame do extrato.
+
+É o miolo de TabExtrato._aplicar_regras_teste, sem Qt e sem banco:
+recebe o frame em tela + regras e devolve o frame recalculado e os
+eventos de auditoria (quem grava os eventos é o chamador).
+
+A proveniência vai para as colunas RegraVersao / RegraId / Regra (nome);
+a Observação não é mais alterada pelas regras.
+"""
+from __future__ import annotations
+
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from rules.rules_audit import build_edit_event
+from rules.rules_engine import MemoizedRuleEvaluator, Rule
+from utils.formatters import br_to_decimal
+
+
+def _to_dec(v: Any, places: int) -> Decimal:
+    exp = Decimal("1").scaleb(-places)
+    try:
+        if isinstance(v, str):
+            return br_to_decimal(v, places)
+        return Decimal(str(float(v))).quantize(exp, rounding=ROUND_HALF_UP)
+    except Exception:
+        return exp * 0
+
+
+def apply_rules_to_frame(
+    df: pd.DataFrame,
+    rules: List[Rule],
+    *,
+    username: str = "",
+    session_id: str = "",
+    versao: str = "",
+) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """
+    Aplica as regras linha a linha e recalcula as colunas derivadas.
+
+    A avaliação é memoizada por assinatura (ver MemoizedRuleEvaluator):
+    linhas com os mesmos campos relevantes reaproveitam o resultado.
+
+    Todas as linhas recebem RegraVersao = versao; RegraId/Regra ficam com a
+    última regra aplicada na linha (None se nenhuma bateu).
+
+    Returns:
+        (df_novo, eventos) — eventos só para linhas cujo % ou valor mudou.
+    """
+    if "% Percentual Padrão" not in df.columns:
+        raise ValueError("Coluna '% Percentual Padrão' não encontrada.")
+
+    df = df.copy()
+
+    if "% Comissão" not in df.columns:
+        df["% Comissão"] = df["% Percentual Padrão"]
+
+    if "Valor Comissão" not in df.columns:
+        df["Valor Comissão"] = 0.0
+
+    has_rec = "Rec Liquido" in df.columns
+    has_dbid = "DBId" in df.columns
+
+    new_pct: List[float] = []
+    new_regra: List[Optional[str]] = []
+    new_val: List[float] = []
+    events: List[Dict[str, Any]] = []
+
+    avaliar = MemoizedRuleEvaluator(rules)
+    nomes = {r.id: r.name for r in rules if r.id}
+
+    for row in df.to_dict("records"):
+        pct_before = row.get("% Comissão")
+        valor_before = row.get("Valor Comissão")
+
+        pct_aplicado, motivo, regra_id = avaliar.avaliar(row)
+        new_pct.append(pct_aplicado)
+        new_regra.append(regra_id)
+
+        val_calc = None
+        if has_rec:
+            rec_d = _to_dec(row.get("Rec Liquido", 0), 2)
+            pct_d = _to_dec(pct_aplicado, 4)
+            val_calc = (rec_d * pct_d / Decimal("100")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+            new_val.append(float(val_calc))
+        else:
+            new_val.append(float(valor_before or 0))
+
+        pct_after = pct_aplicado
+        valor_after = float(val_calc) if val_calc is not None else float(valor_before or 0)
+
+        if str(pct_before) != str(pct_after) or str(valor_before) != str(valor_after):
+            # contexto reduzido
+            ctx = {
+                "session_id": session_id,
+                "rule_result": motivo,
+                "rule_id": regra_id,
+                "rule_version": versao,
+                "Vendedor": row.get("Vendedor"),
+                "Cliente": row.get("Cliente"),
+                "UF": row.get("UF"),
+                "Artigo": row.get("Artigo"),
+                "Prazo Médio": row.get("Prazo Médio"),
+                "Competência": row.get("Competência"),
+            }
+            events.append(build_edit_event(
+                username=username,
+                dbid=row.get("DBId") if has_dbid else None,
+                row_context=ctx,
+                pct_before=pct_before,
+                pct_after=pct_after,
+                valor_before=valor_before,
+                valor_after=valor_after,
+                action="apply_rules",
+                note=motivo or "regra aplicada",
+            ))
+
+    df["% Comissão"] = (
+        pd.to_numeric(pd.Series(new_pct, index=df.index), errors="coerce")
+        .fillna(0)
+        .round(4)
+    )
+    df["RegraId"] = new_regra
+    df["RegraVersao"] = versao or None
+    df["Regra"] = [nomes.get(rid, rid) if rid else "" for rid in new_regra]
+    df["Valor Comissão"] = pd.to_numeric(pd.Series(new_val, index=df.index), errors="coerce").fillna(0).round(2)
+
+    if "Recebido" not in df.columns:
+        df["Recebido"] = 0
+
+    df["Valor Comissão Padrão"] = (
+        pd.to_numeric(df["Recebido"], errors="coerce").fillna(0)
+        * (pd.to_numeric(df["% Percentual Padrão"], errors="coerce").fillna(0) / 100)
+    ).round(2)
+
+    df["% Diferença"] = (
+        pd.to_numeric(df["% Comissão"], errors="coerce").fillna(0)
+        - pd.to_numeric(df["% Percentual Padrão"], errors="coerce").fillna(0)
+    ).round(4)
+
+    df["Diferença R$"] = (
+        pd.to_numeric(df["Valor Comissão"], errors="coerce").fillna(0)
+        - pd.to_numeric(df["Valor Comissão Padrão"], errors="coerce").fillna(0)
+    ).round(2)
+
+    return df, events
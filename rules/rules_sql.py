@@ -0,0 +1,288 @@
+# rules/rules_sql.py
+"""
+Tradução do conjunto de regras (rules_engine) para um UPDATE set-based
+em dbo.Stik_Extrato_Comissoes.
+
+A semântica acompanha apply_rules_to_row:
+  - regras habilitadas avaliadas por prioridade (desc), na mesma ordem estável;
+  - set_percentual / add_percentual aplicados em sequência;
+  - stop_on_match interrompe a cadeia;
+  - motivo no formato "Nome (antes→depois) nota", unido por " | ";
+  - RegraId = última regra aplicada na linha.
+
+Todas as linhas do escopo recebem RegraVersao (versão avaliada); % e valor
+só mudam onde alguma regra bateu. A Observação não é mais alterada — o
+motivo vai para a auditoria.
+
+Cada regra vira um CROSS APPLY encadeado (um passo por regra), então o
+servidor avalia as condições uma única vez por linha, sem trafegar dados.
+"""
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from rules.rules_engine import Condition, Rule, sort_rules
+
+
+# campo exibido no extrato -> (tipo, expressão SQL sobre o alias E)
+RULE_FIELD_COLUMNS: Dict[str, Tuple[str, str]] = {
+    "ID": ("num", "E.Doc"),
+    "VendedorID": ("num", "E.VendedorID"),
+    "Vendedor": ("text", "E.Vendedor"),
+    "Titulo": ("text", "E.Titulo"),
+    "Cliente": ("text", "E.Cliente"),
+    "UF": ("text", "E.UF"),
+    "Artigo": ("text", "E.Artigo"),
+    "Linha": ("text", "E.Linha"),
+    "Recebido": ("num", "E.Recebido"),
+    "ICMSST": ("num", "E.ICMSST"),
+    "Frete": ("num", "E.Frete"),
+    "Rec Liquido": ("num", "E.RecebimentoLiq"),
+    "Prazo Médio": ("num", "E.PrazoMedio"),
+    "Preço Médio": ("num", "E.PrecoMedio"),
+    "Preço Venda": ("num", "E.PrecoVenda"),
+    "M Pagamento": ("text", "E.MeioPagamento"),
+    "Emissão": ("text", "CONVERT(VARCHAR(10), E.Emissao, 103)"),
+    "Vencimento": ("text", "CONVERT(VARCHAR(10), E.Vencimento, 103)"),
+    "Recebimento": ("text", "CONVERT(VARCHAR(10), E.DataRecebimento, 103)"),
+    "Competência": (
+        "text",
+        "CONCAT(CHOOSE(MONTH(E.DataRecebimento), 'Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', "
+        "'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez'), '-', YEAR(E.DataRecebimento))",
+    ),
+    "% Percentual Padrão": ("num", "E.Percentual_Comissao"),
+    "% Comissão": ("num", "E.PercComissao"),
+    "Valor Comissão": ("num", "E.ValorComissao"),
+    "Observação": ("text", "E.Observacao"),
+}
+
+_ORDER_OPS = {">": ">", ">=": ">=", "<": "<", "<=": "<="}
+
+_FALSE = "1 = 0"
+_TRUE = "1 = 1"
+
+
+def _is_number(v: Any) -> bool:
+    return isinstance(v, (int, float, Decimal)) and not isinstance(v, bool)
+
+
+def _condition_sql(cond: Condition) -> Tuple[str, List[Any]]:
+    """
+    Converte uma Condition em predicado SQL + parâmetros.
+    Combinações que no Python resultariam em False (tipos incompatíveis,
+    operador desconhecido) viram um predicado constante equivalente.
+    """
+    if cond.field not in RULE_FIELD_COLUMNS:
+        raise ValueError(f"Campo '{cond.field}' não suportado no modo servidor.")
+
+    kind, col = RULE_FIELD_COLUMNS[cond.field]
+    expr = f"UPPER(LTRIM(RTRIM({col})))" if kind == "text" else col
+    val = cond.value
+    op = cond.op
+
+    if isinstance(val, str):
+        val_cmp: Any = val.strip().upper()
+        compatible = kind == "text"
+    elif _is_number(val):
+        val_cmp = val
+        compatible = kind == "num"
+    else:
+        val_cmp = val
+        compatible = False
+
+    if op == "in":
+        if isinstance(val, (list, tuple, set)):
+            # no engine os itens da lista não são normalizados
+            if kind == "text":
+                items = [i for i in val if isinstance(i, str) and i == i.strip().upper()]
+            else:
+                items = [i for i in val if _is_number(i)]
+            if not items:
+                return _FALSE, []
+            marks = ", ".join("?" for _ in items)
+            return f"{expr} IN ({marks})", list(items)
+        if isinstance(val, str) and kind == "text":
+            # "valor da linha" contido no texto da regra
+            return f"({expr} IS NOT NULL AND (LEN({expr}) = 0 OR CHARINDEX({expr}, ?) > 0))", [val_cmp]
+        return _FALSE, []
+
+    if op == "==":
+        if not compatible:
+            return _FALSE, []
+        return f"{expr} = ?", [val_cmp]
+
+    if op == "!=":
+        if not compatible:
+            return _TRUE, []
+        return f"({expr} IS NULL OR {expr} <> ?)", [val_cmp]
+
+    if op in _ORDER_OPS:
+        if not compatible:
+            return _FALSE, []
+        return f"{expr} {_ORDER_OPS[op]} ?", [val_cmp]
+
+    return _FALSE, []
+
+
+def _rule_step_sql(idx: int, rule: Rule) -> Tuple[str, List[Any]]:
+    """
+    Um passo da cadeia: S{idx} calculado a partir de S{idx-1}.
+    """
+    prev = f"S{idx - 1}"
+    params: List[Any] = []
+
+    preds = []
+    for cond in rule.conditions or []:
+        sql, p = _condition_sql(cond)
+        preds.append(sql)
+        params.extend(p)
+    match = " AND ".join(f"({p})" for p in preds) if preds else _TRUE
+
+    pct_expr = f"{prev}.Pct"
+    pct_params: List[Any] = []
+    if rule.set_percentual is not None:
+        pct_expr = "CAST(? AS FLOAT)"
+        pct_params.append(float(rule.set_percentual))
+    if rule.add_percentual is not None:
+        pct_expr = f"({pct_expr} + CAST(? AS FLOAT))"
+        pct_params.append(float(rule.add_percentual))
+
+    note = f" {rule.note}" if rule.note else ""
+    stop = "1" if rule.stop_on_match else f"{prev}.Parou"
+
+    sql = f"""
+    CROSS APPLY (
+        SELECT CASE WHEN {prev}.Parou = 0 AND {match} THEN 1 ELSE 0 END AS Bateu
+    ) M{idx}
+    CROSS APPLY (
+        SELECT
+            CASE WHEN M{idx}.Bateu = 1 THEN {pct_expr} ELSE {prev}.Pct END AS Pct,
+            CASE WHEN M{idx}.Bateu = 1 THEN {stop} ELSE {prev}.Parou END AS Parou,
+            CASE WHEN M{idx}.Bateu = 1 THEN {prev}.Aplicou + 1 ELSE {prev}.Aplicou END AS Aplicou,
+            CASE WHEN M{idx}.Bateu = 1 THEN CAST(? AS VARCHAR(8)) ELSE {prev}.RegraId END AS RegraId,
+            {prev}.Pct AS PctAntes,
+            M{idx}.Bateu AS Bateu
+    ) P{idx}
+    CROSS APPLY (
+        SELECT
+            P{idx}.Pct, P{idx}.Parou, P{idx}.Aplicou, P{idx}.RegraId,
+            CASE WHEN P{idx}.Bateu = 1 THEN CONCAT(
+                {prev}.Motivo,
+                CASE WHEN {prev}.Aplicou > 0 THEN N' | ' ELSE N'' END,
+                CAST(? AS NVARCHAR(200)), N' (',
+                CONVERT(VARCHAR(32), CAST(P{idx}.PctAntes AS DECIMAL(18, 4))), N'→',
+                CONVERT(VARCHAR(32), CAST(P{idx}.Pct AS DECIMAL(18, 4))), N')',
+                CAST(? AS NVARCHAR(500))
+            ) ELSE {prev}.Motivo END AS Motivo
+    ) S{idx}
+    """
+    return sql, params + pct_params + [rule.id or None, rule.name, note]
+
+
+def build_rules_update_sql(
+    rules: List[Rule],
+    data_ini: date,
+    data_fim: date,
+    vendedor: Optional[str] = None,
+    *,
+    versao: str,
+    somente_desatualizadas: bool = False,
+) -> Tuple[str, List[Any]]:
+    """
+    Monta (sql, params) do UPDATE set-based para o escopo informado.
+
+    Só atinge linhas não consolidadas. Com somente_desatualizadas=True,
+    só as linhas cuja RegraVersao difere de `versao` (índice filtrado
+    IX_Stik_Extrato_RegraVersao). O lote termina com um SELECT das linhas
+    em que alguma regra bateu (antes/depois), usado na auditoria em bloco.
+    """
+    rules_sorted = sort_rules(rules)
+    if not rules_sorted:
+        raise ValueError("Nenhuma regra habilitada para aplicar.")
+
+    steps: List[str] = []
+    params: List[Any] = [versao]
+    for i, rule in enumerate(rules_sorted, 1):
+        sql, p = _rule_step_sql(i, rule)
+        steps.append(sql)
+        params.extend(p)
+
+    last = f"S{len(rules_sorted)}"
+
+    scope_sql = "E.Consolidado = 0 AND E.DataRecebimento BETWEEN ? AND ?"
+    params.extend([data_ini, data_fim])
+    if vendedor:
+        scope_sql += " AND E.Vendedor = ?"
+        params.append(vendedor)
+    if somente_desatualizadas:
+        scope_sql += " AND (E.RegraVersao IS NULL OR E.RegraVersao <> ?)"
+        params.append(versao)
+
+    sql = f"""
+    SET NOCOUNT ON;
+
+    DECLARE @saida TABLE (
+        Id INT, PctAntes DECIMAL(18, 4), PctDepois DECIMAL(18, 4),
+        ValorAntes DECIMAL(18, 2), ValorDepois DECIMAL(18, 2), Motivo NVARCHAR(MAX),
+        Vendedor NVARCHAR(200), Cliente NVARCHAR(200), UF VARCHAR(2), Artigo NVARCHAR(200),
+        PrazoMedio DECIMAL(18, 2), DataRecebimento DATE, RegraId VARCHAR(8), Aplicou INT
+    );
+    DECLARE @versao VARCHAR(12) = ?;
+
+    UPDATE E
+       SET PercComissao = CASE WHEN {last}.Aplicou > 0 THEN ROUND({last}.Pct, 4) ELSE E.PercComissao END,
+           ValorComissao = CASE WHEN {last}.Aplicou > 0
+                                THEN ROUND(CAST(ISNULL(E.RecebimentoLiq, 0) AS DECIMAL(18, 2))
+                                           * CAST(ROUND({last}.Pct, 4) AS DECIMAL(18, 4)) / 100, 2)
+                                ELSE E.ValorComissao END,
+           RegraVersao = @versao,
+           RegraId = {last}.RegraId
+    OUTPUT inserted.Id, deleted.PercComissao, inserted.PercComissao,
+           deleted.ValorComissao, inserted.ValorComissao, {last}.Motivo,
+           inserted.Vendedor, inserted.Cliente, inserted.UF, inserted.Artigo,
+           inserted.PrazoMedio, inserted.DataRecebimento, inserted.RegraId, {last}.Aplicou
+      INTO @saida
+    FROM dbo.Stik_Extrato_Comissoes E
+    CROSS APPLY (
+        SELECT CAST(COALESCE(NULLIF(E.PercComissao, 0), NULLIF(E.Percentual_Comissao, 0), 0) AS FLOAT) AS Pct,
+               0 AS Parou, 0 AS Aplicou, CAST(NULL AS VARCHAR(8)) AS RegraId,
+               CAST(N'' AS NVARCHAR(MAX)) AS Motivo
+    ) S0
+    {''.join(steps)}
+    WHERE {scope_sql};
+
+    SELECT Id, PctAntes, PctDepois, ValorAntes, ValorDepois, Motivo,
+           Vendedor, Cliente, UF, Artigo, PrazoMedio, DataRecebimento, RegraId
+    FROM @saida
+    WHERE Aplicou > 0;
+    """
+    return sql, params
+
+
+def aplicar_regras_no_servidor(
+    cur,
+    rules: List[Rule],
+    data_ini: date,
+    data_fim: date,
+    vendedor: Optional[str] = None,
+    *,
+    versao: str,
+    somente_desatualizadas: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Executa o UPDATE no cursor informado (o commit fica com o chamador)
+    e devolve as linhas em que alguma regra bateu, como dicts.
+    """
+    sql, params = build_rules_update_sql(
+        rules, data_ini, data_fim, vendedor,
+        versao=versao, somente_desatualizadas=somente_desatualizadas,
+    )
+    cur.execute(sql, params)
+    while cur.description is None and cur.nextset():
+        pass
+    if cur.description is None:
+        return []
+    cols = [d[0] for d in cur.description]
+    return [dict(zip(cols, r)) for r in cur.fetchall()]
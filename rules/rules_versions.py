@@ -0,0 +1,165 @@
+# rules/rules_versions.py
+"""
+Versionamento do rules.json.
+
+Cada conjunto de regras aplicado vira um snapshot imutável em
+rules/versions/<versao>.json, onde <versao> é o hash do conteúdo
+normalizado. O snapshot também vai para o servidor (dbo.Stik_Regras_Versoes)
+na mesma transação que grava linhas com a versão; cada máquina baixa para a
+pasta local os que não tem (fetch_missing_snapshots). O extrato guarda por linha a versão (RegraVersao) e a regra
+que definiu o % (RegraId), então dá para saber de onde veio cada
+percentual e reaplicar só o que está desatualizado.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from rules.rules_store import ensure_parent_dir, normalize_rules
+
+VERSION_LEN = 12
+RULE_ID_LEN = 8
+
+# versao -> {rule_id: nome}
+_names_cache: Dict[str, Dict[str, str]] = {}
+
+
+def _canonical(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _sha(text: str, size: int) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:size]
+
+
+def rule_id(rule: Dict[str, Any]) -> str:
+    """Id curto e estável da regra (hash do conteúdo)."""
+    return _sha(_canonical(rule), RULE_ID_LEN)
+
+
+def rules_version(rules: List[Dict[str, Any]]) -> str:
+    """Hash do conjunto de regras normalizado (independe da ordem no arquivo)."""
+    return _sha(_canonical(normalize_rules(rules)), VERSION_LEN)
+
+
+def versions_dir(rules_path: str) -> str:
+    return os.path.join(os.path.dirname(rules_path) or ".", "versions")
+
+
+def snapshot_rules(rules_path: str, rules: List[Dict[str, Any]]) -> str:
+    """
+    Grava o snapshot da versão (se ainda não existir) e retorna a versão.
+    O timestamp registrado é o da primeira vez que a versão foi aplicada.
+    """
+    rules = normalize_rules(rules)
+    versao = rules_version(rules)
+    path = os.path.join(versions_dir(rules_path), f"{versao}.json")
+    if os.path.exists(path):
+        return versao
+
+    _write_snapshot(path, {
+        "version": versao,
+        "created_utc": datetime.now(timezone.utc).isoformat(),
+        "rules": [dict(r, id=rule_id(r)) for r in rules],
+    })
+    return versao
+
+
+def _write_snapshot(path: str, payload: Dict[str, Any]) -> None:
+    ensure_parent_dir(path)
+    fd, tmp_path = tempfile.mkstemp(prefix="version_", suffix=".tmp", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except Exception:
+                pass
+
+
+def load_snapshot(rules_path: str, versao: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(versions_dir(rules_path), f"{versao}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else None
+    except Exception:
+        return None
+
+
+def rule_names(rules_path: str, versoes: Iterable[str]) -> Dict[str, str]:
+    """
+    Mapa rule_id -> nome juntando os snapshots das versões informadas.
+    Snapshots são imutáveis, então ficam em cache no processo.
+    """
+    out: Dict[str, str] = {}
+    for versao in versoes:
+        if not versao:
+            continue
+        nomes = _names_cache.get(versao)
+        if nomes is None:
+            snap = load_snapshot(rules_path, versao) or {}
+            nomes = {
+                str(r.get("id")): str(r.get("name") or "")
+                for r in snap.get("rules") or []
+                if isinstance(r, dict) and r.get("id")
+            }
+            if snap:
+                _names_cache[versao] = nomes
+        out.update(nomes)
+    return out
+
+
+# ============================================================
+# Snapshots no servidor
+# ============================================================
+
+SNAPSHOT_INSERT_SQL = """
+INSERT INTO dbo.Stik_Regras_Versoes (Versao, Snapshot)
+SELECT ?, ?
+WHERE NOT EXISTS (SELECT 1 FROM dbo.Stik_Regras_Versoes WITH (UPDLOCK, HOLDLOCK) WHERE Versao = ?)
+"""
+
+
+def store_snapshot(cur, snapshot: Dict[str, Any]) -> None:
+    """
+    Registra o snapshot no servidor se a versão ainda não está lá. Sem
+    commit: roda na transação de quem grava as linhas com essa versão.
+    """
+    versao = str(snapshot["version"])
+    cur.execute(SNAPSHOT_INSERT_SQL, versao, json.dumps(snapshot, ensure_ascii=False), versao)
+
+
+def fetch_missing_snapshots(cur, rules_path: str, versoes: Iterable[str]) -> int:
+    """
+    Baixa do servidor os snapshots das versões que não existem na pasta
+    local e grava lá (a pasta vira cache). Retorna quantos vieram; versão
+    que nem o servidor tem (aplicada antes dos snapshots irem para o banco)
+    continua sem nome (ver TabExtrato._nomes_regras).
+    """
+    faltam = sorted({
+        str(v) for v in versoes
+        if v and not os.path.exists(os.path.join(versions_dir(rules_path), f"{v}.json"))
+    })
+    if not faltam:
+        return 0
+    cur.execute(
+        f"SELECT Versao, Snapshot FROM dbo.Stik_Regras_Versoes WHERE Versao IN ({', '.join('?' * len(faltam))})",
+        *faltam,
+    )
+    baixados = 0
+    for versao, texto in cur.fetchall():
+        try:
+            snap = json.loads(texto)
+        except Exception:
+            continue
+        if isinstance(snap, dict):
+            _write_snapshot(os.path.join(versions_dir(rules_path), f"{versao}.json"), snap)
+            baixados += 1
+    return baixados
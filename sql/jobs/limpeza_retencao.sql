@@ -0,0 +1,25 @@
+-- Limpeza por retenção das tabelas de apoio do app. Passo de um job do
+-- SQL Server Agent (uma vez por dia, fora do horário de uso); o app não
+-- apaga nada disso.
+--
+-- Os prazos têm que bater com utils/db_schema.py:
+--   Stik_Extrato_Alteracoes  ALTERACOES_RETENCAO_DIAS (cliente parado há mais
+--                            tempo que a metade disso recarrega o extrato inteiro)
+--   Stik_Fila_Aplicadas      FILA_RETENCAO_DIAS (operação que fica na fila local
+--                            mais que isso pode ser aplicada de novo)
+
+SET NOCOUNT ON;
+
+DECLARE @alteracoes_dias INT = 3;
+DECLARE @fila_dias INT = 30;
+
+-- em lotes, para não segurar lock no log que o trigger do extrato grava
+WHILE 1 = 1
+BEGIN
+    DELETE TOP (5000) FROM dbo.Stik_Extrato_Alteracoes
+    WHERE Em < DATEADD(DAY, -@alteracoes_dias, SYSUTCDATETIME());
+    IF @@ROWCOUNT < 5000 BREAK;
+END;
+
+DELETE FROM dbo.Stik_Fila_Aplicadas
+WHERE AplicadaEm < DATEADD(DAY, -@fila_dias, SYSUTCDATETIME());
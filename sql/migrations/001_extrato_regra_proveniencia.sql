@@ -0,0 +1,35 @@
+-- 001: proveniência de regra por linha do extrato
+--   RegraVersao: versão do conjunto de regras (rules.rules_versions) aplicada na linha
+--   RegraId:     id da última regra que alterou a linha
+--   IX_Stik_Extrato_RegraVersao: acha linhas abertas com versão de regra desatualizada
+-- Idempotente. Rodar com: sqlcmd -S <servidor> -d <banco> -b -i 001_extrato_regra_proveniencia.sql
+
+SET XACT_ABORT ON;
+GO
+
+IF OBJECT_ID('dbo.Stik_Schema_Migracoes', 'U') IS NULL
+    CREATE TABLE dbo.Stik_Schema_Migracoes (
+        Versao INT NOT NULL PRIMARY KEY,
+        Nome VARCHAR(100) NOT NULL,
+        AplicadaEm DATETIME2(0) NOT NULL DEFAULT SYSUTCDATETIME()
+    );
+GO
+
+IF COL_LENGTH('dbo.Stik_Extrato_Comissoes', 'RegraVersao') IS NULL
+    ALTER TABLE dbo.Stik_Extrato_Comissoes ADD RegraVersao VARCHAR(12) NULL;
+
+IF COL_LENGTH('dbo.Stik_Extrato_Comissoes', 'RegraId') IS NULL
+    ALTER TABLE dbo.Stik_Extrato_Comissoes ADD RegraId VARCHAR(8) NULL;
+GO
+
+-- batch separado: as colunas precisam existir na compilação
+IF INDEXPROPERTY(OBJECT_ID('dbo.Stik_Extrato_Comissoes'), 'IX_Stik_Extrato_RegraVersao', 'IndexID') IS NULL
+    CREATE INDEX IX_Stik_Extrato_RegraVersao
+        ON dbo.Stik_Extrato_Comissoes (DataRecebimento, RegraVersao)
+        INCLUDE (Vendedor)
+        WHERE Consolidado = 0;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM dbo.Stik_Schema_Migracoes WHERE Versao = 1)
+    INSERT INTO dbo.Stik_Schema_Migracoes (Versao, Nome) VALUES (1, '001_extrato_regra_proveniencia');
+GO
@@ -0,0 +1,33 @@
+-- 002: versão de linha do extrato (concorrência otimista e leitura incremental)
+--   VersaoLinha ROWVERSION: muda sozinha a cada INSERT/UPDATE da linha
+--   IX_Stik_Extrato_VersaoLinha: leitura "o que mudou desde o corte"
+-- ATENÇÃO: adicionar ROWVERSION grava em todas as linhas da tabela sob lock de
+-- schema (a tabela fica bloqueada até terminar). Rodar em janela de manutenção.
+-- Idempotente. Rodar com: sqlcmd -S <servidor> -d <banco> -b -i 002_extrato_versao_linha.sql
+
+SET XACT_ABORT ON;
+GO
+
+-- a tabela só pode ter uma coluna rowversion/timestamp: se já existe outra,
+-- não cria uma segunda (falharia) e pede para o DBA decidir (ex.: sp_rename)
+IF COL_LENGTH('dbo.Stik_Extrato_Comissoes', 'VersaoLinha') IS NULL
+   AND EXISTS (
+       SELECT 1 FROM sys.columns
+       WHERE object_id = OBJECT_ID('dbo.Stik_Extrato_Comissoes')
+         AND system_type_id = TYPE_ID('timestamp')
+   )
+    THROW 50002, 'Stik_Extrato_Comissoes já tem uma coluna rowversion/timestamp com outro nome; renomeie para VersaoLinha ou ajuste o script.', 1;
+GO
+
+IF COL_LENGTH('dbo.Stik_Extrato_Comissoes', 'VersaoLinha') IS NULL
+    ALTER TABLE dbo.Stik_Extrato_Comissoes ADD VersaoLinha ROWVERSION;
+GO
+
+IF INDEXPROPERTY(OBJECT_ID('dbo.Stik_Extrato_Comissoes'), 'IX_Stik_Extrato_VersaoLinha', 'IndexID') IS NULL
+    CREATE INDEX IX_Stik_Extrato_VersaoLinha
+        ON dbo.Stik_Extrato_Comissoes (VersaoLinha);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM dbo.Stik_Schema_Migracoes WHERE Versao = 2)
+    INSERT INTO dbo.Stik_Schema_Migracoes (Versao, Nome) VALUES (2, '002_extrato_versao_linha');
+GO
@@ -0,0 +1,56 @@
+-- 003: log de alterações do extrato (feed da atualização ao vivo da grade)
+--   Stik_Extrato_Alteracoes: Id + operação (I/U/D) de cada linha inserida,
+--   alterada ou apagada; Versao (rowversion, mesmo contador da VersaoLinha)
+--   permite ler "desde o corte"
+--   TR_Stik_Extrato_Alteracoes: AFTER INSERT/UPDATE/DELETE no extrato
+-- CUSTO: todo INSERT/UPDATE/DELETE em Stik_Extrato_Comissoes, de qualquer
+-- gravador (app, sincronização, UPDATE de regras no servidor, carga externa),
+-- passa a gravar também uma linha por linha afetada no log, na mesma
+-- transação (mais o índice de Versao). A limpeza do log fica no job
+-- sql/jobs/limpeza_retencao.sql.
+-- Requer 002. Idempotente. Rodar com: sqlcmd -S <servidor> -d <banco> -b -i 003_extrato_alteracoes.sql
+
+SET XACT_ABORT ON;
+GO
+
+IF OBJECT_ID('dbo.Stik_Extrato_Alteracoes', 'U') IS NULL
+    CREATE TABLE dbo.Stik_Extrato_Alteracoes (
+        Seq BIGINT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+        ExtratoId INT NOT NULL,
+        Operacao CHAR(1) NOT NULL,
+        Versao ROWVERSION NOT NULL,
+        Em DATETIME2(0) NOT NULL DEFAULT SYSUTCDATETIME()
+    );
+GO
+
+IF INDEXPROPERTY(OBJECT_ID('dbo.Stik_Extrato_Alteracoes'), 'IX_Stik_Extrato_Alteracoes_Versao', 'IndexID') IS NULL
+    CREATE INDEX IX_Stik_Extrato_Alteracoes_Versao
+        ON dbo.Stik_Extrato_Alteracoes (Versao) INCLUDE (ExtratoId, Operacao);
+
+-- índice da limpeza por data (job de retenção)
+IF INDEXPROPERTY(OBJECT_ID('dbo.Stik_Extrato_Alteracoes'), 'IX_Stik_Extrato_Alteracoes_Em', 'IndexID') IS NULL
+    CREATE INDEX IX_Stik_Extrato_Alteracoes_Em
+        ON dbo.Stik_Extrato_Alteracoes (Em);
+GO
+
+IF OBJECT_ID('dbo.TR_Stik_Extrato_Alteracoes', 'TR') IS NULL
+    EXEC('CREATE TRIGGER dbo.TR_Stik_Extrato_Alteracoes
+          ON dbo.Stik_Extrato_Comissoes
+          AFTER INSERT, UPDATE, DELETE
+          AS
+          BEGIN
+              SET NOCOUNT ON;
+              INSERT INTO dbo.Stik_Extrato_Alteracoes (ExtratoId, Operacao)
+              SELECT i.Id, CASE WHEN d.Id IS NULL THEN ''I'' ELSE ''U'' END
+              FROM inserted i
+              LEFT JOIN deleted d ON d.Id = i.Id
+              UNION ALL
+              SELECT d.Id, ''D''
+              FROM deleted d
+              WHERE NOT EXISTS (SELECT 1 FROM inserted i WHERE i.Id = d.Id);
+          END');
+GO
+
+IF NOT EXISTS (SELECT 1 FROM dbo.Stik_Schema_Migracoes WHERE Versao = 3)
+    INSERT INTO dbo.Stik_Schema_Migracoes (Versao, Nome) VALUES (3, '003_extrato_alteracoes');
+GO
@@ -0,0 +1,22 @@
+-- 004: chaves de idempotência da fila local de gravações (utils.write_queue)
+--   Stik_Fila_Aplicadas: a operação registra a chave na mesma transação;
+--   reenvio da mesma chave só lê o Resultado gravado
+-- A limpeza fica no job sql/jobs/limpeza_retencao.sql.
+-- Idempotente. Rodar com: sqlcmd -S <servidor> -d <banco> -b -i 004_fila_aplicadas.sql
+
+SET XACT_ABORT ON;
+GO
+
+IF OBJECT_ID('dbo.Stik_Fila_Aplicadas', 'U') IS NULL
+    CREATE TABLE dbo.Stik_Fila_Aplicadas (
+        Chave CHAR(36) NOT NULL PRIMARY KEY,
+        Tipo VARCHAR(10) NOT NULL,
+        Usuario VARCHAR(100) NULL,
+        AplicadaEm DATETIME2(0) NOT NULL DEFAULT SYSUTCDATETIME(),
+        Resultado NVARCHAR(MAX) NULL
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM dbo.Stik_Schema_Migracoes WHERE Versao = 4)
+    INSERT INTO dbo.Stik_Schema_Migracoes (Versao, Nome) VALUES (4, '004_fila_aplicadas');
+GO
@@ -0,0 +1,20 @@
+-- 005: snapshots das versões de regras (rules.rules_versions)
+--   Stik_Regras_Versoes: um snapshot imutável (JSON) por RegraVersao, gravado
+--   na mesma transação que aplica/salva linhas com aquela versão, para toda
+--   máquina achar o nome da regra (RegraId) aplicada em outra
+-- Requer 001. Idempotente. Rodar com: sqlcmd -S <servidor> -d <banco> -b -i 005_regras_versoes.sql
+
+SET XACT_ABORT ON;
+GO
+
+IF OBJECT_ID('dbo.Stik_Regras_Versoes', 'U') IS NULL
+    CREATE TABLE dbo.Stik_Regras_Versoes (
+        Versao VARCHAR(12) NOT NULL PRIMARY KEY,
+        CriadaEm DATETIME2(0) NOT NULL DEFAULT SYSUTCDATETIME(),
+        Snapshot NVARCHAR(MAX) NOT NULL
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM dbo.Stik_Schema_Migracoes WHERE Versao = 5)
+    INSERT INTO dbo.Stik_Schema_Migracoes (Versao, Nome) VALUES (5, '005_regras_versoes');
+GO
@@ -3,15 +3,26 @@
 # =====================================================
 """
 Pacote das abas do sistema
-Exporta as 3 abas principais
+Exporta as 3 abas principais (cada uma importada só quando pedida)
 """
 
-from .tab_consulta import TabConsulta
-from .tab_extrato import TabExtrato
-from .tab_consolidados import TabConsolidados
+import importlib
+
+_MODULOS = {
+    "TabConsulta": ".tab_consulta",
+    "TabExtrato": ".tab_extrato",
+    "TabConsolidados": ".tab_consolidados",
+}
 
 __all__ = [
     "TabConsulta",
     "TabExtrato",
     "TabConsolidados"
 ]
+
+
+def __getattr__(name):
+    modulo = _MODULOS.get(name)
+    if modulo is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(modulo, __name__), name)
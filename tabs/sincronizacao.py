@@ -25,8 +25,10 @@ from PySide6.QtWidgets import (
 
 from config import DBConfig, get_conn
 from queries import build_query_866
-from utils.extrato_writer import EXTRATO_INSERT_SQL, build_extrato_insert_params, insert_extrato_row
+from utils.db_schema import verificar_schema_extrato
+from utils.extrato_writer import build_extrato_insert_params_frame, insert_extrato_row, insert_extrato_rows
 from utils.formatters import br_to_decimal
+from utils.local_replica import abrir_replica
 
 
 def fmt_currency(v):
@@ -172,13 +174,14 @@ class SyncWorker(QThread):
 
         self.progress.emit("Buscando extrato local")
         if self.vendedor:
-            query = "SELECT Id as DBId, Doc as ID, Titulo, Artigo, Cliente, Vendedor, CONVERT(VARCHAR(10), DataRecebimento, 23) as DataRecebimentoISO, RecebimentoLiq, Recebido, PercComissao, PrecoVenda FROM dbo.Stik_Extrato_Comissoes WHERE DataRecebimento BETWEEN ? AND ? AND Vendedor = ? AND Consolidado = 0"
+            query = "SELECT Id as DBId, Doc as ID, Titulo, Artigo, Cliente, Vendedor, CONVERT(VARCHAR(10), DataRecebimento, 23) as DataRecebimentoISO, RecebimentoLiq, Recebido, PercComissao, PrecoVenda, RegraVersao, RegraId FROM dbo.Stik_Extrato_Comissoes WHERE DataRecebimento BETWEEN ? AND ? AND Vendedor = ? AND Consolidado = 0"
             params_cs = (self.competencia_inicio, self.competencia_fim, self.vendedor)
         else:
-            query = "SELECT Id as DBId, Doc as ID, Titulo, Artigo, Cliente, Vendedor, CONVERT(VARCHAR(10), DataRecebimento, 23) as DataRecebimentoISO, RecebimentoLiq, Recebido, PercComissao, PrecoVenda FROM dbo.Stik_Extrato_Comissoes WHERE DataRecebimento BETWEEN ? AND ? AND Consolidado = 0"
+            query = "SELECT Id as DBId, Doc as ID, Titulo, Artigo, Cliente, Vendedor, CONVERT(VARCHAR(10), DataRecebimento, 23) as DataRecebimentoISO, RecebimentoLiq, Recebido, PercComissao, PrecoVenda, RegraVersao, RegraId FROM dbo.Stik_Extrato_Comissoes WHERE DataRecebimento BETWEEN ? AND ? AND Consolidado = 0"
             params_cs = (self.competencia_inicio, self.competencia_fim)
         with get_conn(self.cfg) as conn:
             cur = conn.cursor()
+            verificar_schema_extrato(cur)
             cur.execute(query, params_cs)
             rows = cur.fetchall()
             cols = [d[0] for d in cur.description]
@@ -249,32 +252,23 @@ class SyncService:
                     "Validado": row.get("Validado"),
                     "ValidadoPor": row.get("ValidadoPor"),
                     "ValidadoEm": row.get("ValidadoEm"),
+                    "RegraVersao": row.get("RegraVersao"),
+                    "RegraId": row.get("RegraId"),
                 }
 
         with get_conn(self.cfg) as conn:
             cur = conn.cursor()
+            verificar_schema_extrato(cur)
             try:
                 removidos = self._delete_scope(cur, resultado)
-                inseridos = 0
-                params_batch = []
-                for _, row in tm_full.iterrows():
-                    preserve = preserve_map.get(row.get("_chave"))
-                    params_batch.append(
-                        build_extrato_insert_params(
-                            row,
-                            criado_por="Sync-Replace",
-                            observacao="Reconstruido por sincronizacao",
-                            preserve=preserve,
-                        )
-                    )
-                    inseridos += 1
-
-                if params_batch:
-                    try:
-                        cur.fast_executemany = True
-                    except Exception:
-                        pass
-                    cur.executemany(EXTRATO_INSERT_SQL, params_batch)
+                chaves = tm_full["_chave"] if "_chave" in tm_full.columns else [None] * len(tm_full)
+                params_batch = build_extrato_insert_params_frame(
+                    tm_full,
+                    criado_por="Sync-Replace",
+                    observacao="Reconstruido por sincronizacao",
+                    preserve=[preserve_map.get(chave) for chave in chaves],
+                )
+                inseridos = insert_extrato_rows(cur, params_batch)
 
                 conn.commit()
             except Exception:
@@ -547,10 +541,16 @@ class DialogSincronizacao(QDialog):
 
     def _load_vendedores(self):
         try:
+            replica = abrir_replica(self.cfg)
             with get_conn(self.cfg) as conn:
                 cur = conn.cursor()
-                cur.execute("SELECT DISTINCT Vendedor FROM dbo.Stik_Extrato_Comissoes WHERE Consolidado = 0 AND Vendedor IS NOT NULL ORDER BY Vendedor")
-                vendedores = [r[0] for r in cur.fetchall()]
+                if replica is not None:
+                    verificar_schema_extrato(cur)
+                    replica.sincronizar_extrato(cur)
+                    vendedores = replica.vendedores_abertos()
+                else:
+                    cur.execute("SELECT DISTINCT Vendedor FROM dbo.Stik_Extrato_Comissoes WHERE Consolidado = 0 AND Vendedor IS NOT NULL ORDER BY Vendedor")
+                    vendedores = [r[0] for r in cur.fetchall()]
         except Exception:
             vendedores = []
         self.cmb_vendedor.clear()
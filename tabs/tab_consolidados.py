@@ -13,15 +13,44 @@ import os
 
 from config import DBConfig, get_conn
 from models import EditableTableModel, ExcelLikeTableView
-from utils.formatters import apply_display_formats, comp_br, br_to_decimal, br_to_float
-from utils.pdf_generator import gerar_pdf_extrato
+from utils.bulk_ops import consolidar_extrato, excluir_consolidados
+from utils.extrato_reader import fetch_consolidados
+from utils.formatters import comp_br
+from utils.local_replica import abrir_replica
 from constants import USERS, SMTP_CONFIG
-from email.message import EmailMessage
-import smtplib
+from ui.async_loader import AsyncLoader
 from ui.loading_overlay import LoadingOverlay, QuickFeedback
+from ui.column_widths import ColumnWidths
 from ui.icons import Icons, icon_button_text
 
 
+def _carregar_consolidados(token, cfg) -> pd.DataFrame:
+    """
+    Roda no LoadWorker: lê os consolidados e formata as datas. Com réplica
+    local, só os consolidados novos vêm do servidor.
+    """
+    replica = abrir_replica(cfg)
+    with get_conn(cfg) as conn:
+        cur = conn.cursor()
+        token.bind(cur)
+        if replica is not None:
+            replica.sincronizar_consolidados(cur)
+        else:
+            df = fetch_consolidados(cur)
+    if replica is not None:
+        df = replica.ler_consolidados()
+    token.check()
+
+    # Converte datas
+    if "Recebimento" in df.columns:
+        df["Competência"] = df["Recebimento"].apply(comp_br)
+
+    for c in ("Emissão", "Vencimento", "Recebimento"):
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], errors="coerce").dt.strftime("%d/%m/%Y")
+    return df
+
+
 class TabConsolidados(QWidget):
     """
     Aba de Consolidados
@@ -34,10 +63,17 @@ class TabConsolidados(QWidget):
         self.username = username
         self.cfg = DBConfig()
         self.df_consolidados = pd.DataFrame()
+        self._larguras = ColumnWidths("consolidados", username)
         
         # Cache para otimização
         self._cache_competencias = set()
         self._cache_vendedores = set()
+
+        # carga em thread: a grade antiga fica na tela até chegar a nova
+        self._carga = AsyncLoader(self)
+        self._carga.loaded.connect(self._on_consolidados_carregados)
+        self._carga.failed.connect(self._on_falha_carga)
+        self._carga.busy_changed.connect(self._on_carga_ocupada)
         
         self._setup_ui()
     
@@ -117,7 +153,7 @@ class TabConsolidados(QWidget):
         layout.addLayout(btn_layout)
         
         # Conectar eventos
-        self.btn_refresh.clicked.connect(self.refresh_consolidados)
+        self._carga.bind_button(self.btn_refresh, self.refresh_consolidados)
         self.btn_pdf.clicked.connect(self.on_gerar_pdf_consolidados)
         self.btn_email.clicked.connect(self.on_enviar_email_consolidados)
         self.btn_excluir.clicked.connect(self.on_excluir_consolidados)
@@ -146,42 +182,20 @@ class TabConsolidados(QWidget):
         layout.addLayout(linha_inferior)
     
     def refresh_consolidados(self):
-        """Carrega dados consolidados do banco COM FEEDBACK"""
-        parent_window = self.window()
-        loading = LoadingOverlay(parent_window, f"{Icons.LOADING} Carregando consolidados")
-        loading.show_overlay()
+        """Recarrega os consolidados em segundo plano (ver _on_consolidados_carregados)."""
+        self._carga.start(_carregar_consolidados, self.cfg)
 
-        try:
-            with get_conn(self.cfg) as conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT Id as DBId, Competencia, Doc as ID, VendedorID, Vendedor, Titulo, Cliente, UF,
-                           Artigo, Linha, Recebido, ICMSST, Frete, RecebimentoLiq as [Rec Liquido],
-                           PrazoMedio as [Prazo Médio], PrecoMedio as [Preço Médio], PrecoVenda as [Preço Venda],
-                           MeioPagamento as [M Pagamento], Emissao as [Emissão], Vencimento as [Vencimento],
-                           DataRecebimento as [Recebimento], PercComissao as [% Comissão], ValorComissao as [Valor Comissão],
-                           Observacao as [Observação]
-                    FROM dbo.Stik_Consolidacao_Comissoes
-                    ORDER BY DataRecebimento DESC, Id DESC
-                """)
-                rows = cur.fetchall()
-                cols = [d[0] for d in cur.description]
-            df = pd.DataFrame.from_records(rows, columns=cols)
-        except Exception as e:
-            loading.close_overlay()
-            QMessageBox.critical(self, "Consolidados", f"Erro ao carregar consolidados: {e}")
-            return
-
-        loading.update_message(f"{Icons.LOADING} Processando dados")
+    def _on_carga_ocupada(self, ocupado: bool):
+        if ocupado:
+            self.lbl_count_consolidados.setText(f"{Icons.LOADING} Carregando consolidados...")
+        else:
+            total = len(self._apply_filters(self.df_consolidados))
+            self.lbl_count_consolidados.setText(f"{total:,} registro(s)".replace(",", "."))
 
-        # Converte datas
-        if "Recebimento" in df.columns:
-            df["Competência"] = df["Recebimento"].apply(comp_br)
-        
-        for c in ("Emissão", "Vencimento", "Recebimento"):
-            if c in df.columns:
-                df[c] = pd.to_datetime(df[c], errors="coerce").dt.strftime("%d/%m/%Y")
+    def _on_falha_carga(self, payload: dict):
+        QMessageBox.critical(self, "Consolidados", f"Erro ao carregar consolidados: {payload.get('erro')}")
 
+    def _on_consolidados_carregados(self, df):
         # Atualizar combos (OTIMIZADO)
         self._update_combos(df)
 
@@ -198,7 +212,6 @@ class TabConsolidados(QWidget):
         total = len(df)
         self.lbl_count_consolidados.setText(f"{total:,} registro(s)".replace(",", "."))
         
-        loading.close_overlay()
         QuickFeedback.show(self, f"{total} registro(s) consolidado(s)", success=True)
     
     def _update_combos(self, df):
@@ -245,14 +258,13 @@ class TabConsolidados(QWidget):
     
     def _display_consolidados(self, df):
         """Exibe os consolidados na tabela"""
-        df_show = apply_display_formats(df.copy())
-        cols_show = self._get_display_columns(df_show.columns)
+        cols_show = self._get_display_columns(df.columns)
 
-        model = EditableTableModel(cols_show, df_show[cols_show].values.tolist())
+        model = EditableTableModel.from_frame(df, cols_show)
         model.set_all_readonly(True)  # Consolidados são readonly
 
         self.tbl_consolidados.setModel(model)
-        self.tbl_consolidados.resizeColumnsToContents()
+        self._larguras.fit(self.tbl_consolidados)
     
     def _get_display_columns(self, cols_all):
         """Retorna as colunas a serem exibidas"""
@@ -293,6 +305,7 @@ class TabConsolidados(QWidget):
         loading.show_overlay()
         
         try:
+            from utils.pdf_generator import gerar_pdf_extrato
             gerar_pdf_extrato(path, df)
             loading.close_overlay()
             QuickFeedback.show(self, "PDF gerado com sucesso", success=True)
@@ -320,6 +333,11 @@ class TabConsolidados(QWidget):
         loading.show_overlay()
         
         try:
+            # reportlab / smtplib só na hora do envio
+            import smtplib
+            from email.message import EmailMessage
+            from utils.pdf_generator import gerar_pdf_extrato
+
             # Gera PDF
             loading.update_message(f"{Icons.PDF} Gerando PDF")
             gerar_pdf_extrato(tmp_pdf, df)
@@ -409,53 +427,18 @@ class TabConsolidados(QWidget):
         loading = LoadingOverlay(parent_window, f"{Icons.DELETE} Excluindo registros")
         loading.show_overlay()
         
-        deleted = 0
-        docs_affected = []
-        
         try:
             with get_conn(self.cfg) as conn:
                 cur = conn.cursor()
                 
-                # Coleta os IDs para excluir
-                ids_to_delete = []
-                rows_to_remove = []
-                
-                for s in sel:
-                    row_idx = s.row()
-                    row = model.rows[row_idx]
-                    dbid = int(row[i_db])
-                    ids_to_delete.append(dbid)
-                    rows_to_remove.append(row_idx)
-                
-                total = len(ids_to_delete)
-                
-                # Executa a exclusão no banco
-                for i, dbid in enumerate(ids_to_delete, 1):
-                    loading.update_message(f"{Icons.DELETE} Excluindo {i}/{total}")
-                    
-                    # Busca o Doc antes de excluir
-                    cur.execute("SELECT Doc FROM dbo.Stik_Consolidacao_Comissoes WHERE Id = ?", dbid)
-                    result = cur.fetchone()
-                    if result:
-                        doc = result[0]
-                        docs_affected.append(doc)
-                    
-                    # Remove da tabela de consolidação
-                    cur.execute("DELETE FROM dbo.Stik_Consolidacao_Comissoes WHERE Id = ?", dbid)
-                    deleted += cur.rowcount
-                
-                loading.update_message(f"{Icons.UNLOCK} Desmarcando registros no extrato")
-                
-                # Desmarca como consolidado na tabela de extrato
-                for doc in docs_affected:
-                    cur.execute("""
-                        UPDATE dbo.Stik_Extrato_Comissoes 
-                        SET Consolidado = 0 
-                        WHERE Doc = ?
-                    """, doc)
-                
+                ids_to_delete = [int(model.raw_value(s.row(), i_db)) for s in sel]
+                rows_to_remove = [s.row() for s in sel]
+
+                # um DELETE para o conjunto + desmarca os Docs no extrato
+                apagados, _docs = excluir_consolidados(cur, ids_to_delete)
+                deleted = len(apagados)
                 conn.commit()
-                
+
                 # Remove da view
                 model.remove_rows(rows_to_remove)
                 
@@ -498,6 +481,8 @@ class TabConsolidados(QWidget):
     def consolidar_registros(self, df_to_consolidate: pd.DataFrame) -> tuple:
         """
         Consolida registros validados no banco COM FEEDBACK
+        O servidor copia as linhas (por DBId) do extrato: grava o que está no
+        banco, não o que está na grade (ver utils.bulk_ops.consolidar_extrato).
         
         Args:
             df_to_consolidate: DataFrame com os dados a consolidar
@@ -527,71 +512,30 @@ class TabConsolidados(QWidget):
             if (df_to_consolidate["Consolidado"].astype(str).isin(["1", "True", "true"])).any():
                 return False, "Existem linhas já consolidadas. Remova-as para prosseguir."
 
+        try:
+            ids = sorted({int(v) for v in df_to_consolidate["DBId"]})
+        except (KeyError, TypeError, ValueError):
+            return False, "Coluna DBId ausente ou inválida nos dados a consolidar."
+
         parent_window = self.window()
-        loading = LoadingOverlay(parent_window, f"{Icons.LOCK} Consolidando registros")
+        loading = LoadingOverlay(parent_window, f"{Icons.LOCK} Consolidando {len(ids)} registro(s)")
         loading.show_overlay()
 
         try:
             with get_conn(self.cfg) as conn:
                 cur = conn.cursor()
-                total = len(df_to_consolidate)
-                
-                for i, (_, row) in enumerate(df_to_consolidate.iterrows(), 1):
-                    loading.update_message(f"{Icons.LOCK} Consolidando {i}/{total}")
-                    
-                    comp_iso = None
-                    try:
-                        comp_iso = pd.to_datetime(
-                            row.get("Recebimento"), 
-                            dayfirst=True, 
-                            errors="coerce"
-                        ).strftime("%Y-%m")
-                    except:
-                        pass
-
-                    # Insere na consolidação
-                    cur.execute("""
-                        INSERT INTO dbo.Stik_Consolidacao_Comissoes (
-                            Competencia, Doc, Cliente, Artigo, Linha, UF,
-                            DataRecebimento, RecebimentoLiq, PercComissao, ValorComissao,
-                            Observacao, CriadoPor,
-                            VendedorID, Vendedor, Titulo, MeioPagamento,
-                            Emissao, Vencimento, Recebido, ICMSST, Frete,
-                            PrecoMedio, PrecoVenda, PrazoMedio
-                        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,'PySide6-App',
-                                ?,?,?,?,?,?,?,?,?,?,?,?)
-                    """,
-                        comp_iso,
-                        int(str(row.get("ID", 0)) or 0),
-                        str(row.get("Cliente", ""))[:200],
-                        str(row.get("Artigo", ""))[:200],
-                        str(row.get("Linha", ""))[:200],
-                        str(row.get("UF", ""))[:2],
-                        pd.to_datetime(row.get("Recebimento"), dayfirst=True, errors="coerce").date(),
-                        br_to_decimal(row.get("Rec Liquido", 0), 2),
-                        br_to_decimal(row.get("% Comissão", 0), 4),
-                        br_to_decimal(row.get("Valor Comissão", 0), 2),
-                        str(row.get("Observação", ""))[:500],
-                        int(br_to_float(row.get("VendedorID", 0))) or None,
-                        str(row.get("Vendedor", ""))[:200] or None,
-                        str(row.get("Titulo", ""))[:120] or None,
-                        str(row.get("M Pagamento", ""))[:100] or None,
-                        pd.to_datetime(row.get("Emissão"), dayfirst=True, errors="coerce").date() if row.get("Emissão") else None,
-                        pd.to_datetime(row.get("Vencimento"), dayfirst=True, errors="coerce").date() if row.get("Vencimento") else None,
-                        br_to_decimal(row.get("Recebido", 0), 2),
-                        br_to_decimal(row.get("ICMSST", 0), 2),
-                        br_to_decimal(row.get("Frete", 0), 2),
-                        br_to_decimal(row.get("Preço Médio", 0), 4),
-                        br_to_decimal(row.get("Preço Venda", 0), 4),
-                        br_to_decimal(row.get("Prazo Médio", 0), 2)
-                    )
-                    
-                    # Marca como consolidado
-                    cur.execute(
-                        "UPDATE dbo.Stik_Extrato_Comissoes SET Consolidado = 1 WHERE Id = ?", 
-                        int(row["DBId"])
+                total = len(consolidar_extrato(cur, ids))
+
+                # tudo ou nada: se alguma linha mudou no banco (desvalidada ou
+                # já consolidada por outra pessoa), nada é consolidado
+                if total != len(ids):
+                    conn.rollback()
+                    loading.close_overlay()
+                    return False, (
+                        f"{len(ids) - total} de {len(ids)} linha(s) não estão mais validadas ou já foram "
+                        "consolidadas no banco. Atualize o extrato e tente novamente."
                     )
-                
+
                 conn.commit()
             
             loading.close_overlay()
@@ -5,18 +5,24 @@ RESPONSIVA | OTIMIZADA | COM FEEDBACKS | CORRIGIDA v2
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox,
     QDateEdit, QSpinBox, QPushButton, QMessageBox,
-    QHeaderView, QAbstractItemView, QSizePolicy
+    QAbstractItemView, QSizePolicy
 )
 from PySide6.QtCore import QDate, Qt, QTimer
+from datetime import datetime
 from decimal import Decimal
 import pandas as pd
 
 from config import DBConfig, get_conn
 from queries import build_query_866
 from models import EditableTableModel, ExcelLikeTableView
-from utils.extrato_writer import insert_extrato_row
-from utils.formatters import br_to_decimal, apply_display_formats
+from utils.db_schema import verificar_schema_extrato
+from utils.extrato_reader import chave_titulo, fetch_chaves_extrato_abertas
+from utils.extrato_writer import build_extrato_insert_params_frame, insert_extrato_rows
+from utils.formatters import br_to_decimal
+from utils.local_replica import abrir_replica
+from ui.async_loader import AsyncLoader
 from ui.loading_overlay import LoadingOverlay, QuickFeedback
+from ui.column_widths import ColumnWidths
 from ui.icons import Icons, icon_button_text
 
 
@@ -26,15 +32,22 @@ class TabConsulta(QWidget):
     Permite buscar lançamentos e adicioná-los ao extrato
     """
     
-    def __init__(self, parent=None, role: str = "admin"):
+    def __init__(self, parent=None, role: str = "admin", username: str = "admin"):
         super().__init__(parent)
         self.role = role
         self.cfg = DBConfig()
         self.df_result = pd.DataFrame()
+        self._larguras = ColumnWidths("consulta", username)
         
         # Cache para otimização
         self._cache_vendedores = set()
         self._cache_artigos = set()
+
+        # busca em thread: o resultado anterior fica na tela até chegar o novo
+        self._carga = AsyncLoader(self)
+        self._carga.loaded.connect(self._on_busca_concluida)
+        self._carga.failed.connect(self._on_falha_busca)
+        self._carga.busy_changed.connect(self._on_busca_ocupada)
         
         self._setup_ui()
     
@@ -136,7 +149,7 @@ class TabConsulta(QWidget):
         self.btn_buscar = QPushButton("Buscar")
         self.btn_buscar.setObjectName("btnPrimary")
         self.btn_buscar.setMinimumWidth(96)
-        self.btn_buscar.clicked.connect(self.on_buscar)
+        self._carga.bind_button(self.btn_buscar, self.on_buscar)
 
         self.btn_add = QPushButton("Adicionar ao Extrato")
         self.btn_add.setObjectName("btnSuccess")
@@ -161,122 +174,123 @@ class TabConsulta(QWidget):
         layout.addWidget(self.tbl)
     
     def on_buscar(self):
-        """Executa a busca de dados COM FEEDBACK"""
-        parent_window = self.window()
-        loading = LoadingOverlay(parent_window, f"{Icons.LOADING} Buscando dados")
-        loading.show_overlay()
+        """Executa a busca em segundo plano (ver _executar_busca / _on_busca_concluida)"""
+        # Captura as datas do período de RECEBIMENTO
+        di = self.dt_ini.date().toString('yyyyMMdd')
+        df_ = self.dt_fim.date().toString('yyyyMMdd')
 
-        try:
-            # Captura as datas do período de RECEBIMENTO
-            di = self.dt_ini.date().toString('yyyyMMdd')
-            df_ = self.dt_fim.date().toString('yyyyMMdd')
-            
-            vendedor = self.cmb_vendedor.currentText()
-            if vendedor == "(todos)":
-                vendedor = None
+        vendedor = self.cmb_vendedor.currentText()
+        if vendedor == "(todos)":
+            vendedor = None
 
-            loading.update_message(f"{Icons.LOADING} Consultando banco de dados")
-            
-            # Executa a query (sempre por RECEBIMENTO)
-            sql, params = build_query_866(di, df_, vendedor)
-            num_markers = sql.count("?")
-            if len(params) > num_markers:
-                params = params[:num_markers]
+        self._carga.start(self._executar_busca, di, df_, vendedor, self.cmb_artigo.currentText())
 
-            with get_conn(self.cfg) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, params)
-                while cur.description is None and cur.nextset():
-                    pass
-                rows = cur.fetchall()
-                cols = [d[0] for d in cur.description]
-            
-            df_res = pd.DataFrame.from_records(rows, columns=cols)
-            
-            if df_res.empty:
-                loading.close_overlay()
-                QuickFeedback.show(self, "Nenhum resultado encontrado", success=False)
-                self._display_empty_results()
-                return
-            
-            loading.update_message(f"{Icons.LOADING} Processando dados")
-            
-            # Adiciona % Percentual Padrão
-            if "Percentual_Comissao" in df_res.columns:
-                df_res["% Percentual Padrão"] = df_res["Percentual_Comissao"].astype(float).round(4)
+    def _executar_busca(self, token, di, df_, vendedor, chosen_artigo):
+        """
+        Roda no LoadWorker (sem tocar em widgets): consulta, tira o que já
+        está no extrato e aplica o filtro de artigo.
+        """
+        # Executa a query (sempre por RECEBIMENTO)
+        sql, params = build_query_866(di, df_, vendedor)
+        num_markers = sql.count("?")
+        if len(params) > num_markers:
+            params = params[:num_markers]
+
+        with get_conn(self.cfg) as conn:
+            cur = conn.cursor()
+            token.bind(cur)
+            cur.execute(sql, params)
+            while cur.description is None and cur.nextset():
+                pass
+            rows = cur.fetchall()
+            cols = [d[0] for d in cur.description]
+        token.check()
+
+        df_res = pd.DataFrame.from_records(rows, columns=cols)
+
+        if df_res.empty:
+            return None
+
+        # Adiciona % Percentual Padrão
+        if "Percentual_Comissao" in df_res.columns:
+            df_res["% Percentual Padrão"] = df_res["Percentual_Comissao"].astype(float).round(4)
+
+        # Renomeia NmLot para Vendedor
+        if "NmLot" in df_res.columns:
+            df_res.rename(columns={"NmLot": "Vendedor"}, inplace=True)
+
+        # combo de vendedores usa o resultado antes dos filtros abaixo
+        df_vendedores = df_res[["Vendedor"]]
+
+        # 🔹 CORREÇÃO v2: Remove itens já no extrato
+        # Usa chave FLEXÍVEL que detecta parcelas corretamente; só o período/vendedor buscado
+        ids_extrato = self._fetch_chaves_extrato(
+            datetime.strptime(di, "%Y%m%d").date(), datetime.strptime(df_, "%Y%m%d").date(), vendedor
+        )
+        token.check()
 
-            # Renomeia NmLot para Vendedor
-            if "NmLot" in df_res.columns:
-                df_res.rename(columns={"NmLot": "Vendedor"}, inplace=True)
+        if "ID" in df_res.columns and ids_extrato:
+            len_antes = len(df_res)
 
-            # Atualiza combo de vendedores (OTIMIZADO - apenas se mudou)
-            self._update_vendedor_combo(df_res)
+            # Normaliza data de recebimento (ISO) e cria a chave composta NORMALIZADA
+            recebimento_iso = pd.to_datetime(df_res["Recebimento"], dayfirst=True, errors="coerce").dt.strftime("%Y-%m-%d")
+            titulo = df_res["Titulo"] if "Titulo" in df_res.columns else pd.Series("", index=df_res.index)
+            chaves = chave_titulo(df_res["ID"], df_res["Artigo"], titulo, recebimento_iso)
 
-            # 🔹 CORREÇÃO v2: Remove itens já no extrato
-            # Usa chave FLEXÍVEL que detecta parcelas corretamente
-            ids_extrato = self._fetch_extrato_docs_completo()
-            
-            if "ID" in df_res.columns and ids_extrato:
-                len_antes = len(df_res)
-                
-                # Normaliza data de recebimento no DataFrame
-                df_res["_Recebimento_normalizado"] = pd.to_datetime(
-                    df_res["Recebimento"], 
-                    dayfirst=True, 
-                    errors="coerce"
-                ).dt.strftime("%Y-%m-%d")  # Formato ISO padrão
-                
-                # Cria chave composta NORMALIZADA
-                df_res["_chave"] = df_res.apply(
-                    lambda x: (
-                        str(x["ID"]).strip().lower(),
-                        str(x["Artigo"]).strip().lower(),
-                        str(x.get("Titulo", "")).strip().lower(),
-                        str(x["_Recebimento_normalizado"])
-                    ), 
-                    axis=1
-                )
-                
-                # Remove registros que já estão no extrato
-                df_res = df_res[~df_res["_chave"].isin(ids_extrato)].copy()
-                df_res.drop(columns=["_chave", "_Recebimento_normalizado"], inplace=True, errors="ignore")
-                
-                removidos = len_antes - len(df_res)
-                if removidos > 0:
-                    print(f"✅ {removidos} título(s) já no extrato (filtrados automaticamente)")
-
-            # Aplica filtro por artigo
-            chosen_artigo = self.cmb_artigo.currentText()
-            if chosen_artigo and chosen_artigo != "(todos)":
-                df_res = df_res[df_res["Artigo"] == chosen_artigo]
-
-            # Atualiza combo de artigos (OTIMIZADO)
-            self._update_artigo_combo(df_res)
-
-            # Adiciona colunas esperadas
-            df_res = self._add_expected_columns(df_res)
-
-            # Guarda o resultado
-            self.df_result = df_res
-
-            # Exibe na tabela
-            self._display_results(df_res)
-
-            # Atualiza contador
-            self._update_counter(df_res)
-            
-            loading.close_overlay()
-            QuickFeedback.show(self, f"{len(df_res)} registro(s) encontrado(s)", success=True)
+            # Remove registros que já estão no extrato
+            df_res = df_res[~chaves.isin(ids_extrato)].copy()
+
+            removidos = len_antes - len(df_res)
+            if removidos > 0:
+                print(f"✅ {removidos} título(s) já no extrato (filtrados automaticamente)")
+
+        # Aplica filtro por artigo
+        if chosen_artigo and chosen_artigo != "(todos)":
+            df_res = df_res[df_res["Artigo"] == chosen_artigo]
+
+        # Adiciona colunas esperadas
+        df_res = self._add_expected_columns(df_res)
+
+        return {"df": df_res, "vendedores": df_vendedores}
+
+    def _on_busca_concluida(self, resultado):
+        if resultado is None:
+            QuickFeedback.show(self, "Nenhum resultado encontrado", success=False)
+            self._display_empty_results()
+            return
+
+        df_res = resultado["df"]
+
+        # Atualiza combos (OTIMIZADO - apenas se mudou)
+        self._update_vendedor_combo(resultado["vendedores"])
+        self._update_artigo_combo(df_res)
+
+        # Guarda o resultado
+        self.df_result = df_res
+
+        # Exibe na tabela
+        self._display_results(df_res)
+
+        # Atualiza contador
+        self._update_counter(df_res)
+
+        QuickFeedback.show(self, f"{len(df_res)} registro(s) encontrado(s)", success=True)
+
+    def _on_falha_busca(self, payload: dict):
+        QMessageBox.critical(
+            self,
+            "Erro na consulta",
+            f"{payload.get('tipo')}: {payload.get('erro')}\n{payload.get('detalhe', '')}"
+        )
+
+    def _on_busca_ocupada(self, ocupado: bool):
+        if ocupado:
+            self.lbl_total.setText(f"{Icons.LOADING} Buscando dados...")
+        elif self.df_result.empty:
+            self.lbl_total.setText("Total de linhas: 0")
+        else:
+            self._update_counter(self.df_result)
 
-        except Exception as e:
-            loading.close_overlay()
-            import traceback
-            QMessageBox.critical(
-                self, 
-                "Erro na consulta", 
-                f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=1)}"
-            )
-    
     def _display_empty_results(self):
         """Exibe tabela vazia quando não há resultados"""
         self.df_result = pd.DataFrame()
@@ -319,39 +333,24 @@ class TabConsulta(QWidget):
                 self.cmb_artigo.setCurrentText(cur_a)
             self.cmb_artigo.blockSignals(False)
     
-    def _fetch_extrato_docs_completo(self) -> set:
+    def _fetch_chaves_extrato(self, data_ini, data_fim, vendedor=None) -> set:
         """
-        🔹 CORREÇÃO v2: Busca chave completa NORMALIZADA do extrato
-        Garante comparação correta com datas e strings normalizadas
+        🔹 CORREÇÃO v2: Busca chave completa NORMALIZADA do extrato (chave_titulo)
+        Só das linhas não consolidadas do período de recebimento/vendedor buscado
         """
-        out = set()
         try:
+            replica = abrir_replica(self.cfg)
             with get_conn(self.cfg) as conn:
                 cur = conn.cursor()
-                cur.execute("""
-                    SELECT 
-                        Doc, 
-                        Artigo, 
-                        Titulo, 
-                        CONVERT(VARCHAR(10), DataRecebimento, 23) as DataRecebimentoISO
-                    FROM dbo.Stik_Extrato_Comissoes 
-                    WHERE Consolidado = 0
-                """)
-                
-                out = {
-                    (
-                        str(r[0]).strip().lower(),      # Doc
-                        str(r[1]).strip().lower(),      # Artigo
-                        str(r[2] or "").strip().lower(),  # Titulo
-                        str(r[3])                        # DataRecebimento (já em formato ISO yyyy-mm-dd)
-                    ) 
-                    for r in cur.fetchall()
-                }
+                if replica is None:
+                    return fetch_chaves_extrato_abertas(cur, data_ini, data_fim, vendedor)
+                verificar_schema_extrato(cur)
+                replica.sincronizar_extrato(cur)
+            return replica.chaves_extrato_abertas(data_ini, data_fim, vendedor)
         except Exception as e:
             print(f"⚠️ Erro ao buscar extrato: {e}")
-        
-        return out
-    
+            return set()
+
     def _add_expected_columns(self, df):
         """Adiciona colunas esperadas ao DataFrame (OTIMIZADO)"""
         expected = [
@@ -389,13 +388,11 @@ class TabConsulta(QWidget):
     
     def _display_results(self, df):
         """Exibe os resultados na tabela"""
-        df_show = apply_display_formats(df.copy())
-        cols_show = self._get_display_columns(df_show.columns)
+        cols_show = self._get_display_columns(df.columns)
 
-        model = EditableTableModel(cols_show, df_show[cols_show].values.tolist())
+        model = EditableTableModel.from_frame(df, cols_show)
         self.tbl.setModel(model)
-        self.tbl.resizeColumnsToContents()
-        self.tbl.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self._larguras.fit(self.tbl)
     
     def _get_display_columns(self, cols_all):
         """Retorna as colunas a serem exibidas"""
@@ -431,56 +428,32 @@ class TabConsulta(QWidget):
         loading.show_overlay()
 
         try:
-            hdr = model.headers
-            def idx(h):
-                try:
-                    return hdr.index(h)
-                except ValueError:
-                    return None
-
-            ix = {h: idx(h) for h in ["ID", "Titulo", "Cliente", "% Comissão"]}
-            inserted = 0
-            errors = 0
+            # a linha do model aponta direto para a linha de df_result (row_id = índice)
+            linhas = sorted(set(selected_rows))
+            rotulos = model.row_ids(linhas)
+            i_pct = model.column_index("% Comissão")
+
+            pos = self.df_result.index.get_indexer(rotulos)
+            adicionadas = [(linha, rotulo) for linha, rotulo, p in zip(linhas, rotulos, pos) if p >= 0]
+            errors = len(linhas) - len(adicionadas)
+            sub = self.df_result.iloc[pos[pos >= 0]]
+            params_batch = build_extrato_insert_params_frame(
+                sub,
+                # % da grade (pode ter sido editado); sem a coluna, o builder usa o do frame
+                pct_comissao=[model.raw_value(linha, i_pct) for linha, _ in adicionadas] if i_pct is not None else None,
+                criado_por="PySide6-App",
+            )
 
+            loading.update_message(f"{Icons.LOADING} Gravando {len(params_batch)} registro(s)")
             with get_conn(self.cfg) as conn:
                 cur = conn.cursor()
-                total = len(selected_rows)
-                
-                for i, s in enumerate(sorted(selected_rows, reverse=True), 1):
-                    loading.update_message(f"{Icons.LOADING} Processando {i}/{total}")
-                    
-                    view_row = model.rows[s]
-                    id_val = str(view_row[ix["ID"]]).strip()
-                    tit_val = str(view_row[ix["Titulo"]]).strip() if ix["Titulo"] is not None else None
-                    cli_val = str(view_row[ix["Cliente"]]).strip() if ix["Cliente"] is not None else None
-
-                    df = self.df_result
-                    mask = df["ID"].astype(str).str.strip().eq(id_val)
-                    if tit_val is not None:
-                        mask &= df["Titulo"].astype(str).str.strip().eq(tit_val)
-                    if cli_val is not None:
-                        mask &= df["Cliente"].astype(str).str.strip().eq(cli_val)
-                    
-                    mt = df[mask]
-                    if mt.empty:
-                        errors += 1
-                        continue
-
-                    row = mt.iloc[0].to_dict()
-
-                    insert_extrato_row(
-                        cur,
-                        row,
-                        pct_comissao=view_row[ix["% Comissão"]] if ix["% Comissão"] is not None else row.get("% Comissão", 0),
-                        criado_por="PySide6-App",
-                    )
-                    
-                    inserted += 1
-                    model.remove_rows([s])
-                    self.df_result.drop(mt.index[0], inplace=True)
-
+                verificar_schema_extrato(cur)
+                inserted = insert_extrato_rows(cur, params_batch)
                 conn.commit()
-            
+
+            model.remove_rows([linha for linha, _ in adicionadas])
+            self.df_result = self.df_result.drop(index=[rotulo for _, rotulo in adicionadas])
+
             loading.close_overlay()
             QuickFeedback.show(self, f"{inserted} registro(s) adicionado(s) ao extrato", success=True)
             
@@ -7,10 +7,12 @@ RESPONSIVA | OTIMIZADA | COM FEEDBACKS | LAYOUT PADRONIZADO
 from __future__ import annotations
 
 import os
+import time
 from calendar import monthrange
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 from PySide6.QtCore import QDate, Qt, QTimer, QThread, Signal
 from PySide6.QtWidgets import (
@@ -23,17 +25,118 @@ from PySide6.QtWidgets import (
 
 from config import DBConfig, get_conn
 from models import EditableTableModel, DecimalDelegate, ExcelLikeTableView
-from utils.formatters import br_to_decimal, apply_display_formats, comp_br
+from utils.formatters import br_to_decimal, comp_br
 from constants import PT_BR_MONTHS, VENDEDOR_EMAIL_NORMALIZADO
-from utils.email_sender import enviar_email_comissao
+from ui.async_loader import AsyncLoader
+from ui.write_queue_runner import WriteQueueRunner
 from ui.loading_overlay import LoadingOverlay, QuickFeedback
+from ui.column_widths import ColumnWidths
 from ui.icons import Icons
 
-from rules.rules_engine import Rule, Condition, apply_rules_to_row
+from rules.rules_engine import Rule, rules_from_dicts
+from rules.rules_pipeline import apply_rules_to_frame
 from rules.rules_store import load_rules
-from rules.rules_audit import append_jsonl, build_edit_event, generate_session_id
-from ui.rule_editor_dialog import RuleEditorDialog
-from tabs.sincronizacao import SyncService, SyncWorker
+from rules.rules_audit import append_jsonl, append_jsonl_many, build_edit_event, generate_session_id
+from rules.rules_sql import aplicar_regras_no_servidor
+from rules.rules_versions import fetch_missing_snapshots, load_snapshot, rule_names, snapshot_rules, store_snapshot
+from utils.db_schema import ALTERACOES_RETENCAO_DIAS, verificar_schema_extrato
+from utils.extrato_reader import (
+    fetch_extrato,
+    fetch_extrato_alterados,
+    fetch_extrato_apagados,
+    fetch_extrato_ids,
+    fetch_extrato_periodo,
+    versao_corte,
+)
+from utils.local_replica import abrir_replica
+from utils.write_queue import edicoes_para_fila
+
+
+COLUNAS_DERIVADAS = ("% Diferença", "Valor Comissão Padrão", "Diferença R$")
+
+# feed de alterações (outros usuários) enquanto a aba está visível
+INTERVALO_ALTERACOES_MS = 15 * 1000
+# parado há mais tempo que isso (PC suspenso etc.) o log pode ter sido limpo: carga completa
+ALTERACOES_MAX_PARADO_S = ALTERACOES_RETENCAO_DIAS * 24 * 3600 // 2
+
+
+def _colunas_derivadas(df: pd.DataFrame) -> None:
+    """Diferenças entre o % aplicado e o % padrão (in-place)."""
+    df["% Diferença"] = (df["% Comissão"] - df["% Percentual Padrão"]).round(4)
+    df["Valor Comissão Padrão"] = (df["Recebido"] * (df["% Percentual Padrão"] / 100)).round(2)
+    df["Diferença R$"] = (df["Valor Comissão"] - df["Valor Comissão Padrão"]).round(2)
+
+
+def _fmt_datas(serie) -> pd.Series:
+    return pd.to_datetime(pd.Series(serie), errors="coerce").dt.strftime("%d/%m/%Y")
+
+
+def _baixar_snapshots(cur, rules_path, df):
+    """Snapshots das versões de regra aplicadas em outra máquina (nome da coluna Regra)."""
+    if not df.empty and "RegraVersao" in df.columns:
+        fetch_missing_snapshots(cur, rules_path, df["RegraVersao"].dropna().unique())
+
+
+def _carregar_extrato(token, cfg, rules_path, preparar):
+    """
+    Roda no LoadWorker: lê o extrato e devolve (df, datas, corte), com
+    preparar(df) -> (df, datas) e o corte de versão lido antes da leitura.
+    Com réplica local, só o que mudou vem do servidor.
+    """
+    replica = abrir_replica(cfg)
+    with get_conn(cfg) as conn:
+        cur = conn.cursor()
+        token.bind(cur)
+        verificar_schema_extrato(cur)
+        if replica is not None:
+            corte = replica.sincronizar_extrato(cur)
+            df = replica.ler_extrato()
+        else:
+            corte = versao_corte(cur)
+            df = fetch_extrato(cur)
+        _baixar_snapshots(cur, rules_path, df)
+    token.check()
+    df, datas = preparar(df)
+    return df, datas, corte
+
+
+def _carregar_alteracoes(token, cfg, rules_path, desde, preparar):
+    """
+    Roda no LoadWorker: linhas inseridas/alteradas e Ids apagados desde o
+    corte `desde`, mais o corte novo (lido antes, como na carga completa).
+    """
+    with get_conn(cfg) as conn:
+        cur = conn.cursor()
+        token.bind(cur)
+        corte = versao_corte(cur)
+        df = fetch_extrato_alterados(cur, desde)
+        apagados = fetch_extrato_apagados(cur, desde)
+        _baixar_snapshots(cur, rules_path, df)
+    token.check()
+    datas: Dict[str, np.ndarray] = {}
+    if not df.empty:
+        df, datas = preparar(df)
+    return {"desde": desde, "corte": corte, "df": df, "datas": datas, "apagados": apagados}
+
+
+def _carregar_releitura(token, cfg, rules_path, pedido, preparar):
+    """
+    Roda no LoadWorker: relê do banco as linhas de um pedido de releitura,
+    ("linhas", ids) ou ("escopo", (data_ini, data_fim, vendedor)).
+    """
+    tipo, alvo = pedido
+    with get_conn(cfg) as conn:
+        cur = conn.cursor()
+        token.bind(cur)
+        if tipo == "linhas":
+            df = fetch_extrato_ids(cur, alvo)
+        else:
+            verificar_schema_extrato(cur)
+            df = fetch_extrato_periodo(cur, *alvo)
+        _baixar_snapshots(cur, rules_path, df)
+    token.check()
+    df, datas = preparar(df)
+    return {"pedido": pedido, "df": df, "datas": datas}
 
 
 class SyncApplyWorker(QThread):
@@ -45,6 +148,7 @@ class SyncApplyWorker(QThread):
         self.resultado = resultado
 
     def run(self):
+        from tabs.sincronizacao import SyncService
         try:
             resumo = SyncService(self.cfg).sync_result(self.resultado)
             self.finished.emit({"ok": True, "resumo": resumo})
@@ -63,7 +167,17 @@ class TabExtrato(QWidget):
         self.role = role
         self.username = username
         self.cfg = DBConfig()
-        self.df_extrato = pd.DataFrame()
+        # extrato completo (última carga); a grade mostra o recorte dos filtros
+        self.df_all = pd.DataFrame()
+        # VersaoLinha a partir da qual o banco pode ter novidade (ver atualizar_alteracoes)
+        self._versao_corte: Optional[int] = None
+        self._filtro_codigos: Dict[str, Any] = {}
+        # DBIds com RegraVersao/RegraId alterados em tela (colunas ocultas, fora
+        # do controle de células sujas do model) ainda não salvos
+        self._proveniencia_pendente: set = set()
+        # DBIds validados no banco cujo e-mail ao vendedor ainda não saiu (sem a linha na grade)
+        self._emails_validacao: set = set()
+        self._filtro_datas: Dict[str, np.ndarray] = {}
 
         base_dir = os.path.dirname(os.path.dirname(__file__))  # .../Comissao_teste
 
@@ -87,9 +201,38 @@ class TabExtrato(QWidget):
         self._sync_check_worker = None
         self._sync_apply_worker = None
         self._sync_apply_overlay = None
+        self._larguras = ColumnWidths("extrato", username)
+        self._triggers_edicao = None
+
+        # carga do extrato em thread: a grade antiga fica na tela até chegar a nova
+        self._carga = AsyncLoader(self)
+        self._carga.loaded.connect(self._on_extrato_carregado)
+        self._carga.failed.connect(self._on_falha_carga)
+        self._carga.busy_changed.connect(self._on_carga_ocupada)
+
+        # feed de alterações: só o que mudou no banco desde o último corte
+        self._feed = AsyncLoader(self)
+        self._feed.loaded.connect(self._on_alteracoes)
+        self._feed.failed.connect(lambda p: print(f"⚠️ Falha ao ler alterações do extrato: {p.get('erro')}"))
+        self._ultimo_feed = 0.0
+
+        # releitura de linhas/escopo depois de gravar/sincronizar; uma por vez, as outras esperam
+        self._releitura = AsyncLoader(self)
+        self._releitura.loaded.connect(self._on_releitura)
+        self._releitura.failed.connect(self._on_falha_releitura)
+        self._releituras_pendentes: List[tuple] = []
 
         self._setup_ui()
         self._setup_sync_monitor()
+        self._setup_feed_alteracoes()
+
+        # salvar/validar/remover vão para a fila local e são gravados em segundo plano
+        self._fila = WriteQueueRunner(self.cfg, username, self)
+        self._fila.applied.connect(self._on_fila_aplicada)
+        self._fila.failed.connect(self._on_fila_falhou)
+        self._fila.state_changed.connect(self._on_fila_estado)
+        self._fila.offline.connect(lambda msg: print(f"⚠️ Fila de gravação sem banco, nova tentativa em breve: {msg}"))
+        self._on_fila_estado(*self._fila.contagem())
 
     # ============================================================
     # UI
@@ -305,6 +448,12 @@ class TabExtrato(QWidget):
         filtros_layout.setColumnMinimumWidth(4, 64)
         filtros_layout.setColumnMinimumWidth(6, 74)
 
+        # filtros só recortam o que já foi carregado (sem ir ao banco)
+        for cmb in (self.cmb_comp, self.cmb_vend, self.cmb_artigo, self.cmb_uf):
+            cmb.currentTextChanged.connect(self._aplicar_filtros)
+        for dt in (self.dt_emissao_ini, self.dt_emissao_fim, self.dt_recebimento_ini, self.dt_recebimento_fim):
+            dt.dateChanged.connect(self._aplicar_filtros)
+
         layout.addWidget(filtros_container)
 
     def _create_action_buttons(self, layout):
@@ -367,7 +516,10 @@ class TabExtrato(QWidget):
         self.act_sincronizar = self.more_menu.addAction("Sincronizar")
         self.more_menu.addSeparator()
         self.act_aplicar_regras = self.more_menu.addAction("Aplicar Regras")
+        self.act_aplicar_regras_servidor = self.more_menu.addAction("Aplicar Regras no servidor (escopo)")
+        self.act_reaplicar_desatualizadas = self.more_menu.addAction("Reaplicar Regras no servidor (só desatualizadas)")
         self.act_gerenciar_regras = self.more_menu.addAction("Criar Regras")
+        self.act_historico_auditoria = self.more_menu.addAction("Histórico de auditoria")
         self.btn_more.setMenu(self.more_menu)
 
         row1.addStretch()
@@ -376,7 +528,7 @@ class TabExtrato(QWidget):
         card_lay.addLayout(row1)
 
         # Conectar eventos
-        self.btn_refresh.clicked.connect(self.refresh_extrato)
+        self._carga.bind_button(self.btn_refresh, self._on_atualizar_clicked)
         self.btn_salvar.clicked.connect(self.on_salvar_alteracoes)
         self.btn_validar.clicked.connect(self.on_validar)
         self.btn_enviar.clicked.connect(self.on_enviar_emails)
@@ -389,7 +541,12 @@ class TabExtrato(QWidget):
         self.act_aplicar_todos.triggered.connect(self._aplicar_pct_todos)
         self.act_sincronizar.triggered.connect(self.abrir_sincronizacao)
         self.act_aplicar_regras.triggered.connect(self._aplicar_regras_teste)
+        self.act_aplicar_regras_servidor.triggered.connect(lambda: self._aplicar_regras_servidor())
+        self.act_reaplicar_desatualizadas.triggered.connect(
+            lambda: self._aplicar_regras_servidor(somente_desatualizadas=True)
+        )
         self.act_gerenciar_regras.triggered.connect(self._abrir_gerenciador_regras)
+        self.act_historico_auditoria.triggered.connect(self._abrir_historico_auditoria)
 
         # Permissões
         self._configure_button_permissions()
@@ -398,6 +555,10 @@ class TabExtrato(QWidget):
 
     def _configure_button_permissions(self):
         """Configura permissões dos botões baseado no perfil."""
+        self.act_aplicar_regras_servidor.setVisible(self.role in ("gestora", "admin", "controladoria"))
+        self.act_reaplicar_desatualizadas.setVisible(self.role in ("gestora", "admin", "controladoria"))
+        self.act_historico_auditoria.setVisible(self.role in ("gestora", "admin", "controladoria"))
+
         if self.role in ("gestora", "admin"):
             self.btn_enviar.hide()
         elif self.role == "controladoria":
@@ -418,7 +579,10 @@ class TabExtrato(QWidget):
             self.act_aplicar_todos.isVisible(),
             self.act_sincronizar.isVisible(),
             self.act_aplicar_regras.isVisible(),
+            self.act_aplicar_regras_servidor.isVisible(),
+            self.act_reaplicar_desatualizadas.isVisible(),
             self.act_gerenciar_regras.isVisible(),
+            self.act_historico_auditoria.isVisible(),
         ]))
 
     def _create_table(self, layout):
@@ -434,6 +598,21 @@ class TabExtrato(QWidget):
 
     def _create_footer(self, layout):
         linha_inferior = QHBoxLayout()
+
+        self.lbl_fila = QLabel("")
+        self.lbl_fila.setStyleSheet("font-weight: 600; color: #9ca3af; font-size: 13px;")
+        linha_inferior.addWidget(self.lbl_fila)
+
+        self.btn_reenviar_fila = QPushButton("Reenviar falhas")
+        self.btn_reenviar_fila.setVisible(False)
+        self.btn_reenviar_fila.clicked.connect(self._reenviar_falhas_fila)
+        linha_inferior.addWidget(self.btn_reenviar_fila)
+
+        self.btn_descartar_fila = QPushButton("Descartar falhas")
+        self.btn_descartar_fila.setVisible(False)
+        self.btn_descartar_fila.clicked.connect(self._descartar_falhas_fila)
+        linha_inferior.addWidget(self.btn_descartar_fila)
+
         linha_inferior.addStretch()
 
         self.lbl_count_extrato = QLabel("0 registro(s)")
@@ -457,6 +636,18 @@ class TabExtrato(QWidget):
         self._sync_debounce_timer.setInterval(1200)
         self._sync_debounce_timer.timeout.connect(self.check_sync_status)
 
+    def _setup_feed_alteracoes(self):
+        self._feed_timer = QTimer(self)
+        self._feed_timer.setInterval(INTERVALO_ALTERACOES_MS)
+        self._feed_timer.timeout.connect(self._poll_alteracoes)
+        self._feed_timer.start()
+
+    def _poll_alteracoes(self):
+        # antes da primeira carga (ou com carga em andamento) não há base para o delta
+        if not self.isVisible() or self._versao_corte is None or self._carga.is_busy or self._feed.is_busy:
+            return
+        self.atualizar_alteracoes()
+
     def _schedule_sync_check(self, delay_ms: int = 1200):
         if hasattr(self, "_sync_debounce_timer") and self.isVisible():
             self._sync_debounce_timer.start(delay_ms)
@@ -482,6 +673,7 @@ class TabExtrato(QWidget):
         if scope is None:
             return None, None
 
+        from tabs.sincronizacao import SyncService
         data_ini, data_fim, vendedor = scope
         service = SyncService(self.cfg)
         return scope, service.analyze(data_ini, data_fim, vendedor)
@@ -509,6 +701,7 @@ class TabExtrato(QWidget):
         self.btn_sync_check_now.setText("Verificando...")
         self.btn_sync_apply_now.setEnabled(False)
 
+        from tabs.sincronizacao import SyncWorker
         worker = SyncWorker(data_ini, data_fim, vendedor, self.cfg)
         self._sync_check_worker = worker
         worker.finished.connect(self._on_async_sync_check_finished)
@@ -635,6 +828,7 @@ class TabExtrato(QWidget):
     def _on_sync_apply_finished(self, payload):
         worker = self._sync_apply_worker
         self._sync_apply_worker = None
+        resultado_sync = worker.resultado if worker is not None else None
         if worker is not None:
             try:
                 worker.finished.disconnect(self._on_sync_apply_finished)
@@ -667,7 +861,7 @@ class TabExtrato(QWidget):
 
         resumo = payload.get("resumo", {})
         self._pending_sync_result = None
-        self.refresh_extrato()
+        self._reler_apos_sync(resultado_sync)
         self._set_sync_banner(
             f"Sincronizacao concluida com sucesso: {resumo.get('total', 0)} operacao(oes).",
             state="success",
@@ -684,13 +878,13 @@ class TabExtrato(QWidget):
         self.dt_emissao_ini.setEnabled(checked)
         self.dt_emissao_fim.setEnabled(checked)
         self.lbl_ate_emissao.setEnabled(checked)
-        self.refresh_extrato()
+        self._aplicar_filtros()
 
     def _toggle_recebimento_filter(self, checked):
         self.dt_recebimento_ini.setEnabled(checked)
         self.dt_recebimento_fim.setEnabled(checked)
         self.lbl_ate_recebimento.setEnabled(checked)
-        self.refresh_extrato()
+        self._aplicar_filtros()
 
     # ============================================================
     # Fluxos extras
@@ -706,6 +900,16 @@ class TabExtrato(QWidget):
     def get_filtered_data(self) -> pd.DataFrame:
         return self.df_extrato.copy()
 
+    def has_pending_edits(self) -> bool:
+        """Há edições na grade ainda não salvas, ou operações da fila ainda não gravadas no banco."""
+        model = self.tbl_extrato.model()
+        if isinstance(model, EditableTableModel) and model.has_changes():
+            return True
+        if self._proveniencia_pendente:
+            return True
+        pendentes, falhas = self._fila.contagem()
+        return pendentes + falhas > 0
+
     def ensure_current_data_synced(self, action_label: str = "continuar") -> bool:
         loading = LoadingOverlay(self.window(), f"{Icons.LOADING} Verificando sincronizacao")
         loading.show_overlay()
@@ -757,10 +961,11 @@ class TabExtrato(QWidget):
         loading = LoadingOverlay(self.window(), f"{Icons.LOADING} Sincronizando extrato")
         loading.show_overlay()
         try:
+            from tabs.sincronizacao import SyncService
             service = SyncService(self.cfg)
             resumo = service.sync_result(resultado)
             self._pending_sync_result = None
-            self.refresh_extrato()
+            self._reler_apos_sync(resultado)
             self._set_sync_banner(
                 f"Sincronizacao concluida com sucesso: {resumo['total']} operacao(oes).",
                 state="success",
@@ -805,13 +1010,14 @@ class TabExtrato(QWidget):
                 data_ini = self.dt_recebimento_ini.date().toPython()
                 data_fim = self.dt_recebimento_fim.date().toPython()
 
+        visiveis = self._linhas_visiveis()
+
         if data_ini is None or data_fim is None:
-            if self.df_extrato.empty or "Recebimento" not in self.df_extrato.columns:
+            datas = self._filtro_datas.get("Recebimento")
+            if datas is None or len(visiveis) == 0:
                 return None
 
-            recebimentos = pd.to_datetime(
-                self.df_extrato["Recebimento"], dayfirst=True, errors="coerce"
-            ).dropna()
+            recebimentos = pd.Series(datas[visiveis]).dropna()
             if recebimentos.empty:
                 return None
 
@@ -822,109 +1028,425 @@ class TabExtrato(QWidget):
         chosen_v = self.cmb_vend.currentText()
         if chosen_v and chosen_v != "(todos)":
             vendedor = chosen_v
-        else:
-            vendedores = self.df_extrato.get("Vendedor")
-            if vendedores is not None:
-                unicos = sorted(set(v for v in vendedores.dropna().astype(str).unique() if v))
-                if len(unicos) == 1:
-                    vendedor = unicos[0]
+        elif "Vendedor" in self.df_all.columns:
+            vendedores = self.df_all["Vendedor"].iloc[visiveis]
+            unicos = sorted(set(v for v in vendedores.dropna().astype(str).unique() if v))
+            if len(unicos) == 1:
+                vendedor = unicos[0]
 
         return data_ini, data_fim, vendedor
 
     def _abrir_gerenciador_regras(self):
         # Campos disponíveis: use as colunas atuais do df se tiver
-        if not self.df_extrato.empty:
-            fields = list(self.df_extrato.columns)
+        if not self.df_all.empty:
+            fields = list(self.df_all.columns)
         else:
             fields = [
                 "Vendedor", "Cliente", "UF", "Artigo", "Prazo Médio", "Preço Venda",
                 "% Percentual Padrão", "% Comissão", "Recebido", "Rec Liquido", "Competência"
             ]
 
+        from ui.rule_editor_dialog import RuleEditorDialog
         dlg = RuleEditorDialog(rules_path=self.rules_path, available_fields=fields, parent=self)
         if dlg.exec() == QDialog.Accepted:
             self.rules_memoria = self._load_rules_from_json()
             QuickFeedback.show(self, "Regras atualizadas.", success=True)
 
+    def _abrir_historico_auditoria(self):
+        """Abre a consulta de auditoria; com uma linha selecionada, já filtra pelo DBId dela."""
+        dbid = None
+        model = self.tbl_extrato.model()
+        current = self.tbl_extrato.currentIndex()
+        if model is not None and current.isValid() and "DBId" in getattr(model, "headers", []):
+            valor = model.rows[current.row()][model.headers.index("DBId")]
+            try:
+                dbid = int(float(str(valor).replace(".", "").replace(",", ".")))
+            except (TypeError, ValueError):
+                dbid = None
+
+        from ui.audit_history_dialog import AuditHistoryDialog
+        dlg = AuditHistoryDialog(log_path=self.audit_log_path, dbid=dbid, parent=self)
+        dlg.exec()
+
     # ============================================================
     # Refresh / Data
     # ============================================================
 
     def refresh_extrato(self):
-        parent_window = self.window()
-        loading = LoadingOverlay(parent_window, f"{Icons.LOADING} Carregando extrato")
-        loading.show_overlay()
+        """Recarrega o extrato inteiro em segundo plano (ver _on_extrato_carregado)."""
+        self._feed.cancel()
+        self._releitura.cancel()
+        self._releituras_pendentes.clear()
+        self._carga.start(_carregar_extrato, self.cfg, self.rules_path, self._preparar_extrato)
 
-        try:
-            with get_conn(self.cfg) as conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT Id as DBId, Competencia, Doc as ID, VendedorID, Vendedor, Titulo, Cliente, UF,
-                        Artigo, Linha, Recebido, ICMSST, Frete, RecebimentoLiq as [Rec Liquido],
-                        PrazoMedio as [Prazo Médio], PrecoMedio as [Preço Médio], PrecoVenda as [Preço Venda],
-                        MeioPagamento as [M Pagamento], Emissao as [Emissão], Vencimento as [Vencimento],
-                        DataRecebimento as [Recebimento], PercComissao as [% Comissão], ValorComissao as [Valor Comissão],
-                        Observacao as [Observação], Validado, ValidadoPor, ValidadoEm, Consolidado,
-                        Percentual_Comissao as [% Percentual Padrão]
-                    FROM dbo.Stik_Extrato_Comissoes
-                    ORDER BY DataRecebimento DESC, Id DESC
-                """)
-                rows = cur.fetchall()
-                cols = [d[0] for d in cur.description]
-
-            df = pd.DataFrame.from_records(rows, columns=cols)
-
-            for col in ["% Comissão", "% Percentual Padrão", "Recebido", "Valor Comissão"]:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-
-            df["% Comissão"] = df["% Comissão"].round(4)
-            df["% Percentual Padrão"] = df["% Percentual Padrão"].round(4)
-
-            df["% Diferença"] = (df["% Comissão"] - df["% Percentual Padrão"]).round(4)
-
-            df["Valor Comissão Padrão"] = (
-                df["Recebido"] * (df["% Percentual Padrão"] / 100)
-            ).round(2)
-
-            df["Diferença R$"] = (
-                df["Valor Comissão"] - df["Valor Comissão Padrão"]
-            ).round(2)
+    def _on_atualizar_clicked(self):
+        model = self.tbl_extrato.model()
+        if isinstance(model, EditableTableModel) and (model.has_changes() or self._proveniencia_pendente):
+            prov = self._posicoes_dbid(sorted(self._proveniencia_pendente))
+            n = len(np.union1d(model.dirty_rows(), prov[prov >= 0]))
+            reply = QMessageBox.question(
+                self,
+                "Atualizar",
+                f"Há {n} linha(s) com alterações não salvas.\n"
+                "Recarregar o extrato e descartar essas alterações?",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No,
+            )
+            if reply != QMessageBox.Yes:
+                return
+        self.refresh_extrato()
 
-        except Exception as e:
-            loading.close_overlay()
-            QMessageBox.critical(self, "Extrato", f"Erro ao carregar extrato: {e}")
-            return
+    def _on_carga_ocupada(self, ocupado: bool):
+        # durante a carga a grade antiga fica visível, mas sem edição:
+        # o que fosse digitado nela seria substituído pela carga nova
+        if ocupado:
+            if self._triggers_edicao is None:
+                self._triggers_edicao = self.tbl_extrato.editTriggers()
+            self.tbl_extrato.setEditTriggers(QAbstractItemView.NoEditTriggers)
+            self.lbl_count_extrato.setText(f"{Icons.LOADING} Carregando extrato...")
+        else:
+            if self._triggers_edicao is not None:
+                self.tbl_extrato.setEditTriggers(self._triggers_edicao)
+                self._triggers_edicao = None
+            model = self.tbl_extrato.model()
+            self.lbl_count_extrato.setText(f"{model.rowCount() if model else 0} registro(s)")
+
+    def _on_falha_carga(self, payload: dict):
+        QMessageBox.critical(self, "Extrato", f"Erro ao carregar extrato: {payload.get('erro')}")
+
+    def _on_extrato_carregado(self, resultado):
+        df, datas, self._versao_corte = resultado
+        self._ultimo_feed = time.time()
+        self._update_combos(df)
+
+        self.df_all = df.reset_index(drop=True)
+        self._proveniencia_pendente.clear()
+        self._preparar_filtros(datas)
+        self._display_extrato(self.df_all)
+        self._aplicar_filtros()
 
-        loading.update_message(f"{Icons.LOADING} Processando dados...")
+        QuickFeedback.show(self, f"{self.tbl_extrato.model().rowCount()} registro(s) no extrato", success=True)
+        if self._emails_validacao:
+            self._enviar_emails_validacao()
+
+    def _preparar_extrato(self, df: pd.DataFrame):
+        """
+        Colunas derivadas e datas formatadas sobre o resultado de utils.extrato_reader.
+        Retorna (df, datas), com as datas parseadas usadas pelos filtros de período.
+        """
+        for col in ["% Comissão", "% Percentual Padrão", "Recebido", "Valor Comissão"]:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+
+        df["% Comissão"] = df["% Comissão"].round(4)
+        df["% Percentual Padrão"] = df["% Percentual Padrão"].round(4)
+        _colunas_derivadas(df)
+
+        df["Regra"] = self._nomes_regras(df)
 
         if "Recebimento" in df.columns:
             df["Competência"] = df["Recebimento"].apply(comp_br)
 
+        # datas dos filtros de período: parseadas uma vez por carga
+        datas: Dict[str, np.ndarray] = {}
+        for c in ("Emissão", "Recebimento"):
+            if c in df.columns:
+                datas[c] = pd.to_datetime(df[c], errors="coerce").dt.normalize().to_numpy()
+
         for c in ("Emissão", "Vencimento", "Recebimento", "ValidadoEm"):
             if c in df.columns:
-                df[c] = pd.to_datetime(df[c], errors="coerce").dt.strftime("%d/%m/%Y")
+                df[c] = _fmt_datas(df[c])
 
-        self._update_combos(df)
-        df = self._apply_filters(df)
+        return df, datas
 
-        self.df_extrato = df.copy()
-        self._display_extrato(df)
+    # ============================================================
+    # Atualização parcial (depois de gravar)
+    # ============================================================
 
-        total = len(df)
-        self.lbl_count_extrato.setText(f"{total} registro(s)")
+    def _posicoes_dbid(self, ids) -> np.ndarray:
+        """Posição em df_all de cada DBId (-1 se não estiver carregado)."""
+        if self.df_all.empty or "DBId" not in self.df_all.columns:
+            return np.full(len(ids), -1, dtype=np.intp)
+        return pd.Index(self.df_all["DBId"]).get_indexer(list(ids))
 
-        try:
-            self.tbl_extrato.selectionModel().selectionChanged.disconnect()
-        except Exception:
-            pass
+    def _recarregar_se_em_carga(self) -> bool:
+        """
+        Se há carga completa em andamento, ela pode ter lido o banco antes da
+        gravação que acabou de acontecer: recomeça a carga em vez do patch.
+        """
+        if not self._carga.is_busy:
+            return False
+        self.refresh_extrato()
+        return True
 
-        self.tbl_extrato.selectionModel().selectionChanged.connect(self._atualizar_total_recebido)
+    def _grade_sincronizada(self) -> bool:
+        model = self.tbl_extrato.model()
+        return isinstance(model, EditableTableModel) and model.source_count() == len(self.df_all)
+
+    def _aplicar_patch(self, df_novo: pd.DataFrame, edicao: bool = False):
+        """
+        Grava em df_all e no model (in-place, via dataChanged) os valores das
+        linhas de df_novo (casadas por DBId). Colunas derivadas são recalculadas.
+        Por padrão são valores do banco; com edicao=True (alteração feita em
+        tela) as células ficam como edição pendente até salvar.
+        """
+        if df_novo.empty or not self._grade_sincronizada():
+            return
+
+        pos = self._posicoes_dbid(df_novo["DBId"])
+        achadas = pos >= 0
+        if not achadas.any():
+            return
+        df_novo = df_novo[achadas]
+        pos = pos[achadas]
+
+        cols = [c for c in df_novo.columns if c != "DBId" and c in self.df_all.columns]
+        if edicao:
+            self._marcar_proveniencia(df_novo, pos, cols)
+        alvo = self.df_all.iloc[pos].copy()
+        for c in cols:
+            alvo[c] = df_novo[c].to_numpy()
+        _colunas_derivadas(alvo)
+        if "RegraId" in cols:
+            alvo["Regra"] = self._nomes_regras(alvo)
+
+        alvo_cols = set(cols) | set(COLUNAS_DERIVADAS) | {"Regra"}
+        mudadas = [c for c in self.df_all.columns if c in alvo_cols]
+        for c in mudadas:
+            j = self.df_all.columns.get_loc(c)
+            try:
+                self.df_all.iloc[pos, j] = alvo[c].to_numpy()
+            except (TypeError, ValueError):
+                # tipo diferente do carregado (ex.: coluna que veio toda nula)
+                self.df_all[c] = self.df_all[c].astype(object)
+                self.df_all.iloc[pos, j] = alvo[c].to_numpy()
+
+        valores = {c: alvo[c].to_numpy() for c in mudadas}
+        model = self.tbl_extrato.model()
+        if edicao:
+            editadas = set(cols) | {"Regra"}
+            model.update_rows(pos, {c: v for c, v in valores.items() if c in editadas}, edicao=True)
+            model.update_rows(pos, {c: v for c, v in valores.items() if c not in editadas})
+        else:
+            model.update_rows(pos, valores)
         self._atualizar_total_recebido()
 
-        loading.close_overlay()
-        QuickFeedback.show(self, f"{total} registro(s) no extrato", success=True)
-        self._schedule_sync_check(4000)
+    def _marcar_proveniencia(self, df_novo: pd.DataFrame, pos: np.ndarray, cols: List[str]):
+        """Edição em tela que muda RegraVersao/RegraId: a linha passa a ter o que salvar."""
+        mudou = np.zeros(len(pos), dtype=bool)
+        for c in ("RegraVersao", "RegraId"):
+            if c not in cols:
+                continue
+            antes = self.df_all[c].to_numpy(dtype=object)[pos]
+            depois = df_novo[c].to_numpy(dtype=object)
+            mudou |= ~((antes == depois) | (pd.isna(antes) & pd.isna(depois)))
+        self._proveniencia_pendente.update(int(i) for i in df_novo["DBId"].to_numpy()[mudou])
+
+    def _remover_da_grade(self, ids):
+        """Tira de df_all e do model as linhas dos DBIds informados."""
+        if self._recarregar_se_em_carga() or not self._grade_sincronizada():
+            return
+        pos = self._posicoes_dbid(ids)
+        pos = pos[pos >= 0]
+        if len(pos) == 0:
+            return
+
+        self.tbl_extrato.model().remove_source_rows(pos)
+        self._proveniencia_pendente.difference_update(int(i) for i in self.df_all["DBId"].to_numpy()[pos])
+
+        manter = np.ones(len(self.df_all), dtype=bool)
+        manter[pos] = False
+        self.df_all = self.df_all[manter].reset_index(drop=True)
+        self._preparar_filtros({c: d[manter] for c, d in self._filtro_datas.items()})
+
+        model = self.tbl_extrato.model()
+        self.lbl_count_extrato.setText(f"{model.rowCount()} registro(s)")
+        self._atualizar_total_recebido()
+
+    def _reler_linhas(self, ids):
+        """
+        Relê do banco só as linhas dos DBIds, em segundo plano, e atualiza a
+        grade (ver _on_releitura); as que não existem mais saem da grade.
+        """
+        ids = [int(i) for i in ids]
+        if not ids or self._recarregar_se_em_carga():
+            return
+        self._pedir_releitura(("linhas", ids))
+
+    def _reler_escopo(self, data_ini, data_fim, vendedor=None):
+        """
+        Troca em df_all as linhas do escopo (período de recebimento + vendedor)
+        pelo que está no banco, lido em segundo plano. Usado depois de
+        sincronizar/aplicar regras, que podem inserir e remover linhas; o
+        resto do extrato não é baixado.
+        """
+        if self._recarregar_se_em_carga():
+            return
+        if self.df_all.empty or self._filtro_datas.get("Recebimento") is None:
+            self.refresh_extrato()
+            return
+        self._pedir_releitura(("escopo", (data_ini, data_fim, vendedor)))
+
+    def _pedir_releitura(self, pedido):
+        # start() descartaria a releitura em andamento: com uma rodando, a nova espera
+        if not self._releitura.is_busy:
+            self._releitura.start(_carregar_releitura, self.cfg, self.rules_path, pedido, self._preparar_extrato)
+            return
+        if pedido[0] == "linhas":
+            for i, (tipo, alvo) in enumerate(self._releituras_pendentes):
+                if tipo == "linhas":
+                    self._releituras_pendentes[i] = ("linhas", sorted(set(alvo) | set(pedido[1])))
+                    return
+        self._releituras_pendentes.append(pedido)
+
+    def _on_releitura(self, resultado):
+        # uma carga completa começou depois: ela já traz o que foi relido
+        if self._carga.is_busy:
+            self._releituras_pendentes.clear()
+            return
+        tipo, alvo = resultado["pedido"]
+        if tipo == "linhas":
+            self._aplicar_linhas_relidas(alvo, resultado["df"])
+        else:
+            self._aplicar_escopo_relido(*alvo, resultado["df"], resultado["datas"])
+        if self._releituras_pendentes:
+            self._pedir_releitura(self._releituras_pendentes.pop(0))
+
+    def _on_falha_releitura(self, payload):
+        print(f"⚠️ Falha ao reler linhas do extrato: {payload.get('erro')}")
+        self.refresh_extrato()
+
+    def _aplicar_linhas_relidas(self, ids, df):
+        # o que veio do banco substitui a proveniência alterada em tela
+        self._proveniencia_pendente.difference_update(ids)
+        self._aplicar_patch(df)
+
+        voltaram = set(int(i) for i in df["DBId"]) if not df.empty else set()
+        self._remover_da_grade([i for i in ids if i not in voltaram])
+
+    def _aplicar_escopo_relido(self, data_ini, data_fim, vendedor, df_novo, datas_novo):
+        datas_receb = self._filtro_datas.get("Recebimento")
+        if self.df_all.empty or datas_receb is None or not self._grade_sincronizada():
+            self.refresh_extrato()
+            return
+
+        no_escopo = (datas_receb >= np.datetime64(data_ini)) & (datas_receb <= np.datetime64(data_fim))
+        if vendedor:
+            no_escopo &= (self.df_all["Vendedor"].astype(str) == str(vendedor)).to_numpy()
+
+        fica = ~no_escopo
+        # edições ainda não salvas fora do escopo relido continuam pendentes
+        pendentes = self._edicoes_pendentes(fica)
+        self._proveniencia_pendente.difference_update(int(i) for i in self.df_all["DBId"].to_numpy()[no_escopo])
+        df_all = pd.concat([self.df_all[fica], df_novo], ignore_index=True)
+        datas = {
+            c: np.concatenate([d[fica], datas_novo.get(c, np.full(len(df_novo), np.datetime64("NaT")))])
+            for c, d in self._filtro_datas.items()
+        }
+
+        self._update_combos(df_all)
+        self.df_all = df_all
+        self._preparar_filtros(datas)
+        self._recarregar_grade()
+        self._restaurar_edicoes(pendentes)
+
+    def atualizar_alteracoes(self):
+        """
+        Traz só o que mudou no banco desde a última leitura (linhas com
+        VersaoLinha nova + apagadas pelo log de alterações), em segundo plano,
+        em vez de recarregar o extrato inteiro. Sem carga anterior utilizável,
+        faz a carga completa.
+        """
+        if self._recarregar_se_em_carga():
+            return
+        parado = time.time() - self._ultimo_feed > ALTERACOES_MAX_PARADO_S
+        if self._versao_corte is None or parado or not self._grade_sincronizada():
+            self.refresh_extrato()
+            return
+        self._feed.start(_carregar_alteracoes, self.cfg, self.rules_path, self._versao_corte, self._preparar_extrato)
+
+    def _on_alteracoes(self, resultado):
+        # uma carga completa trocou a base depois que este feed começou
+        if resultado["desde"] != self._versao_corte or self._carga.is_busy:
+            return
+        self._versao_corte = resultado["corte"]
+        self._ultimo_feed = time.time()
+        self._aplicar_alteracoes(resultado["df"], resultado["datas"], resultado["apagados"])
+
+    def _aplicar_alteracoes(self, df_novo: pd.DataFrame, datas_novo: Dict[str, np.ndarray], apagados: List[int]):
+        """
+        Aplica o delta em df_all e no model. Linhas com edição pendente ou
+        ainda na fila de gravação não são tocadas (se mudaram no banco, a
+        gravação acusa o conflito) e linhas que a grade já tem com Versao
+        igual ou mais nova (ex.: gravadas aqui enquanto o feed rodava) também não.
+        Edição da fila que falhou não segura a linha: só é gravada se o usuário
+        reenviar, e aí o conflito com o que veio do banco é perguntado.
+        """
+        if apagados:
+            self._remover_da_grade(apagados)
+        if df_novo.empty or not self._grade_sincronizada():
+            return
+
+        pos = self._posicoes_dbid(df_novo["DBId"])
+        existe = pos >= 0
+        if "Versao" in self.df_all.columns:
+            versao_grade = pd.to_numeric(self.df_all["Versao"], errors="coerce").to_numpy()[np.where(existe, pos, 0)]
+            mais_nova = ~(pd.to_numeric(df_novo["Versao"], errors="coerce").to_numpy() <= versao_grade)
+        else:
+            mais_nova = np.ones(len(df_novo), dtype=bool)
+        sujas = self.tbl_extrato.model().dirty_rows()
+        na_fila = np.isin(
+            df_novo["DBId"].to_numpy(), list(self._fila.fila.ids_na_fila() | self._proveniencia_pendente)
+        )
+        self._aplicar_patch(df_novo[existe & mais_nova & ~np.isin(pos, sujas) & ~na_fila])
+
+        novas = ~existe
+        if novas.any():
+            pendentes = self._edicoes_pendentes()
+            df_all = pd.concat([self.df_all, df_novo[novas]], ignore_index=True)
+            nat = np.full(int(novas.sum()), np.datetime64("NaT"))
+            datas = {
+                c: np.concatenate([d, datas_novo[c][novas] if c in datas_novo else nat])
+                for c, d in self._filtro_datas.items()
+            }
+            self._update_combos(df_all)
+            self.df_all = df_all
+            self._preparar_filtros(datas)
+            self._recarregar_grade()
+            self._restaurar_edicoes(pendentes)
+
+    def _edicoes_pendentes(self, manter=None) -> Dict[int, Dict[str, Any]]:
+        """Edições pendentes da grade por DBId (manter: máscara de df_all das linhas que ficam)."""
+        model = self.tbl_extrato.model()
+        if not isinstance(model, EditableTableModel) or not model.has_changes() or not self._grade_sincronizada():
+            return {}
+        dbids = self.df_all["DBId"].to_numpy()
+        return {
+            int(dbids[src]): cells
+            for src, cells in model.dirty_state().items()
+            if manter is None or manter[src]
+        }
+
+    def _restaurar_edicoes(self, pendentes: Dict[int, Dict[str, Any]]):
+        if not pendentes or not self._grade_sincronizada():
+            return
+        pos = self._posicoes_dbid(list(pendentes))
+        self.tbl_extrato.model().restore_dirty(
+            {int(p): cells for p, cells in zip(pos, pendentes.values()) if p >= 0}
+        )
+
+    def _reler_apos_sync(self, resultado):
+        """Depois de sincronizar, relê só o período/vendedor do resultado."""
+        try:
+            inicio_txt, fim_txt = str((resultado or {}).get("periodo", "")).split(" a ")
+            data_ini = pd.to_datetime(inicio_txt, dayfirst=True).date()
+            data_fim = pd.to_datetime(fim_txt, dayfirst=True).date()
+        except Exception:
+            self.refresh_extrato()
+            return
+
+        vendedor = resultado.get("vendedor")
+        self._reler_escopo(data_ini, data_fim, None if vendedor in (None, "", "TODOS") else vendedor)
 
     def _update_combos(self, df):
         comps_novos = set(c for c in df.get("Competência", pd.Series([])).dropna().unique() if c)
@@ -996,67 +1518,102 @@ class TabExtrato(QWidget):
                     self.cmb_uf.setCurrentText(cur_u)
                 self.cmb_uf.blockSignals(False)
 
-    def _apply_filters(self, df):
-        chosen_c = self.cmb_comp.currentText()
-        if chosen_c and chosen_c != "(todas)":
-            df = df[df["Competência"] == chosen_c]
+    # ============================================================
+    # Filtros (sobre o model já carregado)
+    # ============================================================
 
-        chosen_v = self.cmb_vend.currentText()
-        if chosen_v and chosen_v != "(todos)":
-            df = df[df["Vendedor"].astype(str) == chosen_v]
+    @property
+    def df_extrato(self) -> pd.DataFrame:
+        """Linhas visíveis (filtros aplicados), na ordem exibida na grade."""
+        return self.df_all.iloc[self._linhas_visiveis()]
+
+    def _linhas_visiveis(self) -> np.ndarray:
+        """Posições em df_all das linhas exibidas, na ordem da view."""
+        model = self.tbl_extrato.model() if hasattr(self, "tbl_extrato") else None
+        if isinstance(model, EditableTableModel) and model.source_count() == len(self.df_all):
+            return model.source_rows()
+        return np.arange(len(self.df_all))
+
+    def _preparar_filtros(self, datas: Dict[str, np.ndarray]):
+        """Códigos por valor das colunas dos combos: filtrar vira comparar inteiros."""
+        self._filtro_datas = datas
+        self._filtro_codigos = {}
+        for col in ("Competência", "Vendedor", "Artigo", "UF"):
+            if col in self.df_all.columns:
+                serie = self.df_all[col]
+                if col == "Vendedor":
+                    serie = serie.astype(str)
+                codes, uniques = pd.factorize(serie)
+                self._filtro_codigos[col] = (codes, {v: i for i, v in enumerate(uniques)})
+
+    def _mascara_filtros(self) -> np.ndarray:
+        mask = np.ones(len(self.df_all), dtype=bool)
+
+        combos = (
+            ("Competência", self.cmb_comp, "(todas)"),
+            ("Vendedor", self.cmb_vend, "(todos)"),
+            ("Artigo", self.cmb_artigo, "(todos)"),
+            ("UF", self.cmb_uf, "(todas)"),
+        )
+        for col, cmb, todos in combos:
+            escolha = cmb.currentText()
+            if not escolha or escolha == todos or col not in self._filtro_codigos:
+                continue
+            codes, posicoes = self._filtro_codigos[col]
+            code = posicoes.get(escolha)
+            if code is None:
+                mask[:] = False
+            else:
+                mask &= codes == code
 
-        artigo = self.cmb_artigo.currentText()
-        if artigo != "(todos)" and "Artigo" in df.columns:
-            df = df[df["Artigo"] == artigo]
+        periodos = (
+            ("Emissão", self.chk_filtrar_emissao, self.dt_emissao_ini, self.dt_emissao_fim),
+            ("Recebimento", self.chk_filtrar_recebimento, self.dt_recebimento_ini, self.dt_recebimento_fim),
+        )
+        for col, chk, dt_ini, dt_fim in periodos:
+            datas = self._filtro_datas.get(col)
+            if not chk.isChecked() or datas is None:
+                continue
+            ini = np.datetime64(dt_ini.date().toPython())
+            fim = np.datetime64(dt_fim.date().toPython())
+            mask &= (datas >= ini) & (datas <= fim)
+
+        return mask
+
+    def _aplicar_filtros(self, *_):
+        """Recorta as linhas exibidas conforme combos/períodos (não recarrega do banco)."""
+        model = self.tbl_extrato.model() if hasattr(self, "tbl_extrato") else None
+        if not isinstance(model, EditableTableModel) or model.source_count() != len(self.df_all):
+            return
 
-        uf = self.cmb_uf.currentText()
-        if uf != "(todas)" and "UF" in df.columns:
-            df = df[df["UF"] == uf]
+        model.set_row_filter(self._mascara_filtros())
 
-        if self.chk_filtrar_emissao.isChecked():
-            try:
-                data_ini = self.dt_emissao_ini.date().toPython()
-                data_fim = self.dt_emissao_fim.date().toPython()
-                if "Emissão" in df.columns:
-                    df_temp = df.copy()
-                    df_temp["_Emissao_dt"] = pd.to_datetime(df_temp["Emissão"], dayfirst=True, errors="coerce").dt.date
-                    mask = (df_temp["_Emissao_dt"] >= data_ini) & (df_temp["_Emissao_dt"] <= data_fim)
-                    df = df[mask]
-            except Exception as e:
-                print(f"Erro ao filtrar por emissão: {e}")
-
-        if self.chk_filtrar_recebimento.isChecked():
-            try:
-                data_ini = self.dt_recebimento_ini.date().toPython()
-                data_fim = self.dt_recebimento_fim.date().toPython()
-                if "Recebimento" in df.columns:
-                    df_temp = df.copy()
-                    df_temp["_Recebimento_dt"] = pd.to_datetime(df_temp["Recebimento"], dayfirst=True, errors="coerce").dt.date
-                    mask = (df_temp["_Recebimento_dt"] >= data_ini) & (df_temp["_Recebimento_dt"] <= data_fim)
-                    df = df[mask]
-            except Exception as e:
-                print(f"Erro ao filtrar por recebimento: {e}")
+        self.lbl_count_extrato.setText(f"{model.rowCount()} registro(s)")
+        self._atualizar_total_recebido()
+        self._schedule_sync_check(4000)
 
-        return df
+    def _recarregar_grade(self):
+        """Remonta o model a partir de df_all (após alterar colunas em memória)."""
+        self._display_extrato(self.df_all)
+        self._aplicar_filtros()
 
     # ============================================================
     # Table / Display
     # ============================================================
 
     def _display_extrato(self, df):
-        df_show = apply_display_formats(df.copy())
-        cols_show = self._get_display_columns(df_show.columns)
+        cols_show = self._get_display_columns(df.columns)
 
         # limpar delegates
         if self.tbl_extrato.model() is not None:
             for col in range(self.tbl_extrato.model().columnCount()):
                 self.tbl_extrato.setItemDelegateForColumn(col, None)
 
-        model = EditableTableModel(cols_show, df_show[cols_show].values.tolist())
+        model = EditableTableModel.from_frame(df, cols_show)
 
         model.dataChanged.connect(
             lambda top_left, bottom_right, roles=[]: self._recalcular_comissao_ao_editar(
-                top_left, bottom_right, model, cols_show
+                top_left, bottom_right, model, cols_show, roles
             )
         )
 
@@ -1081,7 +1638,6 @@ class TabExtrato(QWidget):
                 self.tbl_extrato.setItemDelegateForColumn(col_idx, delegate_valor)
 
         header = self.tbl_extrato.horizontalHeader()
-        self.tbl_extrato.resizeColumnsToContents()
 
         min_widths = {
             "ID": 60,
@@ -1102,13 +1658,7 @@ class TabExtrato(QWidget):
             "ValidadoEm": 95,
         }
 
-        for col in range(model.columnCount()):
-            col_name = cols_show[col] if col < len(cols_show) else ""
-            header.setSectionResizeMode(col, QHeaderView.Interactive)
-            if col_name in min_widths:
-                if self.tbl_extrato.columnWidth(col) < min_widths[col_name]:
-                    self.tbl_extrato.setColumnWidth(col, min_widths[col_name])
-
+        self._larguras.fit(self.tbl_extrato, min_widths)
         header.setStretchLastSection(True)
 
         # seleção -> total
@@ -1118,26 +1668,12 @@ class TabExtrato(QWidget):
             pass
         self.tbl_extrato.selectionModel().selectionChanged.connect(self._atualizar_total_recebido)
 
-        # header click sort
+        # header click sort (Shift+clique adiciona critério)
         def on_header_clicked(section):
             m = self.tbl_extrato.model()
-            if hasattr(m, "sort"):
-                try:
-                    current_col = getattr(m, "_sort_column", -1)
-                    current_order = getattr(m, "_sort_order", Qt.SortOrder.AscendingOrder)
-                except Exception:
-                    current_col = -1
-                    current_order = Qt.SortOrder.AscendingOrder
-
-                if current_col != section:
-                    order = Qt.SortOrder.AscendingOrder
-                else:
-                    order = (
-                        Qt.SortOrder.DescendingOrder
-                        if current_order == Qt.SortOrder.AscendingOrder
-                        else Qt.SortOrder.AscendingOrder
-                    )
-                m.sort(section, order)
+            if hasattr(m, "toggle_sort"):
+                additive = bool(QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier)
+                m.toggle_sort(section, additive)
             self._atualizar_total_recebido()
 
         try:
@@ -1146,7 +1682,11 @@ class TabExtrato(QWidget):
             pass
         header.sectionClicked.connect(on_header_clicked)
 
-    def _recalcular_comissao_ao_editar(self, top_left, bottom_right, model, cols_show):
+    def _recalcular_comissao_ao_editar(self, top_left, bottom_right, model, cols_show, roles=None):
+        # atualizações vindas do banco (update_rows) não são edição
+        if roles and Qt.ItemDataRole.EditRole not in roles:
+            return
+
         try:
             if "% Comissão" not in cols_show or "Valor Comissão" not in cols_show or "Rec Liquido" not in cols_show:
                 return
@@ -1165,14 +1705,19 @@ class TabExtrato(QWidget):
             dbid = None
             ctx: Dict[str, Any] = {}
 
-            if not self.df_extrato.empty and row < len(self.df_extrato):
-                pct_before = self.df_extrato.iloc[row].get("% Comissão", None)
-                val_before = self.df_extrato.iloc[row].get("Valor Comissão", None)
-                dbid = self.df_extrato.iloc[row].get("DBId", None)
+            # linha da view -> posição em df_all (grade ordenada/filtrada)
+            src = model.source_row(row)
+            tem_fonte = src < len(self.df_all)
+
+            if tem_fonte:
+                linha = self.df_all.iloc[src]
+                pct_before = linha.get("% Comissão", None)
+                val_before = linha.get("Valor Comissão", None)
+                dbid = linha.get("DBId", None)
 
                 for k in ["Vendedor", "Cliente", "UF", "Artigo", "Prazo Médio", "Preço Venda", "Recebido", "Rec Liquido", "% Percentual Padrão"]:
-                    if k in self.df_extrato.columns:
-                        ctx[k] = self.df_extrato.iloc[row].get(k, None)
+                    if k in self.df_all.columns:
+                        ctx[k] = linha.get(k, None)
 
             pct_str = str(model.data(model.index(row, col_pct_idx)) or "0")
             rec_str = str(model.data(model.index(row, col_rec_idx)) or "0")
@@ -1190,9 +1735,13 @@ class TabExtrato(QWidget):
             model.setData(model.index(row, col_val_idx), valor_formatado, Qt.EditRole)
             model.blockSignals(False)
 
-            if not self.df_extrato.empty and row < len(self.df_extrato):
-                self.df_extrato.iloc[row, self.df_extrato.columns.get_loc("% Comissão")] = float(pct)
-                self.df_extrato.iloc[row, self.df_extrato.columns.get_loc("Valor Comissão")] = float(valor_comissao)
+            if tem_fonte:
+                self.df_all.iloc[src, self.df_all.columns.get_loc("% Comissão")] = float(pct)
+                self.df_all.iloc[src, self.df_all.columns.get_loc("Valor Comissão")] = float(valor_comissao)
+                # % editado à mão: deixa de ser proveniente de regra
+                for c in ("RegraId", "Regra"):
+                    if c in self.df_all.columns:
+                        self.df_all.iloc[src, self.df_all.columns.get_loc(c)] = None if c == "RegraId" else ""
 
             # Auditoria
             try:
@@ -1217,32 +1766,33 @@ class TabExtrato(QWidget):
             traceback.print_exc()
 
     def _get_display_columns(self, cols_all):
-        hide = {"VendedorID", "Linha", "ICMSST", "Frete", "Competencia", "Consolidado"}
+        hide = {"VendedorID", "Linha", "ICMSST", "Frete", "Competencia", "Consolidado", "RegraVersao", "RegraId", "Versao"}
         order = [
             "DBId", "Competência", "Validado", "ID", "Vendedor", "Titulo", "Cliente", "UF", "Artigo",
             "Recebido", "Rec Liquido", "Prazo Médio", "Preço Médio", "Preço Venda",
             "M Pagamento", "Emissão", "Vencimento", "Recebimento",
             "% Percentual Padrão", "% Comissão", "Valor Comissão", "Valor Comissão Padrão",
-            "% Diferença", "Diferença R$", "Observação", "ValidadoPor", "ValidadoEm"
+            "% Diferença", "Diferença R$", "Regra", "Observação", "ValidadoPor", "ValidadoEm"
         ]
         cols = [c for c in order if c in cols_all]
         cols += [c for c in cols_all if c not in set(cols) | hide]
         return cols
 
     def _atualizar_total_recebido(self):
-        total = 0.0
         model = self.tbl_extrato.model()
         if not model:
             return
 
-        for index in self.tbl_extrato.selectedIndexes():
-            header = model.headerData(index.column(), Qt.Horizontal)
-            if str(header).strip().lower() in ["rec liquido", "recebido"]:
-                try:
-                    valor_str = str(index.data()).replace(".", "").replace(",", ".")
-                    total += float(valor_str)
-                except (ValueError, TypeError):
-                    pass
+        # soma por faixa de seleção (soma acumulada no model), sem percorrer células
+        cols = {
+            c for c in range(model.columnCount())
+            if str(model.headers[c]).strip().lower() in ("rec liquido", "recebido")
+        }
+        total = 0.0
+        for faixa in self.tbl_extrato.selectionModel().selection():
+            for c in range(faixa.left(), faixa.right() + 1):
+                if c in cols:
+                    total += model.range_sum(c, faixa.top(), faixa.bottom())
 
         self.lbl_total_recebido.setText(
             f"Total selecionado: R$ {total:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
@@ -1254,20 +1804,22 @@ class TabExtrato(QWidget):
 
     def _aplicar_pct_todos(self):
         pct = self.spn_pct.value()
-        if self.df_extrato.empty:
+        visiveis = self._linhas_visiveis()
+        if self.df_all.empty or len(visiveis) == 0:
             return
 
-        df = self.df_extrato.copy()
-        if "% Comissão" in df.columns:
-            df["% Comissão"] = pct
+        if "% Comissão" in self.df_all.columns:
+            self._aplicar_patch(pd.DataFrame({
+                "DBId": self.df_all["DBId"].to_numpy()[visiveis],
+                "% Comissão": float(pct),
+            }), edicao=True)
 
-        self.df_extrato = df.copy()
-        self._display_extrato(df)
         QuickFeedback.show(self, f"% Comissão atualizado para {pct:.2f} em todas as linhas exibidas", success=True)
 
     def _aplicar_regras_teste(self):
         """Aplica regras do rules.json no dataframe em tela + auditoria JSONL."""
-        if self.df_extrato.empty:
+        df_visivel = self.df_extrato
+        if df_visivel.empty:
             QuickFeedback.show(self, "Sem dados no extrato.", success=False)
             return
 
@@ -1276,124 +1828,123 @@ class TabExtrato(QWidget):
 
         session_id = generate_session_id(self.username)
 
-        df = self.df_extrato.copy()
-
-        if "% Percentual Padrão" not in df.columns:
+        if "% Percentual Padrão" not in df_visivel.columns:
             QMessageBox.warning(self, "Regras", "Coluna '% Percentual Padrão' não encontrada.")
             return
 
-        if "% Comissão" not in df.columns:
-            df["% Comissão"] = df["% Percentual Padrão"]
-
-        if "Observação" not in df.columns:
-            df["Observação"] = ""
-
-        if "Valor Comissão" not in df.columns:
-            df["Valor Comissão"] = 0.0
+        df, events = apply_rules_to_frame(
+            df_visivel,
+            self.rules_memoria,
+            username=self.username,
+            session_id=session_id,
+            versao=self._versao_regras(),
+        )
 
-        new_pct: List[float] = []
-        new_obs: List[str] = []
-        new_val: List[float] = []
+        try:
+            append_jsonl_many(self.audit_log_path, events)
+        except Exception as log_err:
+            print(f"⚠️ Falha ao logar auditoria de regra: {log_err}")
+
+        # índice de df é a posição em df_all; fica pendente até salvar
+        cols = [c for c in ("% Comissão", "Valor Comissão", "RegraVersao", "RegraId") if c in df.columns]
+        novo = df[cols].copy()
+        novo.insert(0, "DBId", self.df_all["DBId"].to_numpy()[df.index.to_numpy()])
+        self._aplicar_patch(novo, edicao=True)
+        QuickFeedback.show(self, "Regras aplicadas.", success=True)
 
-        for _, r in df.iterrows():
-            row = r.to_dict()
+    def _aplicar_regras_servidor(self, somente_desatualizadas: bool = False):
+        """
+        Aplica as regras direto no banco (UPDATE set-based) para o escopo
+        visível: competência/período + vendedor. Só linhas não consolidadas.
+        Com somente_desatualizadas, só linhas avaliadas com outra versão.
+        """
+        if self.role not in ("gestora", "admin", "controladoria"):
+            QMessageBox.warning(self, "Permissão", "Apenas a gestora (Karen) ou admin podem aplicar regras no banco.")
+            return
 
-            pct_before = row.get("% Comissão")
-            valor_before = row.get("Valor Comissão")
+        scope = self._get_sync_scope_from_visible_data()
+        if scope is None:
+            QMessageBox.information(
+                self, "Regras", "Selecione uma competência ou período de recebimento para aplicar as regras."
+            )
+            return
 
-            pct_aplicado, motivo = apply_rules_to_row(row, self.rules_memoria)
-            new_pct.append(pct_aplicado)
+        data_ini, data_fim, vendedor = scope
+        self.rules_memoria = self._load_rules_from_json()
+        versao = self._versao_regras()
 
-            obs_atual = str(row.get("Observação") or "").strip()
-            obs_nova = obs_atual + " | " + motivo if (motivo and obs_atual) else (motivo or obs_atual)
-            new_obs.append(obs_nova)
+        reply = QMessageBox.question(
+            self,
+            "Aplicar Regras no servidor",
+            f"As regras serão aplicadas diretamente no banco.\n\n"
+            f"Período: {data_ini.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}\n"
+            f"Vendedor: {vendedor or 'TODOS'}\n"
+            f"Versão das regras: {versao}"
+            f"{' (só linhas desatualizadas)' if somente_desatualizadas else ''}\n\n"
+            f"Linhas consolidadas não são alteradas. Deseja continuar?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+        if reply != QMessageBox.Yes:
+            return
 
-            val_calc = None
-            if "Rec Liquido" in df.columns:
-                rec = row.get("Rec Liquido", 0)
-                try:
-                    rec_d = br_to_decimal(rec, 2) if isinstance(rec, str) else Decimal(str(float(rec))).quantize(
-                        Decimal("0.01"), rounding=ROUND_HALF_UP
-                    )
-                except Exception:
-                    rec_d = Decimal("0.00")
+        loading = LoadingOverlay(self.window(), f"{Icons.LOADING} Aplicando regras no servidor")
+        loading.show_overlay()
 
+        try:
+            with get_conn(self.cfg) as conn:
+                cur = conn.cursor()
+                verificar_schema_extrato(cur)
                 try:
-                    pct_d = br_to_decimal(pct_aplicado, 4) if isinstance(pct_aplicado, str) else Decimal(str(float(pct_aplicado))).quantize(
-                        Decimal("0.0001"), rounding=ROUND_HALF_UP
+                    for snapshot in self._snapshots_regras([versao]):
+                        store_snapshot(cur, snapshot)
+                    alterados = aplicar_regras_no_servidor(
+                        cur, self.rules_memoria, data_ini, data_fim, vendedor,
+                        versao=versao, somente_desatualizadas=somente_desatualizadas,
                     )
+                    conn.commit()
                 except Exception:
-                    pct_d = Decimal("0.0000")
-
-                val_calc = (rec_d * pct_d / Decimal("100")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-                new_val.append(float(val_calc))
-            else:
-                new_val.append(float(valor_before or 0))
-
-            pct_after = pct_aplicado
-            valor_after = float(val_calc) if val_calc is not None else float(valor_before or 0)
-
-            mudou_pct = str(pct_before) != str(pct_after)
-            mudou_val = str(valor_before) != str(valor_after)
-
-            if mudou_pct or mudou_val:
-                # contexto reduzido
-                ctx = {
-                    "session_id": session_id,
-                    "rule_result": motivo,
-                    "Vendedor": row.get("Vendedor"),
-                    "Cliente": row.get("Cliente"),
-                    "UF": row.get("UF"),
-                    "Artigo": row.get("Artigo"),
-                    "Prazo Médio": row.get("Prazo Médio"),
-                    "Competência": row.get("Competência"),
-                }
-
-                try:
-                    event = build_edit_event(
-                        username=self.username,
-                        dbid=row.get("DBId") if "DBId" in df.columns else None,
-                        row_context=ctx,
-                        pct_before=pct_before,
-                        pct_after=pct_after,
-                        valor_before=valor_before,
-                        valor_after=valor_after,
-                        action="apply_rules",
-                        note=motivo or "regra aplicada",
-                    )
-                    append_jsonl(self.audit_log_path, event)
-                except Exception as log_err:
-                    print(f"⚠️ Falha ao logar auditoria de regra: {log_err}")
-
-        df["% Comissão"] = (
-            pd.to_numeric(pd.Series(new_pct, index=df.index), errors="coerce")
-            .fillna(0)
-            .round(4)
-        )
-        df["Observação"] = new_obs
-        df["Valor Comissão"] = pd.to_numeric(pd.Series(new_val, index=df.index), errors="coerce").fillna(0).round(2)
-
-        if "Recebido" not in df.columns:
-            df["Recebido"] = 0
-
-        df["Valor Comissão Padrão"] = (
-            pd.to_numeric(df["Recebido"], errors="coerce").fillna(0)
-            * (pd.to_numeric(df["% Percentual Padrão"], errors="coerce").fillna(0) / 100)
-        ).round(2)
-
-        df["% Diferença"] = (
-            pd.to_numeric(df["% Comissão"], errors="coerce").fillna(0)
-            - pd.to_numeric(df["% Percentual Padrão"], errors="coerce").fillna(0)
-        ).round(4)
+                    conn.rollback()
+                    raise
+        except Exception as e:
+            loading.close_overlay()
+            QMessageBox.critical(self, "Regras", f"Erro ao aplicar regras no servidor:\n{e}")
+            return
 
-        df["Diferença R$"] = (
-            pd.to_numeric(df["Valor Comissão"], errors="coerce").fillna(0)
-            - pd.to_numeric(df["Valor Comissão Padrão"], errors="coerce").fillna(0)
-        ).round(2)
+        session_id = generate_session_id(self.username)
+        try:
+            append_jsonl_many(self.audit_log_path, (
+                build_edit_event(
+                    username=self.username,
+                    dbid=r.get("Id"),
+                    row_context={
+                        "session_id": session_id,
+                        "rule_result": r.get("Motivo"),
+                        "rule_id": r.get("RegraId"),
+                        "rule_version": versao,
+                        "mode": "server",
+                        "Vendedor": r.get("Vendedor"),
+                        "Cliente": r.get("Cliente"),
+                        "UF": r.get("UF"),
+                        "Artigo": r.get("Artigo"),
+                        "Prazo Médio": float(r["PrazoMedio"]) if r.get("PrazoMedio") is not None else None,
+                        "Competência": comp_br(r.get("DataRecebimento")),
+                    },
+                    pct_before=float(r["PctAntes"]) if r.get("PctAntes") is not None else None,
+                    pct_after=float(r["PctDepois"]) if r.get("PctDepois") is not None else None,
+                    valor_before=float(r["ValorAntes"]) if r.get("ValorAntes") is not None else None,
+                    valor_after=float(r["ValorDepois"]) if r.get("ValorDepois") is not None else None,
+                    action="apply_rules",
+                    note=r.get("Motivo") or "regra aplicada",
+                )
+                for r in alterados
+            ))
+        except Exception as log_err:
+            print(f"⚠️ Falha ao logar auditoria de regra: {log_err}")
 
-        self.df_extrato = df.copy()
-        self._display_extrato(df)
-        QuickFeedback.show(self, "Regras aplicadas.", success=True)
+        loading.close_overlay()
+        QuickFeedback.show(self, f"Regras aplicadas no servidor: {len(alterados)} linha(s)", success=True)
+        self._reler_escopo(data_ini, data_fim, vendedor)
 
     # ============================================================
     # Persistência / Validação / E-mail / Remoção
@@ -1415,72 +1966,116 @@ class TabExtrato(QWidget):
         if model is None:
             return
 
-        parent_window = self.window()
-        loading = LoadingOverlay(parent_window, f"{Icons.SAVE} Salvando alterações")
-        loading.show_overlay()
-
-        try:
-            hdr = model.headers
-
-            def idx(h):
-                try:
-                    return hdr.index(h)
-                except ValueError:
-                    return None
-
-            i_db = idx("DBId")
-            i_pct = idx("% Comissão")
-            i_obs = idx("Observação")
-            i_cons = idx("Consolidado")
-            i_rec = idx("Rec Liquido")
-
-            if i_db is None:
-                loading.close_overlay()
-                QMessageBox.warning(self, "Erro", "Coluna DBId não encontrada!")
-                return
-
-            updated = 0
-            with get_conn(self.cfg) as conn:
-                cur = conn.cursor()
-                total = len(model.rows)
-
-                for i, r in enumerate(model.rows, 1):
-                    loading.update_message(f"{Icons.SAVE} Salvando {i}/{total}")
-                    dbid = r[i_db]
-
-                    if i_cons is not None and str(r[i_cons]).strip() in ("1", "True", "true"):
-                        continue
-
-                    pct = br_to_decimal(r[i_pct], 4) if i_pct is not None else Decimal("0.0000")
-
-                    val = Decimal("0.00")
-                    if pct is not None and i_rec is not None:
-                        rec_liq = br_to_decimal(r[i_rec], 2) or Decimal("0.00")
-                        val = (rec_liq * pct / Decimal("100")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
-                    obs = str(r[i_obs])[:500] if i_obs is not None else None
-
-                    cur.execute("""
-                        UPDATE dbo.Stik_Extrato_Comissoes
-                        SET PercComissao = ?,
-                            ValorComissao = ?,
-                            Observacao = COALESCE(?, Observacao)
-                        WHERE Id = ?
-                    """, float(pct), float(val), obs, int(dbid))
+        # células editadas + linhas em que só a proveniência da regra mudou
+        prov = self._posicoes_dbid(sorted(self._proveniencia_pendente))
+        sujas = np.union1d(model.dirty_rows(), prov[prov >= 0]).astype(np.intp)
+        if len(sujas) == 0:
+            QuickFeedback.show(self, "Nenhuma alteração para salvar", success=False)
+            return
 
-                    updated += cur.rowcount
+        if model.column_index("DBId") is None:
+            QMessageBox.warning(self, "Erro", "Coluna DBId não encontrada!")
+            return
 
-                conn.commit()
+        edicoes, por_id = self._montar_edicoes(model, sujas)
+        # consolidadas ficam de fora de edicoes: não há o que salvar nelas
+        self._proveniencia_pendente.difference_update(int(model.source_value(src, "DBId")) for src in sujas)
+        if not edicoes:
+            QuickFeedback.show(self, "Nenhuma alteração para salvar", success=False)
+            return
 
-            loading.close_overlay()
-            QuickFeedback.show(self, f"{updated} linha(s) atualizadas", success=True)
-            self.refresh_extrato()
+        # vai para a fila local: a grade já fica com os valores, o banco recebe em segundo plano
+        self._fila.enqueue("edicao", {
+            "edicoes": edicoes_para_fila(edicoes),
+            "snapshots": self._snapshots_regras(e[4] for e in edicoes),
+        })
+        pos = self._posicoes_dbid(sorted(por_id))
+        model.clear_dirty(pos[pos >= 0])
+        self._aplicar_patch(pd.DataFrame(list(por_id.values())))
+        QuickFeedback.show(self, f"{len(edicoes)} linha(s) enviadas para gravação", success=True)
+
+    def _on_edicao_gravada(self, payload: Dict[str, Any], resultado: Dict[str, Any]):
+        """Resultado de uma edição da fila: nova Versao das gravadas, conflitos e apagadas."""
+        gravados = {int(i): int(v) for i, v in resultado.get("gravados", [])}
+        conflitos = [int(i) for i in resultado.get("conflitos", [])]
+        sumidos = [int(i) for i in resultado.get("sumidos", [])]
+
+        if gravados:
+            self._aplicar_patch(pd.DataFrame({"DBId": list(gravados), "Versao": list(gravados.values())}))
+
+        if conflitos:
+            reply = QMessageBox.question(
+                self,
+                "Conflito ao salvar",
+                f"{len(conflitos)} linha(s) foram alteradas no banco depois que o extrato foi carregado.\n\n"
+                "Sim: gravar mesmo assim os seus valores.\n"
+                "Não: descartar suas edições nessas linhas e mostrar o que está no banco.",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No,
+            )
+            if reply == QMessageBox.Yes:
+                alvo = set(conflitos)
+                self._fila.enqueue("edicao", {
+                    "edicoes": [e for e in payload["edicoes"] if int(e[0]) in alvo],
+                    "snapshots": payload.get("snapshots", []),
+                    "forcar": True,
+                })
+                conflitos = []
+
+        # conflito descartado / apagadas no banco: relê (as apagadas saem da grade)
+        self._reler_linhas(conflitos + sumidos)
+
+    def _montar_edicoes(self, model: EditableTableModel, sujas):
+        """
+        Parâmetros de salvar_edicoes_extrato para as linhas com edição pendente
+        (linhas da fonte) + o que foi gravado por DBId, para o patch da grade.
+        """
+        def dec(v, places):
+            if v is None or (isinstance(v, float) and v != v):
+                return None
+            return br_to_decimal(v, places)
+
+        tem_obs = model.column_index("Observação") is not None
+        tem_cons = model.column_index("Consolidado") is not None
+
+        dbids = [int(model.source_value(src, "DBId")) for src in sujas]
+        # proveniência da regra e versão lida (colunas ocultas na grade, só em df_all)
+        pos = self._posicoes_dbid(dbids)
+        tem_prov = {"RegraVersao", "RegraId"} <= set(self.df_all.columns)
+        versoes = self.df_all["Versao"].to_numpy() if "Versao" in self.df_all.columns else None
+
+        edicoes: List[tuple] = []
+        por_id: Dict[int, Dict[str, Any]] = {}
+        for src, dbid, p in zip(sujas, dbids, pos):
+            if tem_cons and str(model.source_value(src, "Consolidado")).strip() in ("1", "True", "true"):
+                continue
+
+            pct = dec(model.source_value(src, "% Comissão"), 4) or Decimal("0.0000")
+            rec_liq = dec(model.source_value(src, "Rec Liquido"), 2) or Decimal("0.00")
+            val = (rec_liq * pct / Decimal("100")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+            obs = model.source_text(src, "Observação")[:500] if tem_obs else None
+
+            regra_versao = regra_id = None
+            if tem_prov and p >= 0:
+                ver, rid = self.df_all.iloc[p][["RegraVersao", "RegraId"]]
+                regra_versao = None if pd.isna(ver) else str(ver)
+                regra_id = None if pd.isna(rid) else str(rid)
+
+            versao = None
+            if versoes is not None and p >= 0 and not pd.isna(versoes[p]):
+                versao = int(versoes[p])
+
+            edicoes.append((dbid, pct, val, obs, regra_versao, regra_id, versao))
+            salvo = {
+                "DBId": dbid, "% Comissão": float(pct), "Valor Comissão": float(val),
+                "RegraVersao": regra_versao, "RegraId": regra_id,
+            }
+            if obs is not None:
+                salvo["Observação"] = obs
+            por_id[dbid] = salvo
 
-        except Exception as e:
-            loading.close_overlay()
-            QMessageBox.critical(self, "Salvar", f"Erro ao salvar: {e}")
-            import traceback
-            traceback.print_exc()
+        return edicoes, por_id
 
     def on_validar(self):
         if self.role not in ("gestora", "admin", "controladoria"):
@@ -1499,61 +2094,19 @@ class TabExtrato(QWidget):
             QMessageBox.information(self, "Validação", "Selecione uma ou mais linhas.")
             return
 
-        parent_window = self.window()
-        loading = LoadingOverlay(parent_window, f"{Icons.EMAIL} Enviando e-mails de validação")
-        loading.show_overlay()
-
+        hdr = model.headers
         try:
-            idxs_visuais = [s.row() for s in sel]
-            df_vendedor = self.df_extrato.iloc[idxs_visuais].copy()
-
-            if not df_vendedor.empty:
-                vendedores = df_vendedor["Vendedor"].unique()
-                for i, vendedor in enumerate(vendedores, 1):
-                    loading.update_message(f"{Icons.EMAIL} Enviando para {vendedor} ({i}/{len(vendedores)})")
-                    df_vend = df_vendedor[df_vendedor["Vendedor"] == vendedor]
-                    try:
-                        enviar_email_comissao(df_vend)
-                    except Exception as e:
-                        print(f"Erro ao enviar e-mail para {vendedor}: {e}")
-
-            loading.update_message(f"{Icons.CHECK} Validando registros no banco")
-
-            hdr = model.headers
-            try:
-                i_db = hdr.index("DBId")
-            except ValueError:
-                loading.close_overlay()
-                return
-
-            try:
-                i_cons = hdr.index("Consolidado")
-            except ValueError:
-                i_cons = None
-
-            count = 0
-            with get_conn(self.cfg) as conn:
-                cur = conn.cursor()
-                for s in sel:
-                    row = model.rows[s.row()]
-                    if i_cons is not None and str(row[i_cons]).strip() in ("1", "True", "true"):
-                        continue
-
-                    dbid = int(row[i_db])
-                    cur.execute("""
-                        UPDATE dbo.Stik_Extrato_Comissoes
-                           SET Validado = 1, ValidadoPor = ?, ValidadoEm = GETDATE()
-                         WHERE Id = ?
-                    """, self.username, dbid)
-                    count += cur.rowcount
-                conn.commit()
-
-            loading.close_overlay()
-            QuickFeedback.show(self, f"{count} linha(s) validadas e e-mails enviados", success=True)
-            self.refresh_extrato()
+            i_db = hdr.index("DBId")
+        except ValueError:
+            return
 
+        try:
+            ids = [int(model.raw_value(s.row(), i_db)) for s in sel]
+            # a gravação no banco vai pela fila (consolidadas ficam de fora no próprio UPDATE);
+            # os e-mails só saem quando ela for aplicada (ver _on_validacao_gravada)
+            self._fila.enqueue("validar", {"ids": ids})
+            QuickFeedback.show(self, f"{len(ids)} linha(s) na fila para validar", success=True)
         except Exception as e:
-            loading.close_overlay()
             QMessageBox.critical(self, "Validar", f"Erro ao validar: {e}")
 
     def on_enviar_emails(self):
@@ -1582,6 +2135,7 @@ class TabExtrato(QWidget):
         loading.show_overlay()
 
         try:
+            from utils.email_sender import enviar_email_comissao
             vendedores_enviados = []
             vendedores_sem_email = []
 
@@ -1661,66 +2215,136 @@ class TabExtrato(QWidget):
                 QMessageBox.critical(self, "Erro", "Coluna DBId não encontrada!")
                 return
 
-            ids_deletar = []
-            for s in sel:
-                row = model.rows[s.row()]
-                db_id = int(row[i_db])
-                ids_deletar.append(db_id)
+            ids_deletar = [int(model.raw_value(s.row(), i_db)) for s in sel]
 
-            deletados = 0
-            with get_conn(self.cfg) as conn:
-                cur = conn.cursor()
-                total = len(ids_deletar)
+            # a remoção no banco vai pela fila; a grade perde as linhas quando ela for aplicada
+            self._fila.enqueue("remover", {"ids": ids_deletar})
+            loading.close_overlay()
+            QMessageBox.information(
+                self,
+                "Remover do Extrato",
+                f"✅ {len(ids_deletar)} registro(s) enviados para remoção do extrato\n"
+                f"(consolidados não são removidos).\n\n"
+                f"Depois de removidos, você pode:\n"
+                f"1. Ir na aba CONSULTA\n"
+                f"2. Filtrar pelo período de RECEBIMENTO correto\n"
+                f"3. Adicionar os títulos novamente"
+            )
 
-                for i, db_id in enumerate(ids_deletar, 1):
-                    loading.update_message(f"{Icons.LOADING} Removendo {i}/{total}")
+        except Exception as e:
+            loading.close_overlay()
+            QMessageBox.critical(self, "Erro", f"Erro ao remover do extrato:\n{e}")
 
-                    cur.execute("""
-                        SELECT Consolidado
-                        FROM dbo.Stik_Extrato_Comissoes
-                        WHERE Id = ?
-                    """, db_id)
+    def _on_remocao_gravada(self, resultado: Dict[str, Any]):
+        # consolidadas não são apagadas (filtro no próprio DELETE); pode chegar
+        # bem depois do clique (ou na abertura, da fila anterior): sem modal
+        ids_deletados = [int(i) for i in resultado.get("apagados", [])]
+        if ids_deletados:
+            self._remover_da_grade(ids_deletados)
+            QuickFeedback.show(self, f"{len(ids_deletados)} registro(s) removido(s) do extrato", success=True)
+        else:
+            QuickFeedback.show(self, "Nenhum registro removido (já consolidados ou já apagados)", success=False)
 
-                    result = cur.fetchone()
-                    if result and result[0] == 1:
-                        continue
+    def _on_validacao_gravada(self, resultado: Dict[str, Any]):
+        validados: List[Dict[str, Any]] = [
+            {
+                "DBId": int(db_id), "Validado": True, "ValidadoPor": self.username,
+                "ValidadoEm": validado_em, "Versao": int(versao),
+            }
+            for db_id, validado_em, versao in resultado.get("validados", [])
+        ]
+        QuickFeedback.show(self, f"{len(validados)} linha(s) validadas", success=True)
 
-                    cur.execute("""
-                        DELETE FROM dbo.Stik_Extrato_Comissoes
-                        WHERE Id = ? AND Consolidado = 0
-                    """, db_id)
+        df_validados = pd.DataFrame(validados)
+        if not df_validados.empty:
+            df_validados["ValidadoEm"] = _fmt_datas(df_validados["ValidadoEm"]).to_numpy()
+        self._aplicar_patch(df_validados)
 
-                    deletados += cur.rowcount
+        # só o que o banco validou (consolidadas e apagadas ficam de fora)
+        self._emails_validacao.update(v["DBId"] for v in validados)
+        self._enviar_emails_validacao()
 
-                conn.commit()
+    def _enviar_emails_validacao(self):
+        """
+        Envia aos vendedores o extrato das linhas validadas no banco. As que
+        ainda não estão na grade (fila reaplicada antes da carga) esperam a
+        próxima carga completa.
+        """
+        if self.df_all.empty or self._carga.is_busy:
+            return
+        na_grade = self.df_all["DBId"].isin(list(self._emails_validacao)).to_numpy()
+        df_validadas = self.df_all[na_grade]
+        if df_validadas.empty:
+            return
+        self._emails_validacao.difference_update(int(i) for i in df_validadas["DBId"])
 
+        loading = LoadingOverlay(self.window(), f"{Icons.EMAIL} Enviando e-mails de validação")
+        loading.show_overlay()
+        try:
+            from utils.email_sender import enviar_email_comissao
+            vendedores = df_validadas["Vendedor"].unique()
+            for i, vendedor in enumerate(vendedores, 1):
+                loading.update_message(f"{Icons.EMAIL} Enviando para {vendedor} ({i}/{len(vendedores)})")
+                try:
+                    enviar_email_comissao(df_validadas[df_validadas["Vendedor"] == vendedor])
+                except Exception as e:
+                    print(f"Erro ao enviar e-mail para {vendedor}: {e}")
+        finally:
             loading.close_overlay()
 
-            if deletados > 0:
-                QuickFeedback.show(self, f"{deletados} registro(s) removido(s) do extrato", success=True)
-                self.refresh_extrato()
-                QMessageBox.information(
-                    self,
-                    "Sucesso",
-                    f"✅ {deletados} registro(s) removido(s) do extrato.\n\n"
-                    f"Agora você pode:\n"
-                    f"1. Ir na aba CONSULTA\n"
-                    f"2. Filtrar pelo período de RECEBIMENTO correto\n"
-                    f"3. Adicionar os títulos novamente"
-                )
-            else:
-                QMessageBox.warning(
-                    self,
-                    "Aviso",
-                    "Nenhum registro foi removido.\n\n"
-                    "Possíveis motivos:\n"
-                    "- Os registros já estão consolidados\n"
-                    "- Já foram deletados anteriormente"
-                )
+    # ============================================================
+    # Fila de gravação
+    # ============================================================
 
-        except Exception as e:
-            loading.close_overlay()
-            QMessageBox.critical(self, "Erro", f"Erro ao remover do extrato:\n{e}")
+    def _on_fila_aplicada(self, op: Dict[str, Any]):
+        tipo, resultado = op["tipo"], op["resultado"]
+        if tipo == "edicao":
+            self._on_edicao_gravada(op["payload"], resultado)
+        elif tipo == "validar":
+            self._on_validacao_gravada(resultado)
+        elif tipo == "remover":
+            self._on_remocao_gravada(resultado)
+
+    def _on_fila_falhou(self, op: Dict[str, Any]):
+        nomes = {"edicao": "Salvar", "validar": "Validar", "remover": "Remover do extrato"}
+        QuickFeedback.show(self, f"{nomes.get(op['tipo'], op['tipo'])}: erro ao gravar no banco", success=False)
+        print(f"⚠️ Operação da fila falhou ({op['tipo']}): {op['erro']}")
+
+    def _on_fila_estado(self, pendentes: int, falhas: int):
+        partes = []
+        if pendentes:
+            partes.append(f"{Icons.LOADING} {pendentes} gravação(ões) pendente(s)")
+        if falhas:
+            partes.append(f"{Icons.WARNING} {falhas} com erro")
+        self.lbl_fila.setText("   ".join(partes))
+        self.lbl_fila.setToolTip(
+            "\n".join(f"{tipo}: {erro}" for tipo, erro, _ in self._fila.fila.falhas()) if falhas else ""
+        )
+        self.btn_reenviar_fila.setVisible(falhas > 0)
+        self.btn_descartar_fila.setVisible(falhas > 0)
+
+    def _descartar_falhas_fila(self):
+        _, falhas = self._fila.contagem()
+        if not falhas:
+            return
+        reply = QMessageBox.question(
+            self,
+            "Descartar falhas",
+            f"Descartar {falhas} operação(ões) que não puderam ser gravadas?\n\n"
+            "As linhas envolvidas voltam a mostrar o que está no banco.",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+        if reply != QMessageBox.Yes:
+            return
+        ids = self._fila.discard_failed()
+        QuickFeedback.show(self, f"{falhas} operação(ões) descartada(s)", success=True)
+        self._reler_linhas(sorted(ids))
+
+    def _reenviar_falhas_fila(self):
+        n = self._fila.retry_failed()
+        if n:
+            QuickFeedback.show(self, f"{n} operação(ões) reenviada(s)", success=True)
 
     # ============================================================
     # Regras JSON -> objetos do engine
@@ -1730,26 +2354,31 @@ class TabExtrato(QWidget):
         """
         Carrega rules.json e converte para objetos Rule/Condition usados pelo engine.
         """
-        rules_raw = load_rules(self.rules_path)
-        rules_objs: List[Rule] = []
+        return rules_from_dicts(load_rules(self.rules_path))
 
-        for r in rules_raw:
-            try:
-                conditions = []
-                for c in (r.get("conditions") or []):
-                    conditions.append(Condition(c.get("field"), c.get("op"), c.get("value")))
-
-                rules_objs.append(
-                    Rule(
-                        name=r.get("name", "Sem nome"),
-                        priority=int(r.get("priority") or 0),
-                        conditions=conditions,
-                        set_percentual=r.get("set_percentual"),
-                        note=r.get("note", ""),
-                        stop_on_match=bool(r.get("stop_on_match", True)),
-                    )
-                )
-            except Exception as e:
-                print(f"⚠️ Regra inválida no JSON: {r} | erro={e}")
+    def _versao_regras(self) -> str:
+        """Grava (se preciso) o snapshot do rules.json atual e retorna a versão."""
+        return snapshot_rules(self.rules_path, load_rules(self.rules_path))
+
+    def _snapshots_regras(self, versoes) -> List[Dict[str, Any]]:
+        """Snapshots locais das versões, para irem ao servidor junto com a gravação das linhas."""
+        snaps = (load_snapshot(self.rules_path, v) for v in sorted({v for v in versoes if v}))
+        return [s for s in snaps if s]
 
-        return rules_objs
+    def _nomes_regras(self, df: pd.DataFrame) -> List[str]:
+        """
+        Nome da regra de cada linha, a partir de RegraId + snapshot da versão
+        (baixado do servidor na carga, ver _baixar_snapshots). Versão sem
+        snapshot em lugar nenhum (aplicada antes de os snapshots irem para o
+        banco) mostra o id com a indicação, em vez de um nome.
+        """
+        if "RegraId" not in df.columns:
+            return [""] * len(df)
+
+        versoes = df["RegraVersao"].dropna().unique() if "RegraVersao" in df.columns else []
+        nomes = {r.id: r.name for r in self.rules_memoria if r.id}
+        nomes.update(rule_names(self.rules_path, versoes))
+        return [
+            nomes.get(rid, f"{rid} (sem snapshot)") if isinstance(rid, str) and rid else ""
+            for rid in df["RegraId"]
+        ]
@@ -1,14 +1,15 @@
-
 # =====================================================
 # ARQUIVO 1: ui/__init__.py
 # =====================================================
 """
 Pacote de interface do usuário
 Exporta todos os componentes da UI
+
+MainWindow é carregada sob demanda (puxa abas, pandas e pyodbc), para o
+login aparecer sem esses imports.
 """
 
 from .login_dialog import LoginDialog, center_widget
-from .main_window import MainWindow
 from .styles import apply_theme, DARK_PURPLE_THEME
 from .icons import Icons, icon_button_text
 from .loading_overlay import LoadingOverlay, QuickFeedback
@@ -24,3 +25,10 @@ __all__ = [
     "LoadingOverlay",
     "QuickFeedback"
 ]
+
+
+def __getattr__(name):
+    if name == "MainWindow":
+        from .main_window import MainWindow
+        return MainWindow
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,170 @@
+"""
+Carga de dados das abas fora da thread da UI.
+
+A consulta ao banco e o processamento pandas rodam num QThread; a aba só
+recebe o resultado pronto, no slot (thread da UI), e até lá a grade continua
+mostrando os dados anteriores. Uma carga nova substitui a que estiver em
+andamento: o resultado atrasado é descartado (pela geração), e a anterior é
+cancelada — o cursor vinculado ao CancelToken recebe cancel().
+"""
+from __future__ import annotations
+
+import threading
+import traceback
+from typing import Any, Callable, Dict, Optional
+
+from PySide6.QtCore import QObject, QThread, Signal
+from PySide6.QtWidgets import QPushButton
+
+
+class LoadCancelled(Exception):
+    """Carga cancelada (pelo usuário ou por uma carga mais nova)."""
+
+
+class CancelToken:
+    """
+    Passado como 1º argumento da função de carga. A função chama bind(cur)
+    logo depois de abrir o cursor e check() entre etapas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelado = False
+        self._cursor = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelado
+
+    def bind(self, cur) -> None:
+        with self._lock:
+            self._cursor = cur
+            cancelado = self._cancelado
+        if cancelado:
+            self._cancel_cursor(cur)
+
+    def check(self) -> None:
+        if self._cancelado:
+            raise LoadCancelled()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelado = True
+            cur = self._cursor
+        if cur is not None:
+            self._cancel_cursor(cur)
+
+    @staticmethod
+    def _cancel_cursor(cur) -> None:
+        # pyodbc: interrompe o execute/fetch em andamento na outra thread
+        try:
+            cur.cancel()
+        except Exception:
+            pass
+
+
+class LoadWorker(QThread):
+    finished = Signal(dict)
+
+    def __init__(self, geracao: int, fn: Callable, args: tuple, token: CancelToken):
+        super().__init__()
+        self.geracao = geracao
+        self.fn = fn
+        self.args = args
+        self.token = token
+
+    def run(self):
+        payload: Dict[str, Any] = {"geracao": self.geracao, "ok": False}
+        try:
+            dados = self.fn(self.token, *self.args)
+            self.token.check()
+            payload.update(ok=True, dados=dados)
+        except LoadCancelled:
+            payload["cancelado"] = True
+        except Exception as e:
+            if self.token.cancelled:
+                # o cancel() no cursor costuma virar erro do driver
+                payload["cancelado"] = True
+            else:
+                payload.update(
+                    erro=str(e),
+                    tipo=type(e).__name__,
+                    detalhe=traceback.format_exc(limit=1),
+                )
+        self.finished.emit(payload)
+
+
+class AsyncLoader(QObject):
+    """
+    Uma carga por vez por aba:
+      start(fn, *args)  roda fn(token, *args) num LoadWorker
+      loaded(dados)     resultado da carga mais recente
+      failed(payload)   erro da carga mais recente (erro, tipo, detalhe)
+      busy_changed(b)   início/fim (inclui cancelamento)
+    """
+
+    loaded = Signal(object)
+    failed = Signal(dict)
+    busy_changed = Signal(bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._geracao = 0
+        self._token: Optional[CancelToken] = None
+        self._workers: Dict[int, LoadWorker] = {}
+
+    @property
+    def is_busy(self) -> bool:
+        return self._token is not None
+
+    def start(self, fn: Callable, *args) -> None:
+        ocupado = self.is_busy
+        if self._token is not None:
+            self._token.cancel()
+
+        self._geracao += 1
+        self._token = CancelToken()
+        worker = LoadWorker(self._geracao, fn, args, self._token)
+        self._workers[self._geracao] = worker
+        worker.finished.connect(self._on_worker_finished)
+        worker.start()
+
+        if not ocupado:
+            self.busy_changed.emit(True)
+
+    def cancel(self) -> None:
+        if self._token is None:
+            return
+        self._token.cancel()
+        self._token = None
+        self._geracao += 1
+        self.busy_changed.emit(False)
+
+    def bind_button(self, button: QPushButton, iniciar: Callable[[], None], texto_cancelar: str = "Cancelar"):
+        """O botão inicia a carga e, enquanto ela roda, vira "Cancelar"."""
+        texto = button.text()
+
+        def _clicked():
+            if self.is_busy:
+                self.cancel()
+            else:
+                iniciar()
+
+        button.clicked.connect(_clicked)
+        self.busy_changed.connect(lambda busy: button.setText(texto_cancelar if busy else texto))
+
+    def _on_worker_finished(self, payload: dict):
+        worker = self._workers.pop(payload["geracao"], None)
+        if worker is not None:
+            worker.wait()
+            worker.deleteLater()
+
+        if payload["geracao"] != self._geracao:
+            return  # substituída ou cancelada
+
+        self._token = None
+        self.busy_changed.emit(False)
+        if payload.get("ok"):
+            self.loaded.emit(payload["dados"])
+        elif not payload.get("cancelado"):
+            self.failed.emit(payload)
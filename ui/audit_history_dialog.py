@@ -0,0 +1,201 @@
+# ui/audit_history_dialog.py
+from __future__ import annotations
+
+from typing import Any, List, Optional
+
+from PySide6.QtCore import QDate
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QGridLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox,
+    QPushButton, QCheckBox, QDateEdit, QAbstractItemView, QHeaderView, QMessageBox,
+)
+
+from models import EditableTableModel, ExcelLikeTableView
+from rules.rules_audit_query import AuditIndex, _session_of
+from utils.formatters import fmt_num
+
+
+ACTIONS = ["(todas)", "manual_edit", "apply_rules"]
+
+EVENT_HEADERS = [
+    "Data/Hora (UTC)", "Ação", "Usuário", "DBId", "% Antes", "% Depois",
+    "Valor Antes", "Valor Depois", "Nota", "Sessão",
+]
+
+
+def _fmt(v: Any, casas: int) -> str:
+    if v is None or v == "":
+        return ""
+    try:
+        return fmt_num(float(v), casas)
+    except (TypeError, ValueError):
+        return str(v)
+
+
+class AuditHistoryDialog(QDialog):
+    """
+    Consulta ao log de auditoria (índice em rules_audit_query):
+      - histórico de uma linha (DBId)
+      - o que uma sessão alterou
+      - eventos por usuário/mês
+    """
+
+    MAX_EVENTOS = 5000
+
+    def __init__(self, *, log_path: str, dbid: Optional[int] = None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Histórico de Auditoria")
+        self.resize(1100, 600)
+
+        self.index = AuditIndex(log_path)
+
+        self._build_ui()
+
+        if dbid is not None:
+            self.ed_dbid.setText(str(dbid))
+            self.buscar()
+
+    def _build_ui(self):
+        root = QVBoxLayout(self)
+        root.setContentsMargins(12, 12, 12, 12)
+        root.setSpacing(10)
+
+        form = QGridLayout()
+        form.setHorizontalSpacing(10)
+        form.setVerticalSpacing(8)
+
+        self.ed_dbid = QLineEdit()
+        self.ed_dbid.setPlaceholderText("DBId")
+        self.ed_user = QLineEdit()
+        self.ed_user.setPlaceholderText("Usuário")
+        self.ed_session = QLineEdit()
+        self.ed_session.setPlaceholderText("Sessão (session_id)")
+        self.cmb_action = QComboBox()
+        self.cmb_action.addItems(ACTIONS)
+
+        self.chk_periodo = QCheckBox("Período")
+        self.dt_ini = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.dt_ini.setCalendarPopup(True)
+        self.dt_ini.setDisplayFormat("dd/MM/yyyy")
+        self.dt_fim = QDateEdit(QDate.currentDate())
+        self.dt_fim.setCalendarPopup(True)
+        self.dt_fim.setDisplayFormat("dd/MM/yyyy")
+
+        form.addWidget(QLabel("DBId:"), 0, 0)
+        form.addWidget(self.ed_dbid, 0, 1)
+        form.addWidget(QLabel("Usuário:"), 0, 2)
+        form.addWidget(self.ed_user, 0, 3)
+        form.addWidget(QLabel("Sessão:"), 0, 4)
+        form.addWidget(self.ed_session, 0, 5)
+        form.addWidget(QLabel("Ação:"), 1, 0)
+        form.addWidget(self.cmb_action, 1, 1)
+        form.addWidget(self.chk_periodo, 1, 2)
+        form.addWidget(self.dt_ini, 1, 3)
+        form.addWidget(self.dt_fim, 1, 4)
+        root.addLayout(form)
+
+        btns = QHBoxLayout()
+        self.btn_buscar = QPushButton("Buscar")
+        self.btn_buscar.setObjectName("btnPrimary")
+        self.btn_resumo = QPushButton("Resumo por usuário/mês")
+        self.btn_resumo.setObjectName("btnSecondary")
+        self.lbl_status = QLabel("")
+        self.lbl_status.setStyleSheet("color: #9ca3af;")
+        btns.addWidget(self.btn_buscar)
+        btns.addWidget(self.btn_resumo)
+        btns.addStretch()
+        btns.addWidget(self.lbl_status)
+        root.addLayout(btns)
+
+        self.tbl = ExcelLikeTableView()
+        self.tbl.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tbl.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tbl.verticalHeader().setVisible(False)
+        self.tbl.horizontalHeader().setStretchLastSection(True)
+        root.addWidget(self.tbl)
+
+        self.btn_buscar.clicked.connect(self.buscar)
+        self.btn_resumo.clicked.connect(self.resumo)
+        for ed in (self.ed_dbid, self.ed_user, self.ed_session):
+            ed.returnPressed.connect(self.buscar)
+
+    def _set_rows(self, headers: List[str], rows: List[List[Any]]):
+        model = EditableTableModel(headers, rows)
+        model.set_all_readonly(True)
+        self.tbl.setModel(model)
+        self.tbl.resizeColumnsToContents()
+        self.tbl.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+
+    def _periodo(self):
+        if not self.chk_periodo.isChecked():
+            return None, None
+        return (
+            self.dt_ini.date().toString("yyyy-MM-dd"),
+            self.dt_fim.date().toString("yyyy-MM-dd"),
+        )
+
+    def buscar(self):
+        dbid_txt = self.ed_dbid.text().strip()
+        dbid = None
+        if dbid_txt:
+            if not dbid_txt.isdigit():
+                QMessageBox.warning(self, "Auditoria", "DBId deve ser numérico.")
+                return
+            dbid = int(dbid_txt)
+
+        action = self.cmb_action.currentText()
+        day_from, day_to = self._periodo()
+
+        try:
+            eventos = self.index.query(
+                dbid=dbid,
+                username=self.ed_user.text().strip() or None,
+                session_id=self.ed_session.text().strip() or None,
+                action=None if action == "(todas)" else action,
+                day_from=day_from,
+                day_to=day_to,
+                limit=self.MAX_EVENTOS,
+                newest_first=True,
+            )
+        except Exception as e:
+            QMessageBox.critical(self, "Auditoria", f"Erro ao consultar auditoria:\n{e}")
+            return
+
+        rows = [
+            [
+                str(e.get("ts_utc") or "")[:19].replace("T", " "),
+                e.get("action") or "",
+                e.get("username") or "",
+                "" if e.get("dbid") is None else str(e.get("dbid")),
+                _fmt(e.get("pct_before"), 4),
+                _fmt(e.get("pct_after"), 4),
+                _fmt(e.get("valor_before"), 2),
+                _fmt(e.get("valor_after"), 2),
+                e.get("note") or "",
+                _session_of(e) or "",
+            ]
+            for e in eventos
+        ]
+        self._set_rows(EVENT_HEADERS, rows)
+
+        extra = f" (mostrando os {self.MAX_EVENTOS} mais recentes)" if len(rows) >= self.MAX_EVENTOS else ""
+        self.lbl_status.setText(f"{len(rows)} evento(s){extra}")
+
+    def resumo(self):
+        action = self.cmb_action.currentText()
+        try:
+            dados = self.index.edits_by_user_month(action=None if action == "(todas)" else action)
+        except Exception as e:
+            QMessageBox.critical(self, "Auditoria", f"Erro ao consultar auditoria:\n{e}")
+            return
+
+        user = self.ed_user.text().strip().lower()
+        if user:
+            dados = [d for d in dados if d["username"] == user]
+
+        rows = [[d["month"] or "", d["username"] or "", d["action"] or "", str(d["total"])] for d in dados]
+        self._set_rows(["Mês", "Usuário", "Ação", "Eventos"], rows)
+        self.lbl_status.setText(f"{len(rows)} linha(s)")
+
+    def done(self, result):
+        self.index.close()
+        super().done(result)
@@ -0,0 +1,133 @@
+"""
+Largura das colunas das grades sem resizeColumnsToContents.
+
+resizeColumnsToContents mede todas as células de todas as linhas. Aqui a
+largura é estimada por uma amostra de linhas + o cabeçalho, e fica em cache
+por nome de coluna (por tabela e por usuário, no QSettings). Ajustes feitos
+à mão no cabeçalho também vão para o cache; como arrastar o cabeçalho emite
+sectionResized a cada pixel, a gravação espera o arraste parar.
+"""
+from __future__ import annotations
+
+import json
+from typing import Dict, Optional
+
+import numpy as np
+from PySide6.QtCore import QCoreApplication, QSettings, Qt, QTimer
+from PySide6.QtGui import QFontMetrics
+from PySide6.QtWidgets import QHeaderView, QTableView
+
+AMOSTRA_LINHAS = 200
+MARGEM = 18          # padding da célula + seta de ordenação no cabeçalho
+LARGURA_MAX = 420
+SALVAR_APOS_MS = 500  # grava o cache depois que o arraste do cabeçalho para
+
+
+def _settings() -> QSettings:
+    return QSettings("Comissao", "Comissao")
+
+
+def _linhas_amostra(total: int, k: int = AMOSTRA_LINHAS) -> np.ndarray:
+    """Início, fim e linhas espaçadas no meio (todas, se couber)."""
+    if total <= k:
+        return np.arange(total)
+    return np.unique(np.linspace(0, total - 1, k).astype(np.intp))
+
+
+class ColumnWidths:
+    """Cache nome da coluna -> largura de uma grade, salvo por usuário."""
+
+    def __init__(self, table: str, username: str = ""):
+        self.key = f"larguras/{username or 'default'}/{table}"
+        self._ajustando = False
+        self._conectados: set[int] = set()
+        self._timer_salvar = QTimer()
+        self._timer_salvar.setSingleShot(True)
+        self._timer_salvar.setInterval(SALVAR_APOS_MS)
+        self._timer_salvar.timeout.connect(self._save)
+        app = QCoreApplication.instance()
+        if app is not None:
+            # fechou o app no meio da espera: grava o que ficou pendente
+            app.aboutToQuit.connect(self._salvar_pendente)
+        try:
+            data = json.loads(_settings().value(self.key, "{}") or "{}")
+            self._widths: Dict[str, int] = {str(k): int(v) for k, v in data.items()}
+        except (TypeError, ValueError):
+            self._widths = {}
+
+    def _save(self):
+        self._timer_salvar.stop()
+        _settings().setValue(self.key, json.dumps(self._widths, ensure_ascii=False))
+
+    def _salvar_pendente(self):
+        if self._timer_salvar.isActive():
+            self._save()
+
+    def _nome(self, model, col: int) -> str:
+        headers = getattr(model, "headers", None)
+        if headers is not None and 0 <= col < len(headers):
+            return str(headers[col])
+        return str(model.headerData(col, Qt.Orientation.Horizontal) or "")
+
+    def estimate(self, view: QTableView, col: int, linhas: np.ndarray) -> int:
+        model = view.model()
+        fm_cel = view.fontMetrics()
+        fonte_header = view.horizontalHeader().font()
+        fonte_header.setBold(True)
+        fm_header = QFontMetrics(fonte_header)
+
+        largura = fm_header.horizontalAdvance(self._nome(model, col))
+        for r in linhas:
+            txt = model.data(model.index(int(r), col))
+            if txt:
+                largura = max(largura, fm_cel.horizontalAdvance(str(txt)))
+        return min(largura + MARGEM, LARGURA_MAX)
+
+    def fit(self, view: QTableView, min_widths: Optional[Dict[str, int]] = None):
+        """
+        Aplica as larguras na grade: cache se houver, senão estimativa pela
+        amostra. min_widths (por nome) continua valendo como piso.
+        """
+        model = view.model()
+        if model is None:
+            return
+
+        header = view.horizontalHeader()
+        min_widths = min_widths or {}
+        linhas = _linhas_amostra(model.rowCount())
+        mudou = False
+
+        self._ajustando = True
+        try:
+            for col in range(model.columnCount()):
+                nome = self._nome(model, col)
+                largura = self._widths.get(nome)
+                if largura is None:
+                    largura = self.estimate(view, col, linhas)
+                    # tabela vazia só mede o cabeçalho: não vale guardar
+                    if len(linhas):
+                        self._widths[nome] = largura
+                        mudou = True
+                header.setSectionResizeMode(col, QHeaderView.Interactive)
+                header.resizeSection(col, max(largura, min_widths.get(nome, 0)))
+        finally:
+            self._ajustando = False
+
+        if mudou:
+            self._save()
+
+        if id(header) not in self._conectados:
+            header.sectionResized.connect(
+                lambda col, _old, new, v=view: self._on_resized(v, col, new)
+            )
+            self._conectados.add(id(header))
+
+    def _on_resized(self, view: QTableView, col: int, largura: int):
+        # só ajuste manual (não o feito em fit nem o stretch da última coluna)
+        if self._ajustando or view.model() is None:
+            return
+        header = view.horizontalHeader()
+        if header.stretchLastSection() and col == header.count() - 1:
+            return
+        self._widths[self._nome(view.model(), col)] = int(largura)
+        self._timer_salvar.start()  # reinicia a cada pixel do arraste
@@ -1,7 +1,7 @@
 """
 Janela principal com navegacao lateral.
 """
-from PySide6.QtCore import Qt
+from PySide6.QtCore import QMimeData, QThread, Qt, QTimer, Signal
 from PySide6.QtWidgets import (
     QApplication,
     QAbstractItemView,
@@ -19,11 +19,31 @@ from PySide6.QtWidgets import (
     QWidget,
 )
 
-from tabs import TabConsulta, TabConsolidados, TabExtrato
-from ui.loading_overlay import QuickFeedback
+from ui.loading_overlay import LoadingOverlay, QuickFeedback
 from ui.themes import ThemeManager
 
 
+# acima disso (linhas x colunas) a cópia é montada fora da thread da UI
+COPY_ASYNC_CELLS = 50_000
+
+
+class ClipboardExportWorker(QThread):
+    progress = Signal(int)
+    finished = Signal(dict)
+
+    def __init__(self, table_slice, include_header: bool):
+        super().__init__()
+        self.table_slice = table_slice
+        self.include_header = include_header
+
+    def run(self):
+        try:
+            tsv, html = self.table_slice.render(self.include_header, progress=self.progress.emit)
+            self.finished.emit({"ok": True, "tsv": tsv, "html": html})
+        except Exception as e:
+            self.finished.emit({"ok": False, "erro": str(e)})
+
+
 def center_widget(widget):
     screen = QApplication.primaryScreen().availableGeometry()
     fg = widget.frameGeometry()
@@ -37,6 +57,9 @@ class MainWindow(QMainWindow):
         self.username = username
         self.role = role
         self.nav_buttons = []
+        self._copy_worker = None
+        self._copy_overlay = None
+        self._copy_msg = ""
 
         self.setWindowTitle(f"Comissoes STIK - {username.title()} ({role.title()})")
         self.resize(1280, 760)
@@ -54,7 +77,6 @@ class MainWindow(QMainWindow):
 
         self.setCentralWidget(shell)
         self._init_pages()
-        self._setup_table_context_menus()
         self._activate_page(0)
 
     def _build_sidebar(self):
@@ -132,32 +154,61 @@ class MainWindow(QMainWindow):
         self.nav_container.addWidget(btn)
 
     def _init_pages(self):
+        # as abas são criadas na primeira ativação (_page); até lá a página
+        # é um placeholder vazio no stack
         self.page_meta = []
+        self._page_keys = []
+        self._pages_loaded = set()
 
         if self.role == "admin":
-            self.tab_consulta = TabConsulta(parent=self, role=self.role)
-            self.stack.addWidget(self.tab_consulta)
-            self.page_meta.append(("Consulta", "Busque recebimentos e adicione lancamentos ao extrato."))
-            self._add_nav_button("Consulta", len(self.page_meta) - 1)
-            self.tab_consulta.btn_add.clicked.connect(self._on_add_to_extrato)
-
-        self.tab_extrato = TabExtrato(parent=self, role=self.role, username=self.username)
-        self.stack.addWidget(self.tab_extrato)
-        self.page_meta.append(("Extrato", "Valide, ajuste regras e prepare as comissoes para consolidacao."))
-        self._add_nav_button("Extrato", len(self.page_meta) - 1)
-        self.tab_extrato.btn_consol.clicked.connect(self._on_consolidar)
+            self._register_page("consulta", "Consulta", "Busque recebimentos e adicione lancamentos ao extrato.")
+        self._register_page("extrato", "Extrato", "Valide, ajuste regras e prepare as comissoes para consolidacao.")
+        self._register_page("consolidados", "Consolidados", "Acompanhe o historico final, gere PDF e envie por e-mail.")
+
+    def _register_page(self, key: str, title: str, subtitle: str):
+        self.stack.addWidget(QWidget())
+        self._page_keys.append(key)
+        self.page_meta.append((title, subtitle))
+        self._add_nav_button(title, len(self.page_meta) - 1)
+
+    def _page(self, key: str):
+        """Aba da página `key`, criada (e colocada no stack) na primeira vez."""
+        tab = getattr(self, f"tab_{key}", None)
+        if tab is not None:
+            return tab
+
+        if key == "consulta":
+            from tabs import TabConsulta
+            tab = TabConsulta(parent=self, role=self.role, username=self.username)
+            tab.btn_add.clicked.connect(self._on_add_to_extrato)
+            table = tab.tbl
+        elif key == "extrato":
+            from tabs import TabExtrato
+            tab = TabExtrato(parent=self, role=self.role, username=self.username)
+            tab.btn_consol.clicked.connect(self._on_consolidar)
+            table = tab.tbl_extrato
+        else:
+            from tabs import TabConsolidados
+            tab = TabConsolidados(parent=self, role=self.role, username=self.username)
+            table = tab.tbl_consolidados
+        setattr(self, f"tab_{key}", tab)
 
-        self.tab_consolidados = TabConsolidados(parent=self, role=self.role, username=self.username)
-        self.stack.addWidget(self.tab_consolidados)
-        self.page_meta.append(("Consolidados", "Acompanhe o historico final, gere PDF e envie por e-mail."))
-        self._add_nav_button("Consolidados", len(self.page_meta) - 1)
+        index = self._page_keys.index(key)
+        placeholder = self.stack.widget(index)
+        self.stack.insertWidget(index, tab)
+        self.stack.removeWidget(placeholder)
+        placeholder.deleteLater()
 
-        self.tab_extrato.refresh_extrato()
+        self._setup_table_context_menu(table)
+        return tab
 
     def _activate_page(self, index: int):
         if index < 0 or index >= self.stack.count():
             return
 
+        key = self._page_keys[index]
+        tab = self._page(key)
+
         self.stack.setCurrentIndex(index)
         for i, button in enumerate(self.nav_buttons):
             button.setChecked(i == index)
@@ -166,24 +217,22 @@ class MainWindow(QMainWindow):
         self.section_title.setText(title)
         self.section_subtitle.setText(subtitle)
 
-    def _setup_table_context_menus(self):
-        if hasattr(self, "tab_consulta"):
-            self.tab_consulta.tbl.setContextMenuPolicy(Qt.CustomContextMenu)
-            self.tab_consulta.tbl.customContextMenuRequested.connect(
-                lambda pos: self._show_selection_menu(self.tab_consulta.tbl, pos)
-            )
+        # primeira carga da página: depois que ela já está na tela
+        if key not in self._pages_loaded:
+            self._pages_loaded.add(key)
+            if key == "extrato":
+                QTimer.singleShot(0, tab.refresh_extrato)
+            elif key == "consolidados":
+                QTimer.singleShot(0, tab.refresh_consolidados)
 
-        if hasattr(self, "tab_extrato"):
-            self.tab_extrato.tbl_extrato.setContextMenuPolicy(Qt.CustomContextMenu)
-            self.tab_extrato.tbl_extrato.customContextMenuRequested.connect(
-                lambda pos: self._show_selection_menu(self.tab_extrato.tbl_extrato, pos)
-            )
+    def _activate_page_key(self, key: str):
+        self._activate_page(self._page_keys.index(key))
 
-        if hasattr(self, "tab_consolidados"):
-            self.tab_consolidados.tbl_consolidados.setContextMenuPolicy(Qt.CustomContextMenu)
-            self.tab_consolidados.tbl_consolidados.customContextMenuRequested.connect(
-                lambda pos: self._show_selection_menu(self.tab_consolidados.tbl_consolidados, pos)
-            )
+    def _setup_table_context_menu(self, table: QTableView):
+        table.setContextMenuPolicy(Qt.CustomContextMenu)
+        table.customContextMenuRequested.connect(
+            lambda pos, t=table: self._show_selection_menu(t, pos)
+        )
 
     def _show_selection_menu(self, table: QTableView, pos):
         menu = QMenu(self)
@@ -207,7 +256,7 @@ class MainWindow(QMainWindow):
         action_copy_with_header = menu.addAction("Copiar com cabecalho")
         action_copy_all = menu.addAction("Copiar tabela visivel")
 
-        has_selection = len(table.selectionModel().selectedIndexes()) > 0
+        has_selection = table.selectionModel().hasSelection()
         action_copy.setEnabled(has_selection)
         action_copy_with_header.setEnabled(has_selection)
 
@@ -238,39 +287,89 @@ class MainWindow(QMainWindow):
                 return
 
             if all_visible:
-                rows = range(model.rowCount())
-                cols = range(model.columnCount())
+                rows = list(range(model.rowCount()))
+                cols = list(range(model.columnCount()))
             else:
-                selection = table.selectionModel().selectedIndexes()
-                if not selection:
+                # linhas/colunas a partir das faixas (sem enumerar célula por célula)
+                ranges = table.selectionModel().selection()
+                if ranges.isEmpty():
                     return
-                rows = sorted(set(index.row() for index in selection))
-                cols = sorted(set(index.column() for index in selection))
-
-            lines = []
-            if include_header:
-                if isinstance(model, EditableTableModel):
-                    lines.append("\t".join(model.headers[col] for col in cols))
-                else:
+                row_set, col_set = set(), set()
+                for r in ranges:
+                    row_set.update(range(r.top(), r.bottom() + 1))
+                    col_set.update(range(r.left(), r.right() + 1))
+                rows, cols = sorted(row_set), sorted(col_set)
+
+            msg = f"Tabela copiada ({len(rows)} linhas)" if all_visible else f"{len(rows)} linha(s) x {len(cols)} coluna(s) copiadas"
+
+            if not isinstance(model, EditableTableModel):
+                lines = []
+                if include_header:
                     lines.append(
                         "\t".join(str(model.headerData(col, Qt.Horizontal, Qt.DisplayRole) or "") for col in cols)
                     )
+                for row in rows:
+                    row_data = []
+                    for col in cols:
+                        value = model.data(model.index(row, col), Qt.DisplayRole)
+                        row_data.append(str(value) if value is not None else "")
+                    lines.append("\t".join(row_data))
+                QApplication.clipboard().setText("\n".join(lines))
+                QuickFeedback.show(self, msg, success=True)
+                return
+
+            recorte = model.table_slice(rows, cols)
+            if len(rows) * len(cols) < COPY_ASYNC_CELLS:
+                tsv, html = recorte.render(include_header)
+                self._set_clipboard_table(tsv, html)
+                QuickFeedback.show(self, msg, success=True)
+                return
 
-            for row in rows:
-                row_data = []
-                for col in cols:
-                    index = model.index(row, col)
-                    value = model.data(index, Qt.DisplayRole)
-                    row_data.append(str(value) if value is not None else "")
-                lines.append("\t".join(row_data))
+            if self._copy_worker is not None:
+                QuickFeedback.show(self, "Ainda copiando a tabela anterior...", success=False)
+                return
 
-            QApplication.clipboard().setText("\n".join(lines))
-            msg = f"Tabela copiada ({len(rows)} linhas)" if all_visible else f"{len(rows)} linha(s) x {len(cols)} coluna(s) copiadas"
-            QuickFeedback.show(self, msg, success=True)
+            self._copy_msg = msg
+            self._copy_overlay = LoadingOverlay(self, "Copiando tabela... 0%")
+            self._copy_overlay.show_overlay()
+            worker = ClipboardExportWorker(recorte, include_header)
+            self._copy_worker = worker
+            worker.progress.connect(self._on_copy_progress)
+            worker.finished.connect(self._on_copy_finished)
+            worker.start()
         except Exception as e:
             print(f"Erro ao copiar: {e}")
             QuickFeedback.show(self, "Erro ao copiar dados", success=False)
 
+    def _on_copy_progress(self, pct: int):
+        if self._copy_overlay is not None:
+            self._copy_overlay.update_message(f"Copiando tabela... {pct}%")
+
+    def _on_copy_finished(self, payload):
+        worker = self._copy_worker
+        self._copy_worker = None
+        if worker is not None:
+            worker.deleteLater()
+        if self._copy_overlay is not None:
+            self._copy_overlay.close_overlay()
+            self._copy_overlay = None
+
+        if not payload.get("ok"):
+            print(f"Erro ao copiar: {payload.get('erro')}")
+            QuickFeedback.show(self, "Erro ao copiar dados", success=False)
+            return
+
+        self._set_clipboard_table(payload["tsv"], payload["html"])
+        QuickFeedback.show(self, self._copy_msg, success=True)
+
+    @staticmethod
+    def _set_clipboard_table(tsv: str, html: str):
+        """TSV (texto puro) + tabela HTML (Excel cola com as células separadas)."""
+        mime = QMimeData()
+        mime.setText(tsv)
+        mime.setHtml(html)
+        QApplication.clipboard().setMimeData(mime)
+
     def _on_add_to_extrato(self):
         if not hasattr(self, "tab_consulta"):
             return
@@ -282,8 +381,10 @@ class MainWindow(QMainWindow):
 
         try:
             self.tab_consulta.add_to_extrato([s.row() for s in sel])
-            self.tab_extrato.refresh_extrato()
-            self._activate_page(1 if self.role == "admin" else 0)
+            # se o extrato ainda não foi aberto, a ativação já faz a primeira carga
+            if "extrato" in self._pages_loaded:
+                self.tab_extrato.atualizar_alteracoes()
+            self._activate_page_key("extrato")
         except Exception as e:
             QMessageBox.critical(self, "Erro", str(e))
 
@@ -292,17 +393,24 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Permissao", "Apenas a controladoria ou o admin podem consolidar.")
             return
 
+        # a consolidação copia o que está no banco: edição não salva ficaria de fora
+        if self.tab_extrato.has_pending_edits():
+            QMessageBox.warning(
+                self, "Consolidacao", "Há alterações não salvas no extrato. Salve antes de consolidar."
+            )
+            return
+
         if not self.tab_extrato.ensure_current_data_synced("consolidar"):
             return
 
         df = self.tab_extrato.get_filtered_data()
-        success, message = self.tab_consolidados.consolidar_registros(df)
+        success, message = self._page("consolidados").consolidar_registros(df)
 
         if success:
-            self.tab_extrato.refresh_extrato()
+            self.tab_extrato.atualizar_alteracoes()
+            self._pages_loaded.add("consolidados")
             self.tab_consolidados.refresh_consolidados()
-            target = 2 if self.role == "admin" else 1
-            self._activate_page(target)
+            self._activate_page_key("consolidados")
         else:
             QMessageBox.warning(self, "Consolidacao", message)
 
@@ -0,0 +1,172 @@
+"""
+Envio da fila local de gravações (utils.write_queue) em segundo plano.
+
+Um WriteQueueWorker por vez aplica as pendentes em ordem, um commit por
+operação. Erro de conexão/timeout para o lote e agenda nova tentativa com
+espera crescente; erro definitivo marca a operação como falha (a tela mostra
+e o usuário pode reenviar) e segue para a próxima.
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List
+
+from PySide6.QtCore import QObject, QStandardPaths, QThread, QTimer, Signal
+
+from config import get_conn
+from utils.db_schema import verificar_schema_extrato
+from utils.write_queue import FilaGravacao, aplicar_operacao, erro_transitorio
+
+LOTE = 50
+ESPERA_INICIAL_MS = 5000
+ESPERA_MAX_MS = 5 * 60 * 1000
+
+
+def caminho_fila(username: str) -> str:
+    """Arquivo da fila do usuário, na pasta de dados local (fora do projeto)."""
+    base = QStandardPaths.writableLocation(QStandardPaths.GenericDataLocation) or os.path.expanduser("~")
+    pasta = os.path.join(base, "Comissao")
+    os.makedirs(pasta, exist_ok=True)
+    return os.path.join(pasta, f"fila_{username or 'default'}.sqlite3")
+
+
+class WriteQueueWorker(QThread):
+    finished = Signal(dict)
+
+    def __init__(self, cfg, fila: FilaGravacao):
+        super().__init__()
+        self.cfg = cfg
+        self.fila = fila
+
+    def run(self):
+        aplicadas: List[Dict[str, Any]] = []
+        falhas: List[Dict[str, Any]] = []
+        transitorio = None
+        try:
+            ops = self.fila.proximas(LOTE)
+            if ops:
+                with get_conn(self.cfg) as conn:
+                    cur = conn.cursor()
+                    verificar_schema_extrato(cur)
+                    for op in ops:
+                        try:
+                            resultado, rebases = aplicar_operacao(cur, op, self.fila)
+                            conn.commit()
+                        except Exception as e:
+                            conn.rollback()
+                            if erro_transitorio(e):
+                                self.fila.adiar(op, str(e))
+                                transitorio = str(e)
+                                break
+                            self.fila.falhar(op, str(e))
+                            falhas.append({"chave": op.chave, "tipo": op.tipo, "payload": op.payload, "erro": str(e)})
+                            continue
+                        # commit feito: se cair aqui, o reenvio da chave só lê o resultado
+                        self.fila.concluir(op, rebases)
+                        aplicadas.append({
+                            "chave": op.chave, "tipo": op.tipo, "payload": op.payload, "resultado": resultado,
+                        })
+        except Exception as e:
+            # sem conexão (ou caiu no meio): tudo que sobrou continua pendente
+            transitorio = str(e)
+
+        self.finished.emit({
+            "aplicadas": aplicadas,
+            "falhas": falhas,
+            "transitorio": transitorio,
+            "restantes": transitorio is None and len(aplicadas) + len(falhas) >= LOTE,
+        })
+
+
+class WriteQueueRunner(QObject):
+    """
+    Fila de gravações de uma aba:
+      enqueue(tipo, payload)   grava na fila local e dispara o envio
+      applied(op)              operação aplicada no banco (chave, tipo, payload, resultado)
+      failed(op)               erro definitivo (chave, tipo, payload, erro)
+      state_changed(p, f)      pendentes / com falha
+      offline(msg)             sem banco; vai tentar de novo sozinha
+    """
+
+    applied = Signal(dict)
+    failed = Signal(dict)
+    state_changed = Signal(int, int)
+    offline = Signal(str)
+
+    def __init__(self, cfg, username: str, parent=None):
+        super().__init__(parent)
+        self.cfg = cfg
+        self.username = username
+        self.fila = FilaGravacao(caminho_fila(username))
+        self._worker = None
+        self._de_novo = False
+        self._espera_ms = ESPERA_INICIAL_MS
+
+        self._retry_timer = QTimer(self)
+        self._retry_timer.setSingleShot(True)
+        self._retry_timer.timeout.connect(self.kick)
+
+        # pendentes de uma sessão anterior (app fechado/sem rede)
+        QTimer.singleShot(0, self.kick)
+
+    @property
+    def is_busy(self) -> bool:
+        return self._worker is not None
+
+    def contagem(self):
+        return self.fila.contagem()
+
+    def enqueue(self, tipo: str, payload: Dict[str, Any]) -> str:
+        chave = self.fila.enfileirar(tipo, payload, self.username)
+        self._emitir_estado()
+        self.kick()
+        return chave
+
+    def retry_failed(self) -> int:
+        n = self.fila.reenviar_falhas()
+        self._emitir_estado()
+        self.kick()
+        return n
+
+    def discard_failed(self) -> set:
+        """Descarta as que falharam; devolve os Ids do extrato que elas tocavam."""
+        ids = self.fila.descartar_falhas()
+        self._emitir_estado()
+        return ids
+
+    def kick(self):
+        if self._worker is not None:
+            self._de_novo = True
+            return
+        self._retry_timer.stop()
+        self._de_novo = False
+        if self.fila.contagem()[0] == 0:
+            return
+        self._worker = WriteQueueWorker(self.cfg, self.fila)
+        self._worker.finished.connect(self._on_worker_finished)
+        self._worker.start()
+
+    def _on_worker_finished(self, payload: dict):
+        worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.wait()
+            worker.deleteLater()
+
+        for op in payload["aplicadas"]:
+            self.applied.emit(op)
+        for op in payload["falhas"]:
+            self.failed.emit(op)
+        self._emitir_estado()
+
+        if payload["transitorio"] is not None:
+            self.offline.emit(payload["transitorio"])
+            self._retry_timer.start(self._espera_ms)
+            self._espera_ms = min(self._espera_ms * 2, ESPERA_MAX_MS)
+            return
+
+        self._espera_ms = ESPERA_INICIAL_MS
+        if payload["restantes"] or self._de_novo:
+            self.kick()
+
+    def _emitir_estado(self):
+        self.state_changed.emit(*self.fila.contagem())
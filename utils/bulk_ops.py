@@ -0,0 +1,145 @@
+"""
+Operações em lote por conjunto de Ids (validar, remover do extrato, excluir
+consolidados, consolidar).
+
+Os Ids vão uma única vez para a tabela temporária #ids (executemany) e cada
+operação roda set-based contra ela, devolvendo o que foi afetado via OUTPUT.
+Tudo na conexão do cursor recebido: o commit/rollback fica com quem chama.
+"""
+from __future__ import annotations
+
+from typing import Iterable, List, Tuple
+
+
+def carregar_ids(cur, ids: Iterable[int]) -> List[int]:
+    """(Re)cria #ids com os Ids informados (sem repetição). Devolve a lista enviada."""
+    lista = sorted({int(i) for i in ids})
+    cur.execute("IF OBJECT_ID('tempdb..#ids') IS NOT NULL DROP TABLE #ids")
+    cur.execute("CREATE TABLE #ids (Id INT NOT NULL PRIMARY KEY)")
+    if lista:
+        cur.fast_executemany = True
+        cur.executemany("INSERT INTO #ids (Id) VALUES (?)", [(i,) for i in lista])
+    return lista
+
+
+def descartar_ids(cur) -> None:
+    cur.execute("IF OBJECT_ID('tempdb..#ids') IS NOT NULL DROP TABLE #ids")
+
+
+def validar_extrato(cur, ids: Iterable[int], usuario: str) -> List[Tuple[int, object, int]]:
+    """Valida as linhas não consolidadas. Devolve [(Id, ValidadoEm, Versao)] das validadas."""
+    if not carregar_ids(cur, ids):
+        return []
+    # OUTPUT ... INTO: a tabela tem trigger (log de alterações), OUTPUT direto não é aceito
+    cur.execute("""
+        SET NOCOUNT ON;
+        DECLARE @validados TABLE (Id INT NOT NULL, ValidadoEm DATETIME NULL, Versao BIGINT NOT NULL);
+
+        UPDATE e
+           SET Validado = 1, ValidadoPor = ?, ValidadoEm = GETDATE()
+        OUTPUT inserted.Id, inserted.ValidadoEm, CAST(inserted.VersaoLinha AS BIGINT)
+          INTO @validados (Id, ValidadoEm, Versao)
+          FROM dbo.Stik_Extrato_Comissoes e
+          JOIN #ids i ON i.Id = e.Id
+         WHERE ISNULL(e.Consolidado, 0) = 0;
+
+        SELECT Id, ValidadoEm, Versao FROM @validados;
+    """, usuario)
+    validados = [(int(r[0]), r[1], int(r[2])) for r in cur.fetchall()]
+    descartar_ids(cur)
+    return validados
+
+
+def remover_do_extrato(cur, ids: Iterable[int]) -> List[int]:
+    """Apaga do extrato as linhas não consolidadas. Devolve os Ids apagados."""
+    if not carregar_ids(cur, ids):
+        return []
+    cur.execute("""
+        SET NOCOUNT ON;
+        DECLARE @apagados TABLE (Id INT NOT NULL);
+
+        DELETE e
+        OUTPUT deleted.Id INTO @apagados (Id)
+          FROM dbo.Stik_Extrato_Comissoes e
+          JOIN #ids i ON i.Id = e.Id
+         WHERE ISNULL(e.Consolidado, 0) = 0;
+
+        SELECT Id FROM @apagados;
+    """)
+    apagados = [int(r[0]) for r in cur.fetchall()]
+    descartar_ids(cur)
+    return apagados
+
+
+def excluir_consolidados(cur, ids: Iterable[int]) -> Tuple[List[int], List[object]]:
+    """
+    Apaga as linhas da consolidação e desmarca Consolidado no extrato para os
+    Docs delas. Devolve (Ids apagados, Docs desmarcados).
+    """
+    if not carregar_ids(cur, ids):
+        return [], []
+    cur.execute("""
+        SET NOCOUNT ON;
+        DECLARE @removidos TABLE (Id INT NOT NULL, Doc BIGINT NULL);
+
+        DELETE c
+        OUTPUT deleted.Id, deleted.Doc INTO @removidos (Id, Doc)
+          FROM dbo.Stik_Consolidacao_Comissoes c
+          JOIN #ids i ON i.Id = c.Id;
+
+        UPDATE dbo.Stik_Extrato_Comissoes
+           SET Consolidado = 0
+         WHERE Doc IN (SELECT Doc FROM @removidos WHERE Doc IS NOT NULL);
+
+        SELECT Id, Doc FROM @removidos;
+    """)
+    linhas = cur.fetchall()
+    descartar_ids(cur)
+    apagados = [int(r[0]) for r in linhas]
+    docs = sorted({r[1] for r in linhas if r[1] is not None})
+    return apagados, docs
+
+
+# Trava no extrato (só validadas e ainda não consolidadas) e copia as travadas
+# para a consolidação; o SELECT final devolve os Ids travados.
+CONSOLIDAR_SQL = """
+SET NOCOUNT ON;
+DECLARE @travados TABLE (Id INT NOT NULL PRIMARY KEY);
+
+UPDATE e
+SET Consolidado = 1
+OUTPUT inserted.Id INTO @travados (Id)
+FROM dbo.Stik_Extrato_Comissoes e
+JOIN #ids i ON i.Id = e.Id
+WHERE e.Validado = 1 AND ISNULL(e.Consolidado, 0) = 0;
+
+INSERT INTO dbo.Stik_Consolidacao_Comissoes (
+    Competencia, Doc, Cliente, Artigo, Linha, UF,
+    DataRecebimento, RecebimentoLiq, PercComissao, ValorComissao,
+    Observacao, CriadoPor,
+    VendedorID, Vendedor, Titulo, MeioPagamento,
+    Emissao, Vencimento, Recebido, ICMSST, Frete,
+    PrecoMedio, PrecoVenda, PrazoMedio
+)
+SELECT
+    CONVERT(CHAR(7), e.DataRecebimento, 126), e.Doc, e.Cliente, e.Artigo, e.Linha, e.UF,
+    e.DataRecebimento, e.RecebimentoLiq, e.PercComissao, e.ValorComissao,
+    LEFT(ISNULL(e.Observacao, ''), 500), 'PySide6-App',
+    e.VendedorID, e.Vendedor, e.Titulo, e.MeioPagamento,
+    e.Emissao, e.Vencimento, e.Recebido, e.ICMSST, e.Frete,
+    e.PrecoMedio, e.PrecoVenda, e.PrazoMedio
+FROM dbo.Stik_Extrato_Comissoes e
+JOIN @travados t ON t.Id = e.Id;
+
+SELECT Id FROM @travados;
+"""
+
+
+def consolidar_extrato(cur, ids: Iterable[int]) -> List[int]:
+    """Consolida as linhas validadas e ainda livres. Devolve os Ids travados."""
+    if not carregar_ids(cur, ids):
+        return []
+    cur.execute(CONSOLIDAR_SQL)
+    travados = [int(r[0]) for r in cur.fetchall()]
+    descartar_ids(cur)
+    return travados
@@ -0,0 +1,80 @@
+"""
+Schema do extrato no banco.
+
+O schema é criado pelos scripts versionados de sql/migrations, rodados pelo
+DBA em ordem; o app só confere (só leitura) que os objetos de que depende
+existem e, se faltar algum, falha com SchemaDesatualizado dizendo qual
+script rodar. A conferência fica em cache no processo.
+"""
+from __future__ import annotations
+
+MIGRACOES_DIR = "sql/migrations"
+
+_extrato_ok = False
+
+
+class SchemaDesatualizado(RuntimeError):
+    """Falta no banco um objeto criado por um script de sql/migrations."""
+
+
+# (objeto, expressão que dá NULL se ele não existe, script que cria)
+OBJETOS_EXTRATO = (
+    ("coluna Stik_Extrato_Comissoes.RegraVersao",
+     "COL_LENGTH('dbo.Stik_Extrato_Comissoes', 'RegraVersao')", "001_extrato_regra_proveniencia.sql"),
+    ("coluna Stik_Extrato_Comissoes.RegraId",
+     "COL_LENGTH('dbo.Stik_Extrato_Comissoes', 'RegraId')", "001_extrato_regra_proveniencia.sql"),
+    ("índice IX_Stik_Extrato_RegraVersao",
+     "INDEXPROPERTY(OBJECT_ID('dbo.Stik_Extrato_Comissoes'), 'IX_Stik_Extrato_RegraVersao', 'IndexID')",
+     "001_extrato_regra_proveniencia.sql"),
+    ("coluna Stik_Extrato_Comissoes.VersaoLinha",
+     "COL_LENGTH('dbo.Stik_Extrato_Comissoes', 'VersaoLinha')", "002_extrato_versao_linha.sql"),
+    ("índice IX_Stik_Extrato_VersaoLinha",
+     "INDEXPROPERTY(OBJECT_ID('dbo.Stik_Extrato_Comissoes'), 'IX_Stik_Extrato_VersaoLinha', 'IndexID')",
+     "002_extrato_versao_linha.sql"),
+    ("tabela Stik_Extrato_Alteracoes",
+     "OBJECT_ID('dbo.Stik_Extrato_Alteracoes', 'U')", "003_extrato_alteracoes.sql"),
+    ("trigger TR_Stik_Extrato_Alteracoes",
+     "OBJECT_ID('dbo.TR_Stik_Extrato_Alteracoes', 'TR')", "003_extrato_alteracoes.sql"),
+    ("tabela Stik_Fila_Aplicadas",
+     "OBJECT_ID('dbo.Stik_Fila_Aplicadas', 'U')", "004_fila_aplicadas.sql"),
+    ("tabela Stik_Regras_Versoes",
+     "OBJECT_ID('dbo.Stik_Regras_Versoes', 'U')", "005_regras_versoes.sql"),
+)
+
+VERIFICAR_SQL = "SELECT " + ", ".join(
+    f"CASE WHEN {expr} IS NULL THEN 0 ELSE 1 END" for _, expr, _ in OBJETOS_EXTRATO
+)
+
+
+# dias de log mantidos pelo job sql/jobs/limpeza_retencao.sql (tem que ser o
+# mesmo valor); cliente parado há mais tempo que a metade recarrega tudo
+ALTERACOES_RETENCAO_DIAS = 3
+
+# chaves da fila guardadas pelo job sql/jobs/limpeza_retencao.sql: operação que
+# fica na fila local mais que isso pode ser aplicada de novo
+FILA_RETENCAO_DIAS = 30
+
+
+def verificar_schema_extrato(cur) -> None:
+    """
+    Confere (uma vez por processo) que os objetos de OBJETOS_EXTRATO
+    (proveniência de regra, VersaoLinha, log de alterações, chaves da fila
+    de gravação, snapshots de regras) existem; levanta SchemaDesatualizado com os scripts que
+    faltam rodar.
+    Só leitura no catálogo: duas threads conferindo ao mesmo tempo não se
+    atrapalham.
+    """
+    global _extrato_ok
+    if _extrato_ok:
+        return
+
+    cur.execute(VERIFICAR_SQL)
+    existe = cur.fetchone()
+    faltam = [(obj, script) for (obj, _, script), ok in zip(OBJETOS_EXTRATO, existe) if not ok]
+    if faltam:
+        scripts = sorted({script for _, script in faltam})
+        raise SchemaDesatualizado(
+            "Schema do banco desatualizado, falta: " + ", ".join(obj for obj, _ in faltam)
+            + f". Peça ao DBA para rodar {', '.join(f'{MIGRACOES_DIR}/{s}' for s in scripts)}."
+        )
+    _extrato_ok = True
@@ -0,0 +1,164 @@
+"""
+Leitura do extrato (dbo.Stik_Extrato_Comissoes) com os nomes de coluna da grade.
+
+Além da carga completa, permite reler só algumas linhas (por Id), só um
+escopo (período de recebimento + vendedor) ou só o que mudou desde uma versão
+(VersaoLinha, rowversion), para atualizar a grade sem baixar a tabela inteira.
+
+A coluna Versao (VersaoLinha como BIGINT) vai junto em toda leitura: é ela
+que as gravações comparam para não sobrescrever alteração de outro usuário.
+As linhas apagadas saem do log dbo.Stik_Extrato_Alteracoes (ver db_schema).
+
+A consolidação (dbo.Stik_Consolidacao_Comissoes) não tem VersaoLinha: linha
+consolidada não muda, só entra (Id crescente) ou é excluída.
+"""
+from __future__ import annotations
+
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+
+EXTRATO_SELECT_SQL = """
+SELECT Id as DBId, Competencia, Doc as ID, VendedorID, Vendedor, Titulo, Cliente, UF,
+    Artigo, Linha, Recebido, ICMSST, Frete, RecebimentoLiq as [Rec Liquido],
+    PrazoMedio as [Prazo Médio], PrecoMedio as [Preço Médio], PrecoVenda as [Preço Venda],
+    MeioPagamento as [M Pagamento], Emissao as [Emissão], Vencimento as [Vencimento],
+    DataRecebimento as [Recebimento], PercComissao as [% Comissão], ValorComissao as [Valor Comissão],
+    Observacao as [Observação], Validado, ValidadoPor, ValidadoEm, Consolidado,
+    Percentual_Comissao as [% Percentual Padrão], RegraVersao, RegraId,
+    CAST(VersaoLinha AS BIGINT) as Versao
+FROM dbo.Stik_Extrato_Comissoes
+"""
+
+EXTRATO_ORDER_SQL = " ORDER BY DataRecebimento DESC, Id DESC"
+
+# SQL Server aceita até 2100 parâmetros por comando
+IDS_POR_CONSULTA = 1000
+
+
+def _frame(cur) -> pd.DataFrame:
+    rows = cur.fetchall()
+    cols = [d[0] for d in cur.description]
+    return pd.DataFrame.from_records(rows, columns=cols)
+
+
+def fetch_extrato(cur) -> pd.DataFrame:
+    """Extrato completo, mais recente primeiro."""
+    cur.execute(EXTRATO_SELECT_SQL + EXTRATO_ORDER_SQL)
+    return _frame(cur)
+
+
+def fetch_extrato_ids(cur, ids: Iterable[int]) -> pd.DataFrame:
+    """Só as linhas dos Ids informados (Ids inexistentes simplesmente não voltam)."""
+    ids = sorted({int(i) for i in ids})
+    partes = []
+    for i in range(0, len(ids), IDS_POR_CONSULTA):
+        lote = ids[i:i + IDS_POR_CONSULTA]
+        marcadores = ",".join("?" * len(lote))
+        cur.execute(EXTRATO_SELECT_SQL + f" WHERE Id IN ({marcadores})", *lote)
+        partes.append(_frame(cur))
+
+    if not partes:
+        cur.execute(EXTRATO_SELECT_SQL + " WHERE 1 = 0")
+        return _frame(cur)
+    return pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+
+
+def fetch_extrato_periodo(cur, data_ini, data_fim, vendedor: Optional[str] = None) -> pd.DataFrame:
+    """Linhas com DataRecebimento no período (e do vendedor, se informado)."""
+    sql = EXTRATO_SELECT_SQL + " WHERE DataRecebimento BETWEEN ? AND ?"
+    params = [data_ini, data_fim]
+    if vendedor:
+        sql += " AND Vendedor = ?"
+        params.append(vendedor)
+    cur.execute(sql + EXTRATO_ORDER_SQL, *params)
+    return _frame(cur)
+
+
+def versao_corte(cur) -> int:
+    """
+    Versão a partir da qual ainda pode haver alteração não vista: ler antes
+    da carga e passar para fetch_extrato_alterados na próxima. Usa
+    MIN_ACTIVE_ROWVERSION, então transações abertas durante a carga (versão
+    menor, commit depois) não se perdem.
+    """
+    cur.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT)")
+    return int(cur.fetchone()[0])
+
+
+def fetch_extrato_alterados(cur, desde: int) -> pd.DataFrame:
+    """
+    Linhas inseridas ou alteradas com VersaoLinha >= desde (ver versao_corte).
+    Linhas apagadas não aparecem aqui (ver fetch_extrato_apagados).
+    """
+    cur.execute(
+        EXTRATO_SELECT_SQL + " WHERE VersaoLinha >= CAST(CAST(? AS BIGINT) AS BINARY(8))" + EXTRATO_ORDER_SQL,
+        int(desde),
+    )
+    return _frame(cur)
+
+
+def fetch_extrato_apagados(cur, desde: int) -> List[int]:
+    """Ids apagados do extrato com Versao do log >= desde (ver versao_corte)."""
+    cur.execute(
+        "SELECT DISTINCT ExtratoId FROM dbo.Stik_Extrato_Alteracoes"
+        " WHERE Operacao = 'D' AND Versao >= CAST(CAST(? AS BIGINT) AS BINARY(8))",
+        int(desde),
+    )
+    return [int(r[0]) for r in cur.fetchall()]
+
+
+def chave_titulo(doc: pd.Series, artigo: pd.Series, titulo: pd.Series, recebimento_iso: pd.Series) -> pd.Series:
+    """
+    Chave normalizada Doc|Artigo|Titulo|data de recebimento (ISO) que diz se
+    um título da consulta já está no extrato. Vetorizada: mesmas Series (e
+    mesmo índice) dos dois lados da comparação.
+    """
+    def norm(serie: pd.Series) -> pd.Series:
+        # número inteiro que virou float por causa de nulo: "123", não "123.0"
+        if serie.dtype.kind == "f" and (serie.dropna() % 1 == 0).all():
+            serie = serie.astype("Int64")
+        return serie.astype(object).fillna("").astype(str).str.strip().str.lower()
+
+    sep = "\x1f"
+    return norm(doc) + sep + norm(artigo) + sep + norm(titulo) + sep + norm(recebimento_iso)
+
+
+def fetch_chaves_extrato_abertas(cur, data_ini, data_fim, vendedor: Optional[str] = None) -> set:
+    """
+    chave_titulo das linhas não consolidadas com recebimento no período (e
+    vendedor contendo o texto, como o filtro da consulta 866).
+    """
+    sql = (
+        "SELECT Doc, Artigo, Titulo, CONVERT(VARCHAR(10), DataRecebimento, 23)"
+        " FROM dbo.Stik_Extrato_Comissoes"
+        " WHERE Consolidado = 0 AND DataRecebimento BETWEEN ? AND ?"
+    )
+    params = [data_ini, data_fim]
+    if vendedor:
+        sql += " AND Vendedor LIKE ?"
+        params.append(f"%{vendedor}%")
+    cur.execute(sql, *params)
+    df = pd.DataFrame.from_records(cur.fetchall(), columns=["Doc", "Artigo", "Titulo", "Recebimento"])
+    return set(chave_titulo(df["Doc"], df["Artigo"], df["Titulo"], df["Recebimento"]))
+
+
+CONSOLIDADOS_SELECT_SQL = """
+SELECT Id as DBId, Competencia, Doc as ID, VendedorID, Vendedor, Titulo, Cliente, UF,
+    Artigo, Linha, Recebido, ICMSST, Frete, RecebimentoLiq as [Rec Liquido],
+    PrazoMedio as [Prazo Médio], PrecoMedio as [Preço Médio], PrecoVenda as [Preço Venda],
+    MeioPagamento as [M Pagamento], Emissao as [Emissão], Vencimento as [Vencimento],
+    DataRecebimento as [Recebimento], PercComissao as [% Comissão], ValorComissao as [Valor Comissão],
+    Observacao as [Observação]
+FROM dbo.Stik_Consolidacao_Comissoes
+"""
+
+
+def fetch_consolidados(cur, acima_de: Optional[int] = None) -> pd.DataFrame:
+    """Consolidados, mais recente primeiro; com acima_de, só Id > acima_de."""
+    if acima_de is None:
+        cur.execute(CONSOLIDADOS_SELECT_SQL + EXTRATO_ORDER_SQL)
+    else:
+        cur.execute(CONSOLIDADOS_SELECT_SQL + " WHERE Id > ?" + EXTRATO_ORDER_SQL, int(acima_de))
+    return _frame(cur)
@@ -3,6 +3,7 @@ from __future__ import annotations
 from decimal import Decimal, ROUND_HALF_UP
 from typing import Any
 
+import numpy as np
 import pandas as pd
 
 from utils.formatters import br_to_decimal, br_to_float
@@ -16,9 +17,11 @@ INSERT INTO dbo.Stik_Extrato_Comissoes (
     VendedorID, Vendedor, Titulo, MeioPagamento,
     Emissao, Vencimento, Recebido, ICMSST, Frete,
     PrecoMedio, PrecoVenda, PrazoMedio, Percentual_Comissao,
-    Validado, ValidadoPor, ValidadoEm, Consolidado
+    Validado, ValidadoPor, ValidadoEm, Consolidado,
+    RegraVersao, RegraId
 ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,
-         ?,?,?,?,?,?,?,?,?,?,?,?,?, ?, ?, ?, 0)
+         ?,?,?,?,?,?,?,?,?,?,?,?,?, ?, ?, ?, 0,
+         ?, ?)
 """
 
 
@@ -40,6 +43,18 @@ def insert_extrato_row(
     ))
 
 
+def insert_extrato_rows(cur, params_batch: list[tuple]) -> int:
+    """Insere um lote de build_extrato_insert_params() em um executemany. Não faz commit."""
+    if not params_batch:
+        return 0
+    try:
+        cur.fast_executemany = True
+    except Exception:
+        pass
+    cur.executemany(EXTRATO_INSERT_SQL, params_batch)
+    return len(params_batch)
+
+
 def build_extrato_insert_params(
     row: dict[str, Any] | pd.Series,
     *,
@@ -49,90 +64,270 @@ def build_extrato_insert_params(
     preserve: dict[str, Any] | None = None,
 ):
     data = row.to_dict() if isinstance(row, pd.Series) else dict(row)
-    preserve = preserve or {}
-
-    pct = br_to_decimal(_pick_pct(data, pct_comissao, preserve), 4) or Decimal("0.0000")
-    pct_padrao = br_to_decimal(
-        data.get("Percentual_Comissao")
-        if data.get("Percentual_Comissao") not in (None, "")
-        else data.get("% Percentual Padrão")
-        if data.get("% Percentual Padrão") not in (None, "")
-        else data.get("% Percentual PadrÃ£o")
-        if data.get("% Percentual PadrÃ£o") not in (None, "")
-        else pct,
-        4,
-    ) or Decimal("0.0000")
-
-    recebido = br_to_decimal(data.get("Recebido", 0), 2) or Decimal("0.00")
-    icmsst = br_to_decimal(data.get("ICMSST", 0), 2) or Decimal("0.00")
-    frete = br_to_decimal(data.get("Frete", 0), 2) or Decimal("0.00")
-
-    rec_liq = (recebido - icmsst - frete).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-    valor_com = (rec_liq * pct / Decimal("100")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
-    dt_receb = pd.to_datetime(data.get("Recebimento"), dayfirst=True, errors="coerce")
-    if pd.isna(dt_receb):
-        dt_receb = pd.to_datetime(data.get("DataRecebimentoISO"), errors="coerce")
-    competencia = dt_receb.strftime("%Y-%m") if pd.notna(dt_receb) else None
-
-    obs_final = preserve.get("Observacao")
-    if obs_final in (None, ""):
-        obs_final = observacao
-    if obs_final in (None, ""):
-        obs_final = data.get("Observação")
-    if obs_final in (None, ""):
-        obs_final = data.get("Observacao")
-
-    validado_raw = preserve.get("Validado")
-    validado = 1 if str(validado_raw).strip().lower() in {"1", "true", "sim"} else 0
-
-    return (
-        competencia,
-        int(str(data.get("ID", 0)) or 0),
-        str(data.get("Cliente", ""))[:200],
-        str(data.get("Artigo", ""))[:200],
-        str(data.get("Linha", ""))[:200],
-        str(data.get("UF", ""))[:2],
-        dt_receb.date() if pd.notna(dt_receb) else None,
-        rec_liq,
-        pct,
-        valor_com,
-        str(obs_final or "")[:500],
-        criado_por,
-        int(br_to_float(data.get("VendedorID", 0))) or None,
-        str(data.get("Vendedor", ""))[:200] or None,
-        str(data.get("Titulo", ""))[:120] or None,
-        str(data.get("M Pagamento") or data.get("MeioPagamento") or "")[:100] or None,
-        _to_date(data.get("Emissão") or data.get("Emissao") or data.get("EmissÃ£o")),
-        _to_date(data.get("Vencimento")),
-        recebido,
-        icmsst,
-        frete,
-        br_to_decimal(data.get("Preço Médio") or data.get("PrecoMedio") or data.get("PreÃ§o MÃ©dio"), 4),
-        br_to_decimal(data.get("Preço Venda") or data.get("PrecoVenda") or data.get("PreÃ§o Venda"), 4),
-        br_to_decimal(data.get("Prazo Médio") or data.get("PrazoMedio") or data.get("Prazo MÃ©dio"), 2),
-        pct_padrao,
-        validado,
-        preserve.get("ValidadoPor"),
-        preserve.get("ValidadoEm"),
+    colunas = {k: [v] for k, v in data.items()}
+    return _montar_params(colunas, 1, [pct_comissao], [preserve], criado_por, observacao)[0]
+
+
+def build_extrato_insert_params_frame(
+    df: pd.DataFrame,
+    *,
+    pct_comissao: Any = None,
+    criado_por: str = "PySide6-App",
+    observacao: str | None = None,
+    preserve: Any = None,
+) -> list[tuple]:
+    """
+    build_extrato_insert_params() para o DataFrame inteiro, na ordem das linhas
+    (mesma saída que chamar linha a linha via to_dict("records"); conferido
+    por utils/tests/check_insert_params.py).
+
+    pct_comissao e preserve: um valor para todas as linhas ou uma lista
+    alinhada com df (ex.: % editado na grade, preserve por chave na sync).
+
+    Atenção: o lote é montado de uma vez, então uma linha inválida (ex.: ID
+    ou VendedorID não numérico) levanta aqui e derruba o lote inteiro, sem
+    tupla nenhuma para as linhas boas. Antes o erro saía na linha, depois
+    das anteriores já montadas.
+    """
+    n = len(df)
+    if n == 0:
+        return []
+    colunas = {c: df[c].tolist() for c in _COLUNAS_LIDAS if c in df.columns}
+    return _montar_params(
+        colunas, n, _por_linha(pct_comissao, n), _por_linha(preserve, n), criado_por, observacao
     )
 
 
-def _pick_pct(data: dict[str, Any], pct_comissao: Any, preserve: dict[str, Any]) -> Any:
-    for value in (
-        preserve.get("PercComissao"),
-        pct_comissao,
-        data.get("% Comissão"),
-        data.get("Percentual_Comissao"),
-        data.get("% Percentual Padrão"),
-        data.get("% Percentual PadrÃ£o"),
-        Decimal("0.0000"),
-    ):
+# colunas lidas pelo builder, com os apelidos (inclusive os nomes com
+# mojibake que ainda chegam de planilhas antigas)
+_PCT_LINHA = ("% Comissão", "Percentual_Comissao", "% Percentual Padrão", "% Percentual PadrÃ£o")
+_PCT_PADRAO = ("Percentual_Comissao", "% Percentual Padrão", "% Percentual PadrÃ£o")
+_OBS = ("Observação", "Observacao")
+_MEIO = ("M Pagamento", "MeioPagamento")
+_EMISSAO = ("Emissão", "Emissao", "EmissÃ£o")
+_PRECO_MEDIO = ("Preço Médio", "PrecoMedio", "PreÃ§o MÃ©dio")
+_PRECO_VENDA = ("Preço Venda", "PrecoVenda", "PreÃ§o Venda")
+_PRAZO = ("Prazo Médio", "PrazoMedio", "Prazo MÃ©dio")
+_COLUNAS_LIDAS = tuple(dict.fromkeys((
+    "ID", "Cliente", "Artigo", "Linha", "UF", "Recebimento", "DataRecebimentoISO",
+    "VendedorID", "Vendedor", "Titulo", "Vencimento", "Recebido", "ICMSST", "Frete",
+    *_PCT_LINHA, *_OBS, *_MEIO, *_EMISSAO, *_PRECO_MEDIO, *_PRECO_VENDA, *_PRAZO,
+)))
+
+
+def _montar_params(
+    colunas: dict[str, list],
+    n: int,
+    pcts: list,
+    preserves: list,
+    criado_por: str,
+    observacao: str | None,
+) -> list[tuple]:
+    """Núcleo dos dois builders: apelidos resolvidos por coluna, conversões memorizadas por valor."""
+    def col(nome, padrao=None):
+        return colunas[nome] if nome in colunas else [padrao] * n
+
+    pct_linha = _coluna_preenchida(colunas, _PCT_LINHA, n)
+    pct_padrao_linha = _coluna_preenchida(colunas, _PCT_PADRAO, n)
+    obs_linha = _coluna_preenchida(colunas, _OBS, n)
+    meio = _coluna_ou(colunas, _MEIO, n)
+    emissao = _coluna_ou(colunas, _EMISSAO, n)
+    preco_medio = _coluna_ou(colunas, _PRECO_MEDIO, n)
+    preco_venda = _coluna_ou(colunas, _PRECO_VENDA, n)
+    prazo = _coluna_ou(colunas, _PRAZO, n)
+
+    dec = _memo(br_to_decimal)
+    dia = _memo(_to_date)
+    receb = _memo(_competencia_e_data)
+    vendedor_id = _memo(lambda v: int(br_to_float(v)) or None)
+
+    saida = []
+    for i, (doc, cliente, artigo, linha, uf, recebimento, receb_iso, vend_id, vendedor, titulo,
+            vencimento, v_recebido, v_icmsst, v_frete) in enumerate(zip(
+        col("ID", 0), col("Cliente", ""), col("Artigo", ""), col("Linha", ""), col("UF", ""),
+        col("Recebimento"), col("DataRecebimentoISO"), col("VendedorID", 0), col("Vendedor", ""),
+        col("Titulo", ""), col("Vencimento"), col("Recebido", 0), col("ICMSST", 0), col("Frete", 0),
+    )):
+        preserve = preserves[i] or {}
+
+        pct = dec(_primeiro_preenchido(preserve.get("PercComissao"), pcts[i], pct_linha[i], Decimal("0.0000")), 4) \
+            or Decimal("0.0000")
+        padrao = pct_padrao_linha[i]
+        pct_padrao = dec(padrao if padrao is not None else pct, 4) or Decimal("0.0000")
+
+        recebido = dec(v_recebido, 2) or Decimal("0.00")
+        icmsst = dec(v_icmsst, 2) or Decimal("0.00")
+        frete = dec(v_frete, 2) or Decimal("0.00")
+
+        rec_liq = (recebido - icmsst - frete).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        valor_com = (rec_liq * pct / Decimal("100")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+        competencia, dt_receb = receb(recebimento, receb_iso)
+
+        obs_final = _primeiro_preenchido(preserve.get("Observacao"), observacao, obs_linha[i])
+
+        validado_raw = preserve.get("Validado")
+        validado = 1 if str(validado_raw).strip().lower() in {"1", "true", "sim"} else 0
+
+        saida.append((
+            competencia,
+            int(str(doc) or 0),
+            str(cliente)[:200],
+            str(artigo)[:200],
+            str(linha)[:200],
+            str(uf)[:2],
+            dt_receb,
+            rec_liq,
+            pct,
+            valor_com,
+            str(obs_final or "")[:500],
+            criado_por,
+            vendedor_id(vend_id),
+            str(vendedor)[:200] or None,
+            str(titulo)[:120] or None,
+            str(meio[i] or "")[:100] or None,
+            dia(emissao[i]),
+            dia(vencimento),
+            recebido,
+            icmsst,
+            frete,
+            dec(preco_medio[i], 4),
+            dec(preco_venda[i], 4),
+            dec(prazo[i], 2),
+            pct_padrao,
+            validado,
+            preserve.get("ValidadoPor"),
+            preserve.get("ValidadoEm"),
+            _nullable_str(preserve.get("RegraVersao"), 12),
+            _nullable_str(preserve.get("RegraId"), 8),
+        ))
+    return saida
+
+
+def _por_linha(valor: Any, n: int) -> list:
+    if isinstance(valor, (list, tuple, pd.Series, np.ndarray)):
+        valores = list(valor)
+        if len(valores) != n:
+            raise ValueError(f"esperado 1 valor por linha ({n}), recebido {len(valores)}")
+        return valores
+    return [valor] * n
+
+
+def _primeiro_preenchido(*valores: Any) -> Any:
+    """Primeiro valor diferente de None e de "" (None se nenhum)."""
+    for value in valores:
         if value not in (None, ""):
             return value
-    return Decimal("0.0000")
+    return None
+
+
+def _coluna_preenchida(colunas: dict[str, list], nomes: tuple, n: int) -> list:
+    """_primeiro_preenchido entre os apelidos, por linha."""
+    listas = [colunas[c] for c in nomes if c in colunas]
+    if not listas:
+        return [None] * n
+    return [_primeiro_preenchido(*valores) for valores in zip(*listas)]
+
+
+def _coluna_ou(colunas: dict[str, list], nomes: tuple, n: int) -> list:
+    """`a or b or c` entre os apelidos, por linha (apelido ausente = None)."""
+    listas = [colunas[c] if c in colunas else [None] * n for c in nomes]
+    saida = listas[-1]
+    for lista in reversed(listas[:-1]):
+        saida = [a or b for a, b in zip(lista, saida)]
+    return saida
+
+
+def _memo(fn):
+    """Cache por valor (e tipo: 1 e 1.0 convertem diferente) para conversões repetidas."""
+    cache: dict = {}
+
+    def conv(*args):
+        chave = tuple((type(a), a) for a in args)
+        try:
+            return cache[chave]
+        except KeyError:
+            valor = cache[chave] = fn(*args)
+            return valor
+        except TypeError:  # valor não hashable
+            return fn(*args)
+
+    return conv
+
+
+def _competencia_e_data(recebimento: Any, recebimento_iso: Any):
+    dt_receb = pd.to_datetime(recebimento, dayfirst=True, errors="coerce")
+    if pd.isna(dt_receb):
+        dt_receb = pd.to_datetime(recebimento_iso, errors="coerce")
+    if pd.isna(dt_receb):
+        return None, None
+    return dt_receb.strftime("%Y-%m"), dt_receb.date()
+
+
+def _nullable_str(value: Any, size: int) -> str | None:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    text = str(value).strip()[:size]
+    return text or None
 
 
 def _to_date(value):
     dt = pd.to_datetime(value, dayfirst=True, errors="coerce")
     return None if pd.isna(dt) else dt.date()
+
+
+# edições da grade: as linhas vão para uma tabela temporária (executemany) e
+# um único UPDATE set-based grava todas. A linha só é gravada se a VersaoLinha
+# no banco ainda for a lida na carga (senão alguém mudou a linha depois).
+EDICOES_TEMP_SQL = """
+CREATE TABLE #edicoes (
+    Id INT NOT NULL PRIMARY KEY,
+    PercComissao DECIMAL(18, 4) NOT NULL,
+    ValorComissao DECIMAL(18, 2) NOT NULL,
+    Observacao NVARCHAR(500) NULL,
+    RegraVersao VARCHAR(12) NULL,
+    RegraId VARCHAR(8) NULL,
+    VersaoOriginal BIGINT NULL
+)
+"""
+
+EDICOES_INSERT_SQL = "INSERT INTO #edicoes VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+EDICOES_UPDATE_SQL = """
+SET NOCOUNT ON;
+DECLARE @gravados TABLE (Id INT NOT NULL, Versao BIGINT NOT NULL);
+
+UPDATE e
+SET PercComissao = s.PercComissao,
+    ValorComissao = s.ValorComissao,
+    Observacao = COALESCE(s.Observacao, e.Observacao),
+    RegraVersao = s.RegraVersao,
+    RegraId = s.RegraId
+OUTPUT inserted.Id, CAST(inserted.VersaoLinha AS BIGINT) INTO @gravados (Id, Versao)
+FROM dbo.Stik_Extrato_Comissoes e
+JOIN #edicoes s ON s.Id = e.Id
+WHERE ? = 1 OR CAST(e.VersaoLinha AS BIGINT) = s.VersaoOriginal;
+
+SELECT Id, Versao FROM @gravados;
+"""
+
+
+def salvar_edicoes_extrato(cur, edicoes: list[tuple], *, forcar: bool = False) -> tuple[dict[int, int], set[int]]:
+    """
+    Grava as edições da grade em um UPDATE. Cada item de `edicoes`:
+    (Id, pct, valor, obs, regra_versao, regra_id, versao_lida).
+
+    Com forcar=True grava sem comparar a versão. Não faz commit.
+    Retorna ({Id gravado: nova Versao}, Ids não gravados: conflito ou não existem mais).
+    """
+    if not edicoes:
+        return {}, set()
+
+    cur.execute("IF OBJECT_ID('tempdb..#edicoes') IS NOT NULL DROP TABLE #edicoes")
+    cur.execute(EDICOES_TEMP_SQL)
+    cur.fast_executemany = True
+    cur.executemany(EDICOES_INSERT_SQL, edicoes)
+    cur.execute(EDICOES_UPDATE_SQL, 1 if forcar else 0)
+    gravados = {int(r[0]): int(r[1]) for r in cur.fetchall()}
+    cur.execute("DROP TABLE #edicoes")
+    return gravados, {int(e[0]) for e in edicoes} - set(gravados)
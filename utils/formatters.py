@@ -89,6 +89,75 @@ def prepare_df_for_display(df: pd.DataFrame) -> pd.DataFrame:
     return df.reset_index(drop=True)
 
 
+# colunas numéricas com formatação fixa (nome -> casas decimais)
+NUMERIC_DISPLAY_PLACES = {
+    "Preço Médio": 4,
+    "Preço Venda": 4,
+    "Percentual_Comissao": 2,
+    "Recebido": 2,
+    "ICMSST": 2,
+    "Frete": 2,
+    "Rec Liquido": 2,
+    "% Comissão": 2,
+    "Valor Comissão": 2,
+}
+
+
+def fix_prazo(v):
+    """
+    Prazo Médio como número exibível: divide por 10 se >= 100 e múltiplo de 10.
+    Retorna None se não for numérico.
+    """
+    try:
+        x = float(v)
+    except (TypeError, ValueError):
+        return None
+    if x != x:
+        return None
+    if x >= 100 and x % 10 == 0:
+        x = x / 10.0
+    return x
+
+
+def _fmt_prazo(v):
+    x = fix_prazo(v)
+    return "0,00" if x is None else fmt_num(x, 2)
+
+
+def _fmt_places(places):
+    vazio = fmt_num(None, places)
+
+    def _fmt(v):
+        if v is None or (isinstance(v, float) and v != v):
+            return vazio
+        return fmt_num(v, places)
+    return _fmt
+
+
+def display_text(v):
+    """Texto de célula para colunas sem formatação numérica (vazio para None/NaN/NaT)."""
+    if v is None:
+        return ""
+    try:
+        if pd.isna(v):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    return str(v)
+
+
+def display_formatter(col):
+    """
+    Função valor -> texto de exibição da coluna (mesmas regras de
+    apply_display_formats). Retorna None para colunas sem formatação fixa.
+    """
+    if col == "Prazo Médio":
+        return _fmt_prazo
+    if col in NUMERIC_DISPLAY_PLACES:
+        return _fmt_places(NUMERIC_DISPLAY_PLACES[col])
+    return None
+
+
 def apply_display_formats(df: pd.DataFrame) -> pd.DataFrame:
     """
     Aplica formatações de exibição no DataFrame
@@ -100,33 +169,12 @@ def apply_display_formats(df: pd.DataFrame) -> pd.DataFrame:
         DataFrame formatado para exibição
     """
     df2 = df.copy()
-    
-    # Fix Prazo Médio (divide por 10 se >= 100)
-    if "Prazo Médio" in df2.columns:
-        def _fix_prazo(v):
-            try:
-                x = float(v)
-                if x >= 100 and x % 10 == 0:
-                    x = x / 10.0
-                return fmt_num(x, 2)
-            except:
-                return "0,00"
-        df2["Prazo Médio"] = df2["Prazo Médio"].apply(_fix_prazo)
-    
-    # Preços com 4 casas decimais
-    for c in ["Preço Médio", "Preço Venda"]:
-        if c in df2.columns:
-            df2[c] = df2[c].apply(lambda x: fmt_num(x, 4))
-    
-    # Percentual de comissão
-    if "Percentual_Comissao" in df2.columns:
-        df2["Percentual_Comissao"] = df2["Percentual_Comissao"].apply(lambda x: fmt_num(x, 2))
-    
-    # Valores monetários com 2 casas decimais
-    for c in ["Recebido", "ICMSST", "Frete", "Rec Liquido", "% Comissão", "Valor Comissão"]:
-        if c in df2.columns:
-            df2[c] = df2[c].apply(lambda x: fmt_num(x, 2))
-    
+
+    for c in df2.columns:
+        fmt = display_formatter(c)
+        if fmt is not None:
+            df2[c] = df2[c].apply(fmt)
+
     return df2
 
 
@@ -0,0 +1,269 @@
+"""
+Réplica local (SQLite) do extrato e dos consolidados, só para leitura.
+
+Ligada por DBConfig.replica (variável COMISSAO_REPLICA: caminho do arquivo).
+Cada leitura sincroniza antes o que mudou no servidor e lê o resto do disco
+local, em vez de baixar a tabela inteira pela rede:
+
+  extrato      por VersaoLinha: linhas com versão >= corte + apagadas pelo log
+               de alterações (ver extrato_reader); parada há mais tempo que o
+               log guarda, ou com colunas diferentes, baixa tudo de novo
+  consolidados por Id: linha consolidada não muda, então só vem Id > maior Id
+               local; exclusão é detectada pela contagem dos Ids até ele
+
+Gravação continua indo só para o servidor. Sem Qt aqui; cada método abre a
+própria conexão SQLite (usada a partir das threads de carga).
+"""
+from __future__ import annotations
+
+import datetime as _dt
+import sqlite3
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from utils.db_schema import ALTERACOES_RETENCAO_DIAS
+from utils.extrato_reader import (
+    chave_titulo,
+    fetch_consolidados,
+    fetch_extrato,
+    fetch_extrato_alterados,
+    fetch_extrato_apagados,
+    versao_corte,
+)
+
+_META_SQL = """
+CREATE TABLE IF NOT EXISTS meta (tabela TEXT NOT NULL, chave TEXT NOT NULL, valor, PRIMARY KEY (tabela, chave));
+CREATE TABLE IF NOT EXISTS colunas (tabela TEXT NOT NULL, ordem INTEGER NOT NULL, nome TEXT NOT NULL, tipo TEXT NOT NULL,
+                                    PRIMARY KEY (tabela, ordem));
+"""
+
+# tipo Python guardado por coluna -> volta do texto/número do SQLite
+_DECODIFICAR: Dict[str, Callable[[Any], Any]] = {
+    "Decimal": Decimal,
+    "date": _dt.date.fromisoformat,
+    "datetime": _dt.datetime.fromisoformat,
+    "bool": bool,
+}
+
+_replicas: Dict[str, "ReplicaLocal"] = {}
+
+
+def abrir_replica(cfg) -> Optional["ReplicaLocal"]:
+    """Réplica configurada em cfg (uma instância por arquivo), ou None se desligada."""
+    caminho = str(getattr(cfg, "replica", "") or "").strip()
+    if not caminho:
+        return None
+    if caminho not in _replicas:
+        _replicas[caminho] = ReplicaLocal(caminho)
+    return _replicas[caminho]
+
+
+def _tipo(serie: pd.Series) -> str:
+    for v in serie:
+        if v is None or (isinstance(v, float) and v != v) or v is pd.NaT:
+            continue
+        if isinstance(v, bool):
+            return "bool"
+        if isinstance(v, Decimal):
+            return "Decimal"
+        if isinstance(v, _dt.datetime):
+            return "datetime"
+        if isinstance(v, _dt.date):
+            return "date"
+        return "valor"
+    return "valor"
+
+
+def _codificar(v: Any) -> Any:
+    if v is None or v is pd.NaT or (isinstance(v, float) and v != v):
+        return None
+    if isinstance(v, Decimal):
+        return str(v)
+    if isinstance(v, (_dt.date, _dt.datetime)):
+        return v.isoformat()
+    if hasattr(v, "item"):  # escalar numpy
+        return v.item()
+    return v
+
+
+def _q(nome: str) -> str:
+    return '"' + nome.replace('"', '""') + '"'
+
+
+class ReplicaLocal:
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        with self._conn() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_META_SQL)
+
+    def _conn(self) -> sqlite3.Connection:
+        # isolation_level=None: as transações são abertas à mão (BEGIN IMMEDIATE)
+        return sqlite3.connect(self.caminho, timeout=60, isolation_level=None)
+
+    # ---------------- estrutura ----------------
+
+    def _meta(self, db, tabela: str, chave: str) -> Any:
+        linha = db.execute("SELECT valor FROM meta WHERE tabela = ? AND chave = ?", (tabela, chave)).fetchone()
+        return None if linha is None else linha[0]
+
+    def _set_meta(self, db, tabela: str, **valores: Any) -> None:
+        db.executemany(
+            "INSERT OR REPLACE INTO meta (tabela, chave, valor) VALUES (?, ?, ?)",
+            [(tabela, k, v) for k, v in valores.items()],
+        )
+
+    def _colunas(self, db, tabela: str) -> List[Tuple[str, str]]:
+        return db.execute("SELECT nome, tipo FROM colunas WHERE tabela = ? ORDER BY ordem", (tabela,)).fetchall()
+
+    def _recriar(self, db, tabela: str, df: pd.DataFrame) -> None:
+        """Troca a tabela local inteira pelo frame (primeira carga ou mudança de colunas)."""
+        db.execute(f"DROP TABLE IF EXISTS {_q(tabela)}")
+        cols = ", ".join(f"{_q(c)} INTEGER PRIMARY KEY" if c == "DBId" else _q(c) for c in df.columns)
+        db.execute(f"CREATE TABLE {_q(tabela)} ({cols})")
+        db.execute("DELETE FROM colunas WHERE tabela = ?", (tabela,))
+        db.executemany(
+            "INSERT INTO colunas (tabela, ordem, nome, tipo) VALUES (?, ?, ?, ?)",
+            [(tabela, i, c, _tipo(df[c])) for i, c in enumerate(df.columns)],
+        )
+        db.execute("DELETE FROM meta WHERE tabela = ?", (tabela,))
+        self._gravar(db, tabela, df)
+
+    def _gravar(self, db, tabela: str, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+        # coluna que até aqui só teve nulo ganha o tipo dos valores que chegaram
+        db.executemany(
+            "UPDATE colunas SET tipo = ? WHERE tabela = ? AND nome = ? AND tipo = 'valor'",
+            [(t, tabela, c) for c in df.columns if (t := _tipo(df[c])) != "valor"],
+        )
+        valores = [[_codificar(v) for v in df[c].to_numpy(dtype=object)] for c in df.columns]
+        marcadores = ", ".join("?" * len(df.columns))
+        db.executemany(
+            f"INSERT OR REPLACE INTO {_q(tabela)} ({', '.join(_q(c) for c in df.columns)}) VALUES ({marcadores})",
+            zip(*valores),
+        )
+
+    def _apagar(self, db, tabela: str, ids) -> None:
+        db.executemany(f"DELETE FROM {_q(tabela)} WHERE DBId = ?", [(int(i),) for i in ids])
+
+    def _mesmas_colunas(self, db, tabela: str, df: pd.DataFrame) -> bool:
+        return [n for n, _ in self._colunas(db, tabela)] == list(df.columns)
+
+    def _ler(self, tabela: str) -> pd.DataFrame:
+        with self._conn() as db:
+            colunas = self._colunas(db, tabela)
+            if not colunas:
+                return pd.DataFrame()
+            linhas = db.execute(
+                f"SELECT {', '.join(_q(n) for n, _ in colunas)} FROM {_q(tabela)}"
+                ' ORDER BY "Recebimento" DESC, DBId DESC'
+            ).fetchall()
+        # volta aos tipos do pyodbc e monta o frame como extrato_reader._frame,
+        # para o pandas inferir os mesmos dtypes da leitura no servidor
+        convs = [_DECODIFICAR.get(tipo) for _, tipo in colunas]
+        if any(convs) and linhas:
+            colunas_valores = [
+                vals if conv is None else [None if v is None else conv(v) for v in vals]
+                for conv, vals in zip(convs, zip(*linhas))
+            ]
+            linhas = list(zip(*colunas_valores))
+        return pd.DataFrame.from_records(linhas, columns=[n for n, _ in colunas])
+
+    # ---------------- extrato ----------------
+
+    def sincronizar_extrato(self, cur) -> int:
+        """
+        Traz para a réplica o que mudou no extrato desde a última vez e devolve
+        o corte de versão da réplica (o mesmo papel de versao_corte).
+        """
+        with self._conn() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                corte = self._meta(db, "extrato", "corte")
+                quando = self._meta(db, "extrato", "sincronizado_em") or 0
+                novo = versao_corte(cur)
+                if corte is None or time.time() - quando > ALTERACOES_RETENCAO_DIAS * 86400:
+                    self._recriar(db, "extrato", fetch_extrato(cur))
+                else:
+                    df = fetch_extrato_alterados(cur, int(corte))
+                    apagados = fetch_extrato_apagados(cur, int(corte))
+                    if not df.empty and not self._mesmas_colunas(db, "extrato", df):
+                        self._recriar(db, "extrato", fetch_extrato(cur))
+                    else:
+                        self._gravar(db, "extrato", df)
+                        self._apagar(db, "extrato", apagados)
+                self._set_meta(db, "extrato", corte=novo, sincronizado_em=time.time())
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return novo
+
+    def ler_extrato(self) -> pd.DataFrame:
+        """Extrato da réplica, na ordem de fetch_extrato."""
+        return self._ler("extrato")
+
+    def chaves_extrato_abertas(self, data_ini, data_fim, vendedor: Optional[str] = None) -> Set[str]:
+        """Como extrato_reader.fetch_chaves_extrato_abertas, lido da réplica."""
+        with self._conn() as db:
+            if not self._colunas(db, "extrato"):
+                return set()
+            sql = (
+                'SELECT "ID", "Artigo", "Titulo", substr("Recebimento", 1, 10) FROM extrato'
+                ' WHERE COALESCE("Consolidado", 0) = 0 AND substr("Recebimento", 1, 10) BETWEEN ? AND ?'
+            )
+            params = [data_ini.isoformat(), data_fim.isoformat()]
+            if vendedor:
+                sql += ' AND "Vendedor" LIKE ?'
+                params.append(f"%{vendedor}%")
+            linhas = db.execute(sql, params).fetchall()
+        df = pd.DataFrame.from_records(linhas, columns=["Doc", "Artigo", "Titulo", "Recebimento"])
+        return set(chave_titulo(df["Doc"], df["Artigo"], df["Titulo"], df["Recebimento"]))
+
+    def vendedores_abertos(self) -> List[str]:
+        """Vendedores com linha não consolidada no extrato, em ordem."""
+        with self._conn() as db:
+            if not self._colunas(db, "extrato"):
+                return []
+            return [
+                r[0] for r in db.execute(
+                    'SELECT DISTINCT "Vendedor" FROM extrato'
+                    ' WHERE COALESCE("Consolidado", 0) = 0 AND "Vendedor" IS NOT NULL ORDER BY "Vendedor"'
+                )
+            ]
+
+    # ---------------- consolidados ----------------
+
+    def sincronizar_consolidados(self, cur) -> None:
+        """Novos consolidados por Id e exclusões pela contagem de Ids."""
+        with self._conn() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                if not self._colunas(db, "consolidados"):
+                    self._recriar(db, "consolidados", fetch_consolidados(cur))
+                else:
+                    maior, qtd = db.execute("SELECT MAX(DBId), COUNT(*) FROM consolidados").fetchone()
+                    maior = int(maior or 0)
+                    cur.execute("SELECT COUNT(*) FROM dbo.Stik_Consolidacao_Comissoes WHERE Id <= ?", maior)
+                    if int(cur.fetchone()[0]) != qtd:
+                        cur.execute("SELECT Id FROM dbo.Stik_Consolidacao_Comissoes WHERE Id <= ?", maior)
+                        no_servidor = {int(r[0]) for r in cur.fetchall()}
+                        locais = {int(r[0]) for r in db.execute("SELECT DBId FROM consolidados")}
+                        self._apagar(db, "consolidados", locais - no_servidor)
+                    df = fetch_consolidados(cur, maior)
+                    if not df.empty and not self._mesmas_colunas(db, "consolidados", df):
+                        self._recriar(db, "consolidados", fetch_consolidados(cur))
+                    else:
+                        self._gravar(db, "consolidados", df)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def ler_consolidados(self) -> pd.DataFrame:
+        """Consolidados da réplica, na ordem de fetch_consolidados."""
+        return self._ler("consolidados")
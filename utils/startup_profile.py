@@ -0,0 +1,99 @@
+"""
+Perfil de inicialização: tempos de import (python -X importtime) e marcos
+da abertura do app até o login aparecer.
+
+    python main.py --perfil-inicializacao
+
+roda o app num processo filho com -X importtime, fecha assim que o login
+fica visível e imprime os marcos + os imports mais caros.
+"""
+from __future__ import annotations
+
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Tuple
+
+FLAG_PERFIL = "--perfil-inicializacao"
+FLAG_SAIR_APOS_LOGIN = "--sair-apos-login"
+
+# não devem estar carregados quando o login aparece
+MODULOS_PESADOS = ("pandas", "numpy", "pyodbc", "reportlab", "smtplib", "models")
+
+TOP_IMPORTS = 25
+
+_t0 = time.perf_counter()
+_marcos: List[Tuple[str, float, List[str]]] = []
+
+_RE_LINHA = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def marcar(nome: str) -> None:
+    """Registra um marco (ms desde o import deste módulo + pesados já carregados)."""
+    carregados = [m for m in MODULOS_PESADOS if m in sys.modules]
+    _marcos.append((nome, (time.perf_counter() - _t0) * 1000.0, carregados))
+
+
+def relatorio_marcos() -> str:
+    return "\n".join(
+        f"  {nome:<22} {ms:9.1f} ms   pesados: {', '.join(pesados) or '-'}"
+        for nome, ms, pesados in _marcos
+    )
+
+
+def parse_importtime(texto: str) -> List[Dict]:
+    """Linhas do -X importtime -> [{modulo, self_us, cumulativo_us, nivel}]."""
+    saida = []
+    for linha in texto.splitlines():
+        m = _RE_LINHA.match(linha)
+        if not m:
+            continue
+        self_us, cum_us, recuo, modulo = m.groups()
+        saida.append({
+            "modulo": modulo,
+            "self_us": int(self_us),
+            "cumulativo_us": int(cum_us),
+            "nivel": (len(recuo) - 1) // 2,
+        })
+    return saida
+
+
+def resumo_importtime(texto: str, top: int = TOP_IMPORTS) -> str:
+    """Total dos imports de primeiro nível + os `top` maiores por tempo acumulado."""
+    registros = parse_importtime(texto)
+    if not registros:
+        return "  (sem saída do -X importtime)"
+
+    total_ms = sum(r["cumulativo_us"] for r in registros if r["nivel"] == 0) / 1000.0
+    linhas = [f"  total (imports de 1º nível): {total_ms:.1f} ms em {len(registros)} módulos", ""]
+    linhas.append(f"  {'acumulado':>10} {'próprio':>9}  módulo")
+    for r in sorted(registros, key=lambda r: r["cumulativo_us"], reverse=True)[:top]:
+        linhas.append(
+            f"  {r['cumulativo_us'] / 1000:8.1f}ms {r['self_us'] / 1000:7.1f}ms  "
+            f"{'  ' * r['nivel']}{r['modulo']}"
+        )
+    return "\n".join(linhas)
+
+
+def rodar_perfil(script: str) -> int:
+    """Sobe `script` num filho com -X importtime até o login aparecer e imprime o resumo."""
+    import subprocess
+
+    env = dict(os.environ)
+    env.pop("PYTHONIMPORTTIME", None)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", script, FLAG_SAIR_APOS_LOGIN],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=env,
+    )
+
+    # stderr mistura importtime com avisos do Qt: o parse ignora o resto
+    print("== Marcos ==")
+    print(proc.stdout.rstrip() or "  (sem marcos)")
+    print()
+    print("== Imports (até o login + import da MainWindow) ==")
+    print(resumo_importtime(proc.stderr))
+    return proc.returncode
@@ -0,0 +1,240 @@
+"""
+Regressão do builder de INSERT do extrato: build_extrato_insert_params_frame
+tem que gerar, linha a linha, as mesmas tuplas que o builder antigo (uma
+linha por vez, copiado abaixo como referência).
+
+    python utils/tests/check_insert_params.py
+
+Gera frames aleatórios (semente fixa) com os apelidos de coluna, inclusive
+os nomes com mojibake, valores BR/numéricos/vazios repetidos (para passar
+pelo cache de conversões) e pct_comissao/preserve únicos ou por linha.
+Mudou um apelido, a ordem de preferência ou a chave do cache e a saída
+mudou: falha aqui.
+
+A referência recebe as linhas de df.to_dict("records"), que guardam None
+como None (iterrows, no pandas 3, troca None por NaN nas colunas object).
+"""
+import random
+import sys
+import warnings
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+import pandas as pd
+
+from utils.extrato_writer import build_extrato_insert_params, build_extrato_insert_params_frame
+from utils.formatters import br_to_decimal, br_to_float
+
+RODADAS = 400
+LINHAS = 12
+
+
+# ============================================================
+# Referência: builder linha a linha de antes do builder por frame
+# ============================================================
+
+def _ref_params(row, *, pct_comissao=None, criado_por="PySide6-App", observacao=None, preserve=None):
+    data = row.to_dict() if isinstance(row, pd.Series) else dict(row)
+    preserve = preserve or {}
+
+    pct = br_to_decimal(_ref_pick_pct(data, pct_comissao, preserve), 4) or Decimal("0.0000")
+    pct_padrao = br_to_decimal(
+        data.get("Percentual_Comissao")
+        if data.get("Percentual_Comissao") not in (None, "")
+        else data.get("% Percentual Padrão")
+        if data.get("% Percentual Padrão") not in (None, "")
+        else data.get("% Percentual PadrÃ£o")
+        if data.get("% Percentual PadrÃ£o") not in (None, "")
+        else pct,
+        4,
+    ) or Decimal("0.0000")
+
+    recebido = br_to_decimal(data.get("Recebido", 0), 2) or Decimal("0.00")
+    icmsst = br_to_decimal(data.get("ICMSST", 0), 2) or Decimal("0.00")
+    frete = br_to_decimal(data.get("Frete", 0), 2) or Decimal("0.00")
+
+    rec_liq = (recebido - icmsst - frete).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    valor_com = (rec_liq * pct / Decimal("100")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+    dt_receb = pd.to_datetime(data.get("Recebimento"), dayfirst=True, errors="coerce")
+    if pd.isna(dt_receb):
+        dt_receb = pd.to_datetime(data.get("DataRecebimentoISO"), errors="coerce")
+    competencia = dt_receb.strftime("%Y-%m") if pd.notna(dt_receb) else None
+
+    obs_final = preserve.get("Observacao")
+    if obs_final in (None, ""):
+        obs_final = observacao
+    if obs_final in (None, ""):
+        obs_final = data.get("Observação")
+    if obs_final in (None, ""):
+        obs_final = data.get("Observacao")
+
+    validado_raw = preserve.get("Validado")
+    validado = 1 if str(validado_raw).strip().lower() in {"1", "true", "sim"} else 0
+
+    return (
+        competencia,
+        int(str(data.get("ID", 0)) or 0),
+        str(data.get("Cliente", ""))[:200],
+        str(data.get("Artigo", ""))[:200],
+        str(data.get("Linha", ""))[:200],
+        str(data.get("UF", ""))[:2],
+        dt_receb.date() if pd.notna(dt_receb) else None,
+        rec_liq,
+        pct,
+        valor_com,
+        str(obs_final or "")[:500],
+        criado_por,
+        int(br_to_float(data.get("VendedorID", 0))) or None,
+        str(data.get("Vendedor", ""))[:200] or None,
+        str(data.get("Titulo", ""))[:120] or None,
+        str(data.get("M Pagamento") or data.get("MeioPagamento") or "")[:100] or None,
+        _ref_date(data.get("Emissão") or data.get("Emissao") or data.get("EmissÃ£o")),
+        _ref_date(data.get("Vencimento")),
+        recebido,
+        icmsst,
+        frete,
+        br_to_decimal(data.get("Preço Médio") or data.get("PrecoMedio") or data.get("PreÃ§o MÃ©dio"), 4),
+        br_to_decimal(data.get("Preço Venda") or data.get("PrecoVenda") or data.get("PreÃ§o Venda"), 4),
+        br_to_decimal(data.get("Prazo Médio") or data.get("PrazoMedio") or data.get("Prazo MÃ©dio"), 2),
+        pct_padrao,
+        validado,
+        preserve.get("ValidadoPor"),
+        preserve.get("ValidadoEm"),
+        _ref_nullable_str(preserve.get("RegraVersao"), 12),
+        _ref_nullable_str(preserve.get("RegraId"), 8),
+    )
+
+
+def _ref_pick_pct(data: dict, pct_comissao: Any, preserve: dict) -> Any:
+    for value in (
+        preserve.get("PercComissao"),
+        pct_comissao,
+        data.get("% Comissão"),
+        data.get("Percentual_Comissao"),
+        data.get("% Percentual Padrão"),
+        data.get("% Percentual PadrÃ£o"),
+        Decimal("0.0000"),
+    ):
+        if value not in (None, ""):
+            return value
+    return Decimal("0.0000")
+
+
+def _ref_nullable_str(value: Any, size: int):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    text = str(value).strip()[:size]
+    return text or None
+
+
+def _ref_date(value):
+    dt = pd.to_datetime(value, dayfirst=True, errors="coerce")
+    return None if pd.isna(dt) else dt.date()
+
+
+# ============================================================
+# Dados aleatórios
+# ============================================================
+
+NUMEROS = [None, "", "1.234,56", "12,5", "0,00", 3, 3.0, 0, "0", 2.5, Decimal("7.1250"), float("nan")]
+DATAS = [None, "", "01/02/2024", "2024-02-01", "31/12/2023", pd.Timestamp("2024-03-05"), "xx"]
+TEXTOS = [None, "", "x", "yy", "Cliente com nome comprido " * 12]
+COLUNAS = {
+    "ID": [1, "2", 0, "", 123456],
+    "Cliente": TEXTOS, "Artigo": TEXTOS, "Linha": TEXTOS, "UF": [None, "", "SP", "MGX"],
+    "Recebimento": DATAS, "DataRecebimentoISO": [None, "", "2024-02-01", "2023-12-31", "xx"],
+    "Emissão": DATAS, "Emissao": DATAS, "EmissÃ£o": DATAS, "Vencimento": DATAS,
+    "VendedorID": [None, "", 0, "12", 12.0, "1.234"],
+    "Vendedor": TEXTOS, "Titulo": TEXTOS, "Observação": TEXTOS, "Observacao": TEXTOS,
+    "M Pagamento": TEXTOS, "MeioPagamento": TEXTOS,
+    "Recebido": NUMEROS, "ICMSST": NUMEROS, "Frete": NUMEROS,
+    "% Comissão": NUMEROS, "Percentual_Comissao": NUMEROS, "% Percentual Padrão": NUMEROS,
+    "% Percentual PadrÃ£o": NUMEROS,
+    "Preço Médio": NUMEROS, "PrecoMedio": NUMEROS, "PreÃ§o MÃ©dio": NUMEROS,
+    "Preço Venda": NUMEROS, "PrecoVenda": NUMEROS, "PreÃ§o Venda": NUMEROS,
+    "Prazo Médio": NUMEROS, "PrazoMedio": NUMEROS, "Prazo MÃ©dio": NUMEROS,
+}
+PRESERVES = [
+    None, {},
+    {"PercComissao": "7,5", "Validado": "sim", "ValidadoPor": "karen", "ValidadoEm": "2024-01-02"},
+    {"Observacao": "mantida", "Validado": 1, "RegraVersao": "4f53cda18c2b", "RegraId": "a1b2c3d4"},
+    {"RegraVersao": float("nan"), "RegraId": "  "},
+]
+PCTS = [None, "", "2,5", 4, Decimal("1.5")]
+
+
+def _frame(rnd: random.Random) -> pd.DataFrame:
+    presentes = [c for c in COLUNAS if rnd.random() < 0.6]
+    linhas = [{c: rnd.choice(COLUNAS[c]) for c in presentes} for _ in range(LINHAS)]
+    return pd.DataFrame(linhas, columns=presentes)
+
+
+def _iguais(a: tuple, b: tuple) -> bool:
+    return len(a) == len(b) and all(x == y or (x != x and y != y) for x, y in zip(a, b))
+
+
+def main_check() -> int:
+    # datas inválidas/ambíguas de propósito: o aviso do pandas sai igual nos dois lados
+    warnings.simplefilter("ignore", UserWarning)
+    rnd = random.Random(45)
+    falhas = 0
+    comparadas = 0
+
+    for rodada in range(RODADAS):
+        df = _frame(rnd)
+        pct = rnd.choice([rnd.choice(PCTS), [rnd.choice(PCTS) for _ in range(LINHAS)]])
+        preserve = rnd.choice([rnd.choice(PRESERVES), [rnd.choice(PRESERVES) for _ in range(LINHAS)]])
+        obs = rnd.choice([None, "", "obs do lote"])
+
+        def por_linha(valor, i):
+            return valor[i] if isinstance(valor, list) else valor
+
+        try:
+            esperado = [
+                _ref_params(row, pct_comissao=por_linha(pct, i), observacao=obs, preserve=por_linha(preserve, i))
+                for i, row in enumerate(df.to_dict("records"))
+            ]
+        except Exception as e:
+            # linha inválida: o builder por frame também tem que recusar o lote
+            try:
+                build_extrato_insert_params_frame(df, pct_comissao=pct, observacao=obs, preserve=preserve)
+            except Exception:
+                continue
+            print(f"FALHOU rodada {rodada}: referência levantou {e!r}, frame não")
+            falhas += 1
+            continue
+
+        obtido = build_extrato_insert_params_frame(df, pct_comissao=pct, observacao=obs, preserve=preserve)
+        if len(obtido) != len(esperado):
+            print(f"FALHOU rodada {rodada}: {len(obtido)} tuplas, esperado {len(esperado)}")
+            falhas += 1
+            continue
+        for i, (exp, obt) in enumerate(zip(esperado, obtido)):
+            comparadas += 1
+            if not _iguais(exp, obt):
+                if falhas < 5:
+                    difs = [(k, a, b) for k, (a, b) in enumerate(zip(exp, obt)) if not _iguais((a,), (b,))]
+                    print(f"FALHOU rodada {rodada} linha {i}: (posição, esperado, obtido) {difs}")
+                falhas += 1
+            # o builder de uma linha usa o mesmo núcleo
+            row = df.iloc[i].to_dict()
+            um = build_extrato_insert_params(
+                row, pct_comissao=por_linha(pct, i), observacao=obs, preserve=por_linha(preserve, i)
+            )
+            if not _iguais(exp, um):
+                print(f"FALHOU rodada {rodada} linha {i}: build_extrato_insert_params difere da referência")
+                falhas += 1
+
+    if falhas:
+        print(f"FALHOU: {falhas} diferença(s)")
+        return 1
+    print(f"OK: {comparadas} linha(s) iguais à referência em {RODADAS} frames")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_check())
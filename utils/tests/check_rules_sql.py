@@ -0,0 +1,173 @@
+"""
+Regressão do UPDATE set-based das regras (rules/rules_sql.py).
+
+    python utils/tests/check_rules_sql.py
+    python utils/tests/check_rules_sql.py --db 2024-01-01 2024-01-31
+
+Sem argumentos monta o SQL de um conjunto pequeno de regras (prioridades
+fora de ordem, regra desabilitada, set + add, stop_on_match desligado,
+"in" com lista e com texto, tipo incompatível) e confere que o número de
+parâmetros é o número de "?" — no lote e em cada passo — e que os
+parâmetros saem na ordem dos marcadores: @versao, passos por prioridade
+(condições, set, add, RegraId, nome, nota), datas, vendedor, versão.
+
+Com --db roda o UPDATE numa base de teste (DBConfig/variáveis SQL*), dentro
+de uma transação que é desfeita no fim, e compara cada linha do período
+com apply_rules_to_row: % final, motivo e RegraId. Não rode contra a base
+de produção: o UPDATE trava as linhas do período até o rollback.
+"""
+import sys
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from rules.rules_engine import Condition, Rule, _apply_sorted, sort_rules
+from rules.rules_sql import RULE_FIELD_COLUMNS, _rule_step_sql, build_rules_update_sql
+
+VERSAO = "4f53cda18c2b"
+DATA_INI = date(2024, 1, 1)
+DATA_FIM = date(2024, 1, 31)
+
+REGRAS = [
+    Rule(
+        name="Base SP", priority=1, id="aaaa0001", set_percentual=2.5, stop_on_match=False,
+        conditions=[Condition("UF", "in", ["SP", "RJ", " mg"])],  # " mg" não normalizado: fica fora
+    ),
+    Rule(
+        name="Prazo longo", priority=5, id="aaaa0002", add_percentual=-0.5, stop_on_match=False,
+        note="prazo > 60", conditions=[Condition("Prazo Médio", ">", 60)],
+    ),
+    Rule(
+        name="Desligada", priority=9, id="aaaa0003", enabled=False, set_percentual=9,
+        conditions=[Condition("UF", "==", "SP")],
+    ),
+    Rule(
+        name="Grande cliente", priority=3, id="aaaa0004", set_percentual=3, add_percentual=0.25,
+        conditions=[Condition("Recebido", ">=", 1000), Condition("Vendedor", "!=", " fulano ")],
+    ),
+    Rule(
+        name="Linha no texto", priority=3, id="aaaa0005", set_percentual=1,
+        conditions=[Condition("Linha", "in", "malhas, tecidos"), Condition("Frete", "==", "x")],
+    ),
+    Rule(name="Sem condição", priority=0, id="", add_percentual=0.1),
+]
+
+# parâmetros esperados de cada regra, na ordem de avaliação (prioridade desc, estável)
+PASSOS_ESPERADOS = [
+    ("Prazo longo", [60, -0.5, "aaaa0002", "Prazo longo", " prazo > 60"]),
+    ("Grande cliente", [1000, "FULANO", 3.0, 0.25, "aaaa0004", "Grande cliente", ""]),
+    # "in" com texto: o valor da regra vai normalizado; Frete == "x" é incompatível (constante)
+    ("Linha no texto", ["MALHAS, TECIDOS", 1.0, "aaaa0005", "Linha no texto", ""]),
+    ("Base SP", ["SP", "RJ", 2.5, "aaaa0001", "Base SP", ""]),
+    ("Sem condição", [0.1, None, "Sem condição", ""]),
+]
+
+
+def _conferir_sql(falhas: List[str]) -> None:
+    ordenadas = sort_rules(REGRAS)
+    nomes = [r.name for r in ordenadas]
+    if nomes != [n for n, _ in PASSOS_ESPERADOS]:
+        falhas.append(f"ordem das regras {nomes}")
+        return
+
+    passos: List[Any] = []
+    for i, (rule, (nome, esperado)) in enumerate(zip(ordenadas, PASSOS_ESPERADOS), 1):
+        sql, params = _rule_step_sql(i, rule)
+        if sql.count("?") != len(params):
+            falhas.append(f"passo {i} ({nome}): {sql.count('?')} '?' e {len(params)} parâmetro(s)")
+        if params != esperado:
+            falhas.append(f"passo {i} ({nome}): parâmetros {params!r}, esperado {esperado!r}")
+        passos.extend(esperado)
+
+    for vendedor in (None, "FULANO"):
+        for somente in (False, True):
+            sql, params = build_rules_update_sql(
+                REGRAS, DATA_INI, DATA_FIM, vendedor, versao=VERSAO, somente_desatualizadas=somente,
+            )
+            caso = f"vendedor={vendedor!r} somente_desatualizadas={somente}"
+            if sql.count("?") != len(params):
+                falhas.append(f"{caso}: {sql.count('?')} '?' e {len(params)} parâmetro(s)")
+
+            escopo = [DATA_INI, DATA_FIM] + ([vendedor] if vendedor else []) + ([VERSAO] if somente else [])
+            esperado = [VERSAO] + passos + escopo
+            if params != esperado:
+                falhas.append(f"{caso}: parâmetros fora de ordem\n  {params!r}\n  {esperado!r}")
+
+            # @versao é o primeiro marcador; o escopo fica todo depois do último passo
+            primeiro = sql.index("?")
+            if "DECLARE @versao" not in sql[sql.rfind("\n", 0, primeiro):primeiro]:
+                falhas.append(f"{caso}: primeiro '?' não é o @versao")
+            where = sql[sql.rindex("WHERE E.Consolidado"):]
+            if where.count("?") != len(escopo):
+                falhas.append(f"{caso}: WHERE com {where.count('?')} '?', esperado {len(escopo)}")
+
+
+def _conferir_banco(data_ini: date, data_fim: date, falhas: List[str]) -> int:
+    from config import DBConfig, get_conn
+
+    campos = ", ".join(f"{expr} AS [{campo}]" for campo, (_, expr) in RULE_FIELD_COLUMNS.items())
+    ordenadas = sort_rules(REGRAS)
+    with get_conn(DBConfig()) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                f"SELECT E.Id, {campos} FROM dbo.Stik_Extrato_Comissoes E "
+                "WHERE E.Consolidado = 0 AND E.DataRecebimento BETWEEN ? AND ?",
+                data_ini, data_fim,
+            )
+            cols = [d[0] for d in cur.description]
+            linhas: Dict[int, Dict[str, Any]] = {r[0]: dict(zip(cols, r)) for r in cur.fetchall()}
+
+            sql, params = build_rules_update_sql(REGRAS, data_ini, data_fim, versao=VERSAO)
+            cur.execute(sql, params)
+            while cur.description is None and cur.nextset():
+                pass
+            cols = [d[0] for d in cur.description] if cur.description else []
+            servidor = {r[0]: dict(zip(cols, r)) for r in (cur.fetchall() if cols else [])}
+        finally:
+            conn.rollback()
+
+    for id_, row in linhas.items():
+        pct, motivo, regra = _apply_sorted(row, ordenadas)
+        s = servidor.get(id_)
+        if not motivo:
+            if s is not None:
+                falhas.append(f"Id {id_}: servidor aplicou {s['Motivo']!r}, engine não")
+            continue
+        if s is None:
+            falhas.append(f"Id {id_}: engine aplicou {motivo!r}, servidor não")
+        elif round(float(s["PctDepois"]), 4) != round(pct, 4) or s["Motivo"] != motivo or s["RegraId"] != regra:
+            falhas.append(
+                f"Id {id_}: servidor ({s['PctDepois']}, {s['Motivo']!r}, {s['RegraId']}) "
+                f"engine ({pct:.4f}, {motivo!r}, {regra})"
+            )
+    return len(linhas)
+
+
+def main_check(argv: List[str]) -> int:
+    falhas: List[str] = []
+    _conferir_sql(falhas)
+
+    comparadas = None
+    if argv[:1] == ["--db"]:
+        if len(argv) != 3:
+            print("uso: check_rules_sql.py --db AAAA-MM-DD AAAA-MM-DD")
+            return 2
+        comparadas = _conferir_banco(date.fromisoformat(argv[1]), date.fromisoformat(argv[2]), falhas)
+
+    if falhas:
+        for f in falhas[:20]:
+            print("FALHOU:", f)
+        print(f"FALHOU: {len(falhas)} diferença(s)")
+        return 1
+    msg = "OK: parâmetros batem com os '?' e com a ordem dos passos"
+    if comparadas is not None:
+        msg += f"; {comparadas} linha(s) iguais ao apply_rules_to_row"
+    print(msg)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_check(sys.argv[1:]))
@@ -0,0 +1,47 @@
+"""
+Regressão da inicialização: o login tem que aparecer sem PDF/e-mail carregados.
+
+    python utils/tests/check_startup_imports.py
+
+Sobe o QApplication + LoginDialog como o main.py faz e confere sys.modules.
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtWidgets import QApplication
+
+import main  # noqa: F401  (mesmos imports de topo do app)
+from ui import LoginDialog
+from ui.themes import ThemeManager
+
+PROIBIDOS = ("reportlab", "smtplib", "utils.pdf_generator", "utils.email_sender")
+# não quebram o login, mas não deveriam vir antes dele
+EVITAR = ("pandas", "pyodbc", "models", "tabs.tab_extrato")
+
+
+def main_check() -> int:
+    app = QApplication(sys.argv)
+    ThemeManager.set_theme(app, "dark")
+    dlg = LoginDialog()
+    dlg.show()
+    app.processEvents()
+
+    carregados = [m for m in PROIBIDOS if m in sys.modules]
+    avisos = [m for m in EVITAR if m in sys.modules]
+    dlg.close()
+
+    if avisos:
+        print("AVISO: carregados antes do login:", ", ".join(avisos))
+    if carregados:
+        print("FALHOU: login apareceu com", ", ".join(carregados), "já importados")
+        return 1
+    print("OK: login sem reportlab/smtplib")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_check())
@@ -0,0 +1,260 @@
+"""
+Fila local de gravações do extrato (SQLite), para a tela não esperar o banco.
+
+Salvar edições, validar e remover do extrato viram operações gravadas na
+fila local (durável: sobrevive a queda do app) e são aplicadas no servidor
+em segundo plano, na ordem em que entraram. Cada operação tem uma chave de
+idempotência: o servidor registra a chave na mesma transação da operação
+(dbo.Stik_Fila_Aplicadas) e, se a mesma chave chegar de novo (commit feito,
+resposta perdida), devolve o resultado registrado em vez de aplicar outra vez.
+
+Edições em cima de edições ainda na fila: a edição guarda a Versao lida da
+linha; quando a edição anterior é aplicada, a fila anota base -> nova versão
+da linha (tabela `rebase`) e a seguinte é comparada com a versão nova, em vez
+de dar conflito com a gravação do próprio usuário.
+
+Sem Qt aqui: quem roda a fila em thread é ui.write_queue_runner.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from rules.rules_versions import store_snapshot
+from utils.bulk_ops import remover_do_extrato, validar_extrato
+from utils.extrato_reader import fetch_extrato_ids
+from utils.extrato_writer import salvar_edicoes_extrato
+
+TIPOS = ("edicao", "validar", "remover")
+
+# SQLSTATE de erro que passa sozinho (conexão, timeout, deadlock): tenta de novo depois
+_SQLSTATE_TRANSITORIO = ("08", "HYT", "40001")
+
+_FILA_SQL = """
+CREATE TABLE IF NOT EXISTS fila (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    chave TEXT NOT NULL UNIQUE,
+    tipo TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    usuario TEXT,
+    criado_em REAL NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendente',
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    erro TEXT
+);
+CREATE TABLE IF NOT EXISTS rebase (
+    extrato_id INTEGER NOT NULL,
+    base INTEGER NOT NULL,
+    nova INTEGER NOT NULL,
+    PRIMARY KEY (extrato_id, base)
+);
+"""
+
+
+@dataclass
+class Operacao:
+    seq: int
+    chave: str
+    tipo: str
+    payload: Dict[str, Any]
+    usuario: Optional[str]
+    tentativas: int
+
+
+class FilaGravacao:
+    """
+    A fila em si (um arquivo SQLite por usuário). Cada método abre a própria
+    conexão, então a thread da UI e a da fila podem usar o mesmo objeto.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        with self._conn() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_FILA_SQL)
+
+    def _conn(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.caminho, timeout=10)
+
+    def enfileirar(self, tipo: str, payload: Dict[str, Any], usuario: Optional[str] = None) -> str:
+        if tipo not in TIPOS:
+            raise ValueError(f"tipo de operação desconhecido: {tipo}")
+        chave = str(uuid.uuid4())
+        with self._conn() as db:
+            db.execute(
+                "INSERT INTO fila (chave, tipo, payload, usuario, criado_em) VALUES (?, ?, ?, ?, ?)",
+                (chave, tipo, json.dumps(payload, default=_json_default), usuario, time.time()),
+            )
+        return chave
+
+    def proximas(self, limite: int) -> List[Operacao]:
+        """Pendentes mais antigas primeiro (ordem de entrada)."""
+        with self._conn() as db:
+            linhas = db.execute(
+                "SELECT seq, chave, tipo, payload, usuario, tentativas FROM fila"
+                " WHERE estado = 'pendente' ORDER BY seq LIMIT ?",
+                (limite,),
+            ).fetchall()
+        return [Operacao(s, c, t, json.loads(p), u, n) for s, c, t, p, u, n in linhas]
+
+    def concluir(self, op: Operacao, rebases: List[Tuple[int, int, int]] = ()) -> None:
+        """Tira a operação aplicada da fila e anota as versões novas das linhas editadas."""
+        with self._conn() as db:
+            db.execute("DELETE FROM fila WHERE chave = ?", (op.chave,))
+            db.executemany("INSERT OR REPLACE INTO rebase (extrato_id, base, nova) VALUES (?, ?, ?)", rebases)
+            # com falha ainda na fila, o rebase continua: elas guardam a versão base antiga
+            if db.execute("SELECT COUNT(*) FROM fila").fetchone()[0] == 0:
+                db.execute("DELETE FROM rebase")
+
+    def adiar(self, op: Operacao, erro: str) -> None:
+        """Erro transitório: continua pendente, com a tentativa contada."""
+        with self._conn() as db:
+            db.execute("UPDATE fila SET tentativas = tentativas + 1, erro = ? WHERE chave = ?", (erro, op.chave))
+
+    def falhar(self, op: Operacao, erro: str) -> None:
+        """Erro definitivo: sai da ordem de envio até alguém reenviar ou descartar."""
+        with self._conn() as db:
+            db.execute(
+                "UPDATE fila SET estado = 'falhou', tentativas = tentativas + 1, erro = ? WHERE chave = ?",
+                (erro, op.chave),
+            )
+
+    def reenviar_falhas(self) -> int:
+        with self._conn() as db:
+            return db.execute("UPDATE fila SET estado = 'pendente', erro = NULL WHERE estado = 'falhou'").rowcount
+
+    def descartar_falhas(self) -> set:
+        """Tira da fila as que falharam. Devolve os Ids do extrato que elas tocavam."""
+        ids = self.ids_na_fila(estados=("falhou",), tipos=TIPOS)
+        with self._conn() as db:
+            db.execute("DELETE FROM fila WHERE estado = 'falhou'")
+            if db.execute("SELECT COUNT(*) FROM fila").fetchone()[0] == 0:
+                db.execute("DELETE FROM rebase")
+        return ids
+
+    def falhas(self) -> List[Tuple[str, str, str]]:
+        """[(tipo, erro, chave)] das que falharam."""
+        with self._conn() as db:
+            return db.execute("SELECT tipo, erro, chave FROM fila WHERE estado = 'falhou' ORDER BY seq").fetchall()
+
+    def contagem(self) -> Tuple[int, int]:
+        """(pendentes, com falha)."""
+        with self._conn() as db:
+            linhas = dict(db.execute("SELECT estado, COUNT(*) FROM fila GROUP BY estado").fetchall())
+        return linhas.get("pendente", 0), linhas.get("falhou", 0)
+
+    def ids_na_fila(self, estados=("pendente",), tipos=("edicao",)) -> set:
+        """
+        Ids do extrato tocados pelas operações da fila nos estados/tipos dados.
+        Por padrão só edições pendentes: as que falharam não vão ser gravadas
+        sem o usuário reenviar, então a grade pode mostrar o que está no banco.
+        """
+        ids = set()
+        marcas_e = ", ".join("?" * len(estados))
+        marcas_t = ", ".join("?" * len(tipos))
+        with self._conn() as db:
+            for (payload,) in db.execute(
+                f"SELECT payload FROM fila WHERE estado IN ({marcas_e}) AND tipo IN ({marcas_t})",
+                (*estados, *tipos),
+            ):
+                dados = json.loads(payload)
+                ids.update(int(e[0]) for e in dados.get("edicoes", ()))
+                ids.update(int(i) for i in dados.get("ids", ()))
+        return ids
+
+    def versao_rebase(self, extrato_id: int, versao: Optional[int]) -> Optional[int]:
+        """Segue base -> nova enquanto houver gravação anterior da fila na linha."""
+        if versao is None:
+            return None
+        with self._conn() as db:
+            vistos = set()
+            while versao not in vistos:
+                vistos.add(versao)
+                linha = db.execute(
+                    "SELECT nova FROM rebase WHERE extrato_id = ? AND base = ?", (extrato_id, versao)
+                ).fetchone()
+                if linha is None:
+                    break
+                versao = int(linha[0])
+        return versao
+
+
+def _json_default(v: Any):
+    if isinstance(v, Decimal):
+        return str(v)
+    if hasattr(v, "isoformat"):
+        return v.isoformat()
+    raise TypeError(f"não serializável: {type(v).__name__}")
+
+
+def erro_transitorio(e: BaseException) -> bool:
+    """Erro de conexão/timeout/deadlock (pyodbc: SQLSTATE em args[0])."""
+    estado = str(e.args[0]) if getattr(e, "args", None) else ""
+    return estado.startswith(_SQLSTATE_TRANSITORIO)
+
+
+def edicoes_para_fila(edicoes: List[tuple]) -> List[list]:
+    """Tuplas de salvar_edicoes_extrato -> JSON (Decimal vira texto, sem perder casas)."""
+    return [[dbid, str(pct), str(val), obs, rv, rid, versao] for dbid, pct, val, obs, rv, rid, versao in edicoes]
+
+
+def _edicoes_da_fila(itens: List[list], rebase: Callable[[int, Optional[int]], Optional[int]]) -> List[tuple]:
+    return [
+        (int(dbid), Decimal(pct), Decimal(val), obs, rv, rid, rebase(int(dbid), versao))
+        for dbid, pct, val, obs, rv, rid, versao in itens
+    ]
+
+
+APLICADAS_SELECT_SQL = "SELECT Resultado FROM dbo.Stik_Fila_Aplicadas WHERE Chave = ?"
+APLICADAS_INSERT_SQL = (
+    "INSERT INTO dbo.Stik_Fila_Aplicadas (Chave, Tipo, Usuario, Resultado) VALUES (?, ?, ?, ?)"
+)
+
+
+def aplicar_operacao(cur, op: Operacao, fila: FilaGravacao) -> Tuple[Dict[str, Any], List[Tuple[int, int, int]]]:
+    """
+    Aplica uma operação no cursor (sem commit). Devolve (resultado, rebases).
+    Se a chave já tinha sido aplicada, devolve o resultado registrado.
+    """
+    edicoes = _edicoes_da_fila(op.payload["edicoes"], fila.versao_rebase) if op.tipo == "edicao" else []
+
+    cur.execute(APLICADAS_SELECT_SQL, op.chave)
+    ja = cur.fetchone()
+    if ja is not None:
+        resultado = json.loads(ja[0])
+    elif op.tipo == "edicao":
+        # snapshots das versões de regra das linhas: na mesma transação, para outra máquina achar os nomes
+        for snapshot in op.payload.get("snapshots", ()):
+            store_snapshot(cur, snapshot)
+        gravados, nao_gravados = salvar_edicoes_extrato(cur, edicoes, forcar=bool(op.payload.get("forcar")))
+        # não gravadas: mudaram no banco depois da leitura (conflito) ou foram apagadas
+        existem = fetch_extrato_ids(cur, nao_gravados) if nao_gravados else None
+        conflitos = sorted({int(i) for i in existem["DBId"]}) if existem is not None else []
+        resultado = {
+            "gravados": sorted([i, v] for i, v in gravados.items()),
+            "conflitos": conflitos,
+            "sumidos": sorted(nao_gravados - set(conflitos)),
+        }
+    elif op.tipo == "validar":
+        resultado = {
+            "validados": [
+                [i, em.isoformat() if hasattr(em, "isoformat") else em, v]
+                for i, em, v in validar_extrato(cur, op.payload["ids"], op.usuario or "")
+            ]
+        }
+    elif op.tipo == "remover":
+        resultado = {"apagados": remover_do_extrato(cur, op.payload["ids"])}
+    else:
+        raise ValueError(f"tipo de operação desconhecido: {op.tipo}")
+
+    if ja is None:
+        cur.execute(APLICADAS_INSERT_SQL, op.chave, op.tipo, op.usuario, json.dumps(resultado))
+
+    novas = dict(resultado.get("gravados", ()))
+    rebases = [(e[0], e[6], int(novas[e[0]])) for e in edicoes if e[0] in novas and e[6] is not None]
+    return resultado, rebases